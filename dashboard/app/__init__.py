@@ -1,6 +1,4 @@
 import logging
-import queue
-import threading
 import sys
 
 import click
@@ -18,14 +16,18 @@ from flask_jwt_extended import (
 from werkzeug.exceptions import HTTPException
 
 from app.extensions import db, jwt, migrate, sio
-from app.telemetry.session_html import create_cache
+from app.models.session import stored_psst_version
+from app.models.session_data import SessionData
+from app.telemetry.telemetry_cache import telemetry_cache
+from app.utils.cache_generator import start_cache_generators
+from app.utils.file_store import psst_store
+from app.utils.process_pool import process_pool
+from app.utils.reprocessor import start_reprocessors
+from app.utils.stats_backfill import start_stats_backfill
 from app.utils.first_init import first_init
 from app.utils.converters import UuidConverter
 
 
-id_queue = queue.Queue()
-
-
 def _sqlite_pragmas(app: Flask):
     if 'sqlite' in app.config['SQLALCHEMY_DATABASE_URI']:
         def _pragma_on_connect(dbapi_con, con_record):
@@ -45,7 +47,6 @@ def create_app(test_config=None):
     app.config['JWT_COOKIE_SECURE'] = True
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////data/gosst.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['GOSST_HTTP_API'] = 'http://localhost:8080'
 
     if test_config:
         app.config.update(test_config)
@@ -68,6 +69,27 @@ def create_app(test_config=None):
     def init_command():
         first_init()
 
+    @app.cli.command("psst-store-migrate")
+    @click.option('--to-db', is_flag=True,
+                  help="Move payloads from the PSST store to the database.")
+    def psst_store_migrate_command(to_db):
+        count = SessionData.migrate(to_store=not to_db)
+        click.echo(f"moved {count} payloads")
+
+    @app.cli.command("psst-convert")
+    @click.option('--version', type=click.Choice(['1', '2']),
+                  help="PSST version to convert payloads to. Defaults to "
+                       "the PSST_VERSION setting.")
+    def psst_convert_command(version):
+        version = int(version) if version else stored_psst_version()
+        count = SessionData.convert(version)
+        click.echo(f"converted {count} payloads to PSST v{version}")
+
+    @app.cli.command("psst-store-gc")
+    def psst_store_gc_command():
+        count = SessionData.collect_garbage()
+        click.echo(f"removed {count} unreferenced files")
+
     @app.after_request
     def refresh_expiring_jwts(response):
         try:
@@ -93,6 +115,9 @@ def create_app(test_config=None):
     db.init_app(app)
     _sqlite_pragmas(app)
     migrate.init_app(app, db)
+    telemetry_cache.init_app(app)
+    psst_store.init_app(app)
+    process_pool.init_app(app)
 
     # Register blueprints here
     from app.frontend import bp as frontend_bp
@@ -104,21 +129,16 @@ def create_app(test_config=None):
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
-    def html_generator():
-        with app.app_context():
-            app.logger.info("Bokeh HTML generator thread started")
-            while True:
-                try:
-                    id = id_queue.get()
-                    app.logger.info(f"generating cache for session {id}")
-                    create_cache(id, 5, 200)
-                    sio.emit("session_ready")
-                    app.logger.info(f"cache ready for session {id}")
-                except BaseException as e:
-                    app.logger.error(f"cache failed for session {id}: {e}")
-
-    generator_thread = threading.Thread(target=html_generator)
-    generator_thread.daemon = True
-    generator_thread.start()
-
     return app
+
+
+def start_workers(app: Flask):
+    """Starts the background work of a server process.
+
+    Not part of `create_app`, because CLI commands create an app too, and
+    must not recover or claim the jobs of a running server.
+    """
+
+    start_cache_generators(app)
+    start_reprocessors(app)
+    start_stats_backfill(app)
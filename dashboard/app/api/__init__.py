@@ -18,6 +18,9 @@ bp.register_blueprint(linkage_bp, url_prefix='/linkage')
 from app.api.session import bp as session_bp
 bp.register_blueprint(session_bp, url_prefix='/session')
 
+from app.api.reprocess import bp as reprocess_bp
+bp.register_blueprint(reprocess_bp, url_prefix='/reprocess')
+
 from app.api.setup import bp as setup_bp
 bp.register_blueprint(setup_bp, url_prefix='/setup')
 
@@ -7,9 +7,10 @@ from app.api.common import (
     get_entity,
     get_entities,
     delete_entity,
-    put_entity)
+    put_processed_entity)
 from app.api.calibration import bp
 from app.models.calibration import Calibration
+from app.models.reprocess_job import ReprocessJob
 
 
 @bp.route('', methods=['GET'])
@@ -31,4 +32,5 @@ def delete(id: uuid.UUID):
 @bp.route('', methods=['PUT'])
 @jwt_required()
 def put():
-    return put_entity(Calibration, request.json)
+    return put_processed_entity(Calibration, ReprocessJob.CALIBRATION,
+                                request.json)
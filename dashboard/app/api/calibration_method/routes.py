@@ -1,15 +1,17 @@
 import uuid
 
-from flask import request
+from flask import jsonify, request
 from flask_jwt_extended import jwt_required
+from http import HTTPStatus as status
 
 from app.api.common import (
     get_entity,
     get_entities,
     delete_entity,
-    put_entity)
+    put_processed_entity)
 from app.api.calibration_method import bp
-from app.models.calibration import CalibrationMethod
+from app.models.calibration import CalibrationMethod, calibration_programs
+from app.models.reprocess_job import ReprocessJob
 
 
 @bp.route('', methods=['GET'])
@@ -17,6 +19,12 @@ def get_all():
     return get_entities(CalibrationMethod)
 
 
+@bp.route('/program-cache', methods=['GET'])
+@jwt_required()
+def get_program_cache_stats():
+    return jsonify(calibration_programs.stats()), status.OK
+
+
 @bp.route('/<uuid:id>', methods=['GET'])
 def get(id: uuid.UUID):
     return get_entity(CalibrationMethod, id)
@@ -25,10 +33,15 @@ def get(id: uuid.UUID):
 @bp.route('/<uuid:id>', methods=['DELETE'])
 @jwt_required()
 def delete(id: uuid.UUID):
+    calibration_programs.invalidate(id)
     return delete_entity(CalibrationMethod, id)
 
 
 @bp.route('', methods=['PUT'])
 @jwt_required()
 def put():
-    return put_entity(CalibrationMethod, request.json)
+    response, code = put_processed_entity(
+        CalibrationMethod, ReprocessJob.CALIBRATION_METHOD, request.json)
+    if code == status.CREATED:
+        calibration_programs.invalidate(response.json['id'])
+    return response, code
@@ -1,11 +1,21 @@
 import uuid
 
+import msgpack
+import numpy as np
+
 from datetime import datetime
 
-from flask import jsonify
+from flask import Response, jsonify, request
 from http import HTTPStatus as status
 
 from app.extensions import db
+from app.utils.reprocessor import processing_properties, start_reprocessing
+
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Same extension type as float32 arrays in PSST v2.
+FLOAT32_EXT_TYPE = 2
 
 
 def get_entities(klass: type):
@@ -33,3 +43,67 @@ def put_entity(klass: type, json: dict):
     if not id:
         return jsonify(msg=f"Invalid data for {klass.__name__}"), status.BAD_REQUEST
     return jsonify(id=id), status.CREATED
+
+
+def put_processed_entity(klass: type, entity: str, json: dict):
+    """Like `put_entity`, but when an existing linkage, calibration or
+    calibration method changes in a way that affects processing, the
+    sessions recorded with it are reprocessed."""
+
+    try:
+        before = processing_properties(entity, klass.get(uuid.UUID(
+            str(json.get('id')))))
+    except (AttributeError, ValueError):
+        before = None
+    response, code = put_entity(klass, json)
+    if before is not None and code == status.CREATED:
+        id = uuid.UUID(response.json['id'])
+        if processing_properties(entity, klass.get(id)) != before:
+            start_reprocessing(entity, id, if_affected=True)
+    return response, code
+
+
+def _jsonable(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, dict):
+        return {k: _jsonable(v) for k, v in o.items()}
+    if isinstance(o, (list, tuple)):
+        return [_jsonable(v) for v in o]
+    return o
+
+
+def _pack(o):
+    if isinstance(o, np.ndarray):
+        return msgpack.ExtType(FLOAT32_EXT_TYPE,
+                               o.astype('<f4', copy=False).tobytes())
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"cannot serialize {type(o).__name__}")
+
+
+def array_mimetype() -> str:
+    """Returns the format `array_response` sends for the current request."""
+
+    return request.accept_mimetypes.best_match(
+        ('application/json', MSGPACK_MIMETYPE), default='application/json')
+
+
+def array_response(data, code: int = status.OK, mimetype: str = None):
+    """Sends data holding NumPy arrays in the format the client accepts.
+
+    JSON is the default. Clients that accept application/msgpack get a
+    msgpack document instead, where arrays are extension type 2 holding
+    little-endian float32 values. A mimetype overrides the negotiation.
+    """
+
+    if (mimetype or array_mimetype()) == MSGPACK_MIMETYPE:
+        response = Response(msgpack.packb(data, default=_pack),
+                            status=code, mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(_jsonable(data))
+        response.status_code = code
+    response.vary.add('Accept')
+    return response
@@ -7,9 +7,10 @@ from app.api.common import (
     get_entity,
     get_entities,
     delete_entity,
-    put_entity)
+    put_processed_entity)
 from app.api.linkage import bp
 from app.models.linkage import Linkage
+from app.models.reprocess_job import ReprocessJob
 
 
 @bp.route('', methods=['GET'])
@@ -31,4 +32,5 @@ def delete(id: uuid.UUID):
 @bp.route('', methods=['PUT'])
 @jwt_required()
 def put():
-    return put_entity(Linkage, request.json)
+    return put_processed_entity(Linkage, ReprocessJob.LINKAGE,
+                                request.json)
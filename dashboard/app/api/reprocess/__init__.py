@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+bp = Blueprint('reprocess', __name__)
+
+from app.api.reprocess import routes
@@ -0,0 +1,56 @@
+import uuid
+
+from flask import jsonify, request
+from flask_jwt_extended import jwt_required
+from http import HTTPStatus as status
+
+from app.api.reprocess import bp
+from app.extensions import db
+from app.models.calibration import Calibration, CalibrationMethod
+from app.models.linkage import Linkage
+from app.models.reprocess_job import ReprocessJob
+from app.utils.reprocessor import start_reprocessing
+
+
+_entities = {
+    ReprocessJob.LINKAGE: Linkage,
+    ReprocessJob.CALIBRATION: Calibration,
+    ReprocessJob.CALIBRATION_METHOD: CalibrationMethod,
+}
+
+
+@bp.route('', methods=['GET'])
+@jwt_required()
+def get_all():
+    jobs = db.session.execute(
+        db.select(ReprocessJob).order_by(ReprocessJob.created.desc())
+    ).scalars()
+    return jsonify(list(jobs)), status.OK
+
+
+@bp.route('/<uuid:id>', methods=['GET'])
+@jwt_required()
+def get(id: uuid.UUID):
+    job = db.session.get(ReprocessJob, id)
+    if not job:
+        return jsonify(msg="Job does not exist!"), status.NOT_FOUND
+    return jsonify(job), status.OK
+
+
+@bp.route('', methods=['PUT'])
+@jwt_required()
+def put():
+    entity = request.json.get('entity')
+    klass = _entities.get(entity)
+    try:
+        id = uuid.UUID(request.json.get('id'))
+    except (TypeError, ValueError):
+        id = None
+    if not klass or not id:
+        return jsonify(msg="Invalid reprocess request"), status.BAD_REQUEST
+    if not klass.get(id):
+        return (jsonify(msg=f"{klass.__name__} does not exist!"),
+                status.NOT_FOUND)
+    job = start_reprocessing(entity, id)
+    return (jsonify(id=job.id, total=job.total, skipped=job.skipped),
+            status.CREATED)
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('session', __name__)
 
-from app.api.session import routes
+from app.api.session import events, routes
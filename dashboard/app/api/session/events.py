@@ -0,0 +1,87 @@
+import threading
+import uuid
+
+from functools import partial
+
+from flask import request
+from flask_socketio import emit
+
+from app.api.session.filtering import (
+    extract_components,
+    extract_range,
+    filter_result,
+    record_count,
+    validate_range
+)
+from app.extensions import sio
+from app.models.session import Session
+from app.telemetry.telemetry_cache import telemetry_cache
+
+
+class Superseded(Exception):
+    pass
+
+
+# The latest filter request of every (client, session) pair.
+_latest = {}
+_lock = threading.Lock()
+
+
+def _checkpoint(key: tuple, token: object):
+    # Yields, so that requests that arrived in the meantime get registered,
+    # then abandons the computation if one of them is newer.
+    sio.sleep(0)
+    if _latest.get(key) is not token:
+        raise Superseded
+
+
+@sio.on('filter')
+def filter(message: dict):
+    """Socket.IO counterpart of GET /api/session/<id>/filter.
+
+    Interactive selections send a request for every intermediate range. A
+    request supersedes the earlier ones of the same client for the same
+    session: those stop at their next checkpoint, and send no result. The
+    result is the JSON document of the HTTP endpoint, sent as binary along
+    with the sequence number of the request.
+    """
+
+    if not isinstance(message, dict):
+        emit('filter_error', dict(msg="Invalid filter request"))
+        return
+    seq = message.get('seq')
+    try:
+        id = uuid.UUID(message['id'])
+        components, sides = extract_components(message)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        # Errors carry the request's id and seq, like results do.
+        emit('filter_error', dict(id=message.get('id'), seq=seq,
+                                  msg="Invalid filter request"))
+        return
+
+    key = (request.sid, id)
+    token = object()
+    with _lock:
+        _latest[key] = token
+    checkpoint = partial(_checkpoint, key, token)
+    try:
+        checkpoint()
+        session = Session.get(id)
+        if not session:
+            emit('filter_error', dict(id=str(id), seq=seq,
+                                      msg="Session does not exist!"))
+            return
+        t = telemetry_cache.get(session)
+        start, end = extract_range(t.SampleRate, message)
+        if not validate_range(start, end, record_count(session, t)):
+            start = None
+            end = None
+        body, _, _ = filter_result(session, t, start, end, components,
+                                   sides, 'application/json', checkpoint)
+    except Superseded:
+        return
+    finally:
+        with _lock:
+            if _latest.get(key) is token:
+                del _latest[key]
+    emit('filter_result', dict(id=str(id), seq=seq, data=body))
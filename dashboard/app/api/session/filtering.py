@@ -0,0 +1,192 @@
+import hashlib
+
+from typing import Callable
+
+from flask import request
+
+from app.api.common import array_response
+from app.extensions import db
+from app.models.session import Session
+from app.models.session_histogram_index import SessionHistogramIndex
+from app.telemetry.balance import update_balance
+from app.telemetry.fft import update_fft
+from app.telemetry.histogram_index import (
+    build_histogram_index,
+    unpack_histogram_index
+)
+from app.telemetry.psst import Strokes, Suspension, Telemetry
+from app.telemetry.telemetry_cache import ResultCache, telemetry_cache
+from app.telemetry.travel import update_travel_histogram
+from app.telemetry.velocity import (
+    update_velocity_band_stats,
+    update_velocity_histogram
+)
+
+
+FILTER_COMPONENTS = ('thist', 'vhist', 'vbands', 'fft', 'balance')
+FILTER_SIDES = ('front', 'rear')
+# Filter results kept per session, see filter_result.
+FILTER_RESULTS_PER_SESSION = 32
+
+
+def _filter_strokes(strokes: Strokes, start: int, end: int) -> (
+                    Strokes, tuple):
+    # Returns views of the strokes inside the range, along with the row
+    # ranges, so that the lookup can be reused by the histogram index.
+    rows = strokes.search(start, end)
+    return strokes.slice(rows), rows
+
+
+def extract_range(sample_rate: int, args: dict = None) -> (int, int):
+    args = request.args if args is None else args
+    try:
+        start = args.get('start')
+        start = int(float(start) * sample_rate)
+    except BaseException:
+        start = None
+    try:
+        end = args.get('end')
+        end = int(float(end) * sample_rate)
+    except BaseException:
+        end = None
+    return start, end
+
+
+def validate_range(start: int, end: int, count: int) -> bool:
+    return (start is not None and end is not None and
+            start >= 0 and end < count and start < end)
+
+
+def _histogram_index(session: Session) -> dict:
+    # The index is stored when the payload is written. Sessions written
+    # before that get one built in memory; reads never write the database.
+    def load(telemetry: Telemetry) -> dict:
+        shi = db.session.get(SessionHistogramIndex, session.id)
+        if shi:
+            return unpack_histogram_index(shi.data)
+        return build_histogram_index(telemetry)
+    return telemetry_cache.get_derived(session, 'histogram_index', load)
+
+
+def _suspension_data(strokes: Strokes, suspension: Suspension,
+                     histograms: tuple, start: int, end: int, tick: float,
+                     components: set[str]) -> dict:
+    travel_hist, velocity_hist, fine_velocity_hist = histograms
+    data = {}
+    if 'thist' in components:
+        data['thist'] = update_travel_histogram(
+            strokes, suspension.TravelBins, travel_hist)
+    if 'vhist' in components:
+        data['vhist'] = update_velocity_histogram(
+            strokes,
+            suspension.Velocity,
+            suspension.TravelBins,
+            suspension.VelocityBins,
+            suspension.FineVelocityBins,
+            200,
+            velocity_hist,
+            fine_velocity_hist
+        )
+    if 'vbands' in components:
+        data['vbands'] = update_velocity_band_stats(
+            strokes,
+            suspension.Velocity,
+            200
+        )
+    if 'balance' in components:
+        # Balance is computed from both suspensions, and sent on the top
+        # level. The per-suspension key is only kept for older clients.
+        data['balance'] = None
+    if 'fft' in components:
+        data['fft'] = update_fft(suspension.Travel[start:end], tick)
+    return data
+
+
+def filter_index(session: Session, components: set[str]) -> dict:
+    # The histogram index is only needed (and built) for histograms.
+    if 'thist' in components or 'vhist' in components:
+        return _histogram_index(session)
+    return None
+
+
+def record_count(session: Session, t: Telemetry) -> int:
+    if session.record_count is not None:
+        return session.record_count
+    return len(t.Front.Travel if t.Front.Present else t.Rear.Travel)
+
+
+def _no_checkpoint():
+    pass
+
+
+def filter_data(t: Telemetry, index: dict, start: int, end: int,
+                components: set[str], sides: set[str],
+                checkpoint: Callable[[], None] = _no_checkpoint) -> dict:
+    # The checkpoint is called between the expensive steps, it can abandon
+    # the computation by raising.
+    data = {'front': None, 'rear': None}
+    strokes = {}
+    tick = 1.0 / t.SampleRate
+    for side, suspension in (('front', t.Front), ('rear', t.Rear)):
+        if side not in sides or not suspension.Present:
+            continue
+        checkpoint()
+        strokes[side], rows = _filter_strokes(suspension.Strokes, start, end)
+        histograms = (index[side].histograms(suspension.Strokes, rows)
+                      if index else (None, None, None))
+        data[side] = _suspension_data(strokes[side], suspension, histograms,
+                                      start, end, tick, components)
+    if 'balance' in components and len(strokes) == 2:
+        checkpoint()
+        data['balance'] = dict(
+            compression=update_balance(
+                strokes['front'].Compressions,
+                strokes['rear'].Compressions,
+                t.Linkage.MaxFrontTravel,
+                t.Linkage.MaxRearTravel
+            ),
+            rebound=update_balance(
+                strokes['front'].Rebounds,
+                strokes['rear'].Rebounds,
+                t.Linkage.MaxFrontTravel,
+                t.Linkage.MaxRearTravel
+            ),
+        )
+    return data
+
+
+def filter_result(session: Session, t: Telemetry, start: int, end: int,
+                  components: set[str], sides: set[str], mimetype: str,
+                  checkpoint: Callable[[], None] = _no_checkpoint) -> (
+                  bytes, str, str):
+    # Encoded results are kept along with the session's telemetry, so they
+    # are dropped when the session or its payload changes. The range is
+    # already in samples, so requests for the same samples share results.
+    key = (start, end, frozenset(components), frozenset(sides), mimetype)
+    results = telemetry_cache.get_derived(
+        session, 'filter',
+        lambda _: ResultCache(FILTER_RESULTS_PER_SESSION))
+    result = results.get(key)
+    if result is None:
+        index = filter_index(session, components)
+        response = array_response(
+            filter_data(t, index, start, end, components, sides, checkpoint),
+            mimetype=mimetype)
+        body = response.get_data()
+        result = (body, response.mimetype, hashlib.sha256(body).hexdigest())
+        results.put(key, result)
+    return result
+
+
+def extract_components(args: dict = None) -> (set[str], set[str]):
+    # Everything is computed for both suspensions, unless asked otherwise.
+    args = request.args if args is None else args
+    components = args.get('components')
+    components = (set(components.split(',')) if components
+                  else set(FILTER_COMPONENTS))
+    side = args.get('side')
+    sides = {side} if side else set(FILTER_SIDES)
+    if not (components <= set(FILTER_COMPONENTS) and
+            sides <= set(FILTER_SIDES)):
+        raise ValueError
+    return components, sides
@@ -1,13 +1,12 @@
+import base64
 import json
-import msgpack
-import requests
 import uuid
 
 from bokeh import __version__ as bokeh_version
 from io import BytesIO
 from http import HTTPStatus as status
 
-from flask import current_app, jsonify, request, send_file
+from flask import Response, jsonify, request, send_file
 from flask_jwt_extended import (
     jwt_required,
     verify_jwt_in_request,
@@ -15,94 +14,162 @@ from flask_jwt_extended import (
 )
 from markupsafe import Markup
 
-from app import id_queue
 from app.api.common import (
+    array_mimetype,
+    array_response,
     get_entity,
     delete_entity)
 from app.api.session import bp
+from app.api.session.filtering import (
+    extract_components,
+    extract_range,
+    filter_data,
+    filter_index,
+    filter_result,
+    record_count,
+    validate_range
+)
 from app.extensions import db
-from app.models.session import Session
+from app.models.cache_job import CacheJob
+from app.models.linkage import Linkage
+from app.models.session import (
+    Session,
+    psst_payload,
+    psst_properties,
+    stored_psst_version
+)
+from app.models.session_data import SessionData
+from app.models.session_histogram_index import SessionHistogramIndex
 from app.models.session_html import SessionHtml
+from app.models.session_raw import SessionRaw
+from app.models.session_stats import SessionStats
+from app.models.setup import Setup
 from app.models.track import Track
-from app.telemetry.balance import update_balance
-from app.telemetry.fft import update_fft
+from app.telemetry.downsample import build_trace_pyramid, trace_data
 from app.telemetry.map import gpx_to_dict, track_data
+from app.telemetry.processing import (
+    NORMALIZED_VERSION,
+    Meta,
+    fraction_calibrator,
+    linkage_from_model,
+    process_recording,
+    raw_from_normalized,
+    raw_from_sst,
+    setup_data
+)
 from app.telemetry.psst import (
-    Suspension,
-    Strokes,
+    PSST_VERSION_1,
+    PSST_VERSIONS,
     Telemetry,
-    dataclass_from_dict
+    convert_psst,
+    dataclass_from_dict,
+    psst_from_telemetry,
+    psst_version,
+    telemetry_from_psst
 )
 from app.telemetry.session_html import create_cache
-from app.telemetry.travel import update_travel_histogram
-from app.telemetry.velocity import (
-    update_velocity_band_stats,
-    update_velocity_histogram
-)
+from app.telemetry.telemetry_cache import telemetry_cache
+from app.utils.cache_generator import enqueue_cache_job
+from app.utils.file_store import psst_store
 
 
-def _filter_strokes(strokes: Strokes, start: int, end: int) -> Strokes:
-    if start is None or end is None:
-        return strokes
-    return Strokes(
-        Compressions=[c for c in strokes.Compressions if
-                      c.Start > start and c.End < end],
-        Rebounds=[r for r in strokes.Rebounds if
-                  r.Start > start and r.End < end])
+MAX_FILTER_RANGES = 64
 
 
-def _extract_range(sample_rate: int) -> (int, int):
-    try:
-        start = request.args.get('start')
-        start = int(float(start) * sample_rate)
-    except BaseException:
-        start = None
-    try:
-        end = request.args.get('end')
-        end = int(float(end) * sample_rate)
-    except BaseException:
-        end = None
-    return start, end
+def _ensure_psst_properties(session: Session):
+    # Sessions whose data was not set via the psst setter (or could not be
+    # decoded during the migration) get their derived columns on first use.
+    if session.duration is not None:
+        return
+    properties = psst_properties(telemetry_cache.get(session))
+    db.session.execute(db.update(Session).filter_by(id=session.id).values(
+        updated=session.updated,
+        **properties))
+    db.session.commit()
+    for k, v in properties.items():
+        setattr(session, k, v)
 
 
-def _validate_range(start: int, end: int, count: int) -> bool:
-    return (start is not None and end is not None and
-            start >= 0 and end < count and start < end)
+def _filter_response(session: Session, t: Telemetry, start: int, end: int,
+                     components: set[str], sides: set[str]) -> Response:
+    body, mimetype, etag = filter_result(
+        session, t, start, end, components, sides, array_mimetype())
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    # Cached copies have to be revalidated, the ETag makes that cheap.
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
-def _update_stroke_based(strokes: Strokes, suspension: Suspension):
-    thist = update_travel_histogram(strokes, suspension.TravelBins)
-    vhist = update_velocity_histogram(
-        strokes,
-        suspension.Velocity,
-        suspension.TravelBins,
-        suspension.VelocityBins,
-        suspension.FineVelocityBins,
-        200
-    )
-    vbands = update_velocity_band_stats(
-        strokes,
-        suspension.Velocity,
-        200
-    )
-    return dict(
-        thist=thist,
-        vhist=vhist,
-        vbands=vbands,
-        balance=None
-    )
+def _parse_cursor(cursor: str) -> (int, uuid.UUID):
+    timestamp, id = cursor.split('.')
+    return int(timestamp), uuid.UUID(id)
 
 
 @bp.route('', methods=['GET'])
 def get_all():
-    entities = db.session.execute(Session.select().order_by(
-        Session.timestamp.desc())).scalars()
+    # Sessions are listed newest first. With `limit`, a page is returned, and
+    # the cursor of the next one is sent in the X-Next-Cursor header. The
+    # (timestamp, id) cursor is matched against an index, so fetching a page
+    # does not depend on the number of sessions before it.
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else list(Session.__annotations__)
+    if not set(fields) <= set(Session.__annotations__):
+        return jsonify(msg="Invalid fields"), status.BAD_REQUEST
+    try:
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+        if limit is not None and limit < 1:
+            raise ValueError
+        cursor = request.args.get('cursor')
+        cursor = _parse_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify(msg="Invalid limit or cursor"), status.BAD_REQUEST
+
+    columns = dict.fromkeys(('id', 'timestamp', *fields))
+    query = (db.select(*[getattr(Session, c) for c in columns])
+             .filter(Session.deleted.is_(None))
+             .order_by(Session.timestamp.desc(), Session.id.desc()))
+    if cursor:
+        query = query.filter(
+            db.tuple_(Session.timestamp, Session.id) < db.tuple_(*cursor))
+    if limit:
+        query = query.limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].timestamp}.{rows[-1].id.hex}"
+    entities = [{f: getattr(row, f) for f in fields} for row in rows]
+    response = jsonify(entities)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, status.OK
+
+
+@bp.route('/stats', methods=['GET'])
+def get_stats():
+    try:
+        ids = [uuid.UUID(id) for id in request.args.getlist('id')]
+    except ValueError:
+        return jsonify(msg="Invalid session id"), status.BAD_REQUEST
+    query = (db.select(SessionStats)
+             .join(Session, Session.id == SessionStats.session_id)
+             .filter(Session.deleted.is_(None))
+             .order_by(Session.timestamp.desc()))
+    if ids:
+        query = query.filter(SessionStats.session_id.in_(ids))
+    entities = db.session.execute(query).scalars()
     return jsonify(list(entities)), status.OK
 
 
 @bp.route('/incomplete', methods=['GET'])
 def get_incomplete():
-    query = db.select(Session.id).filter_by(deleted=None, data=None)
+    query = db.select(Session.id).filter(
+        Session.deleted.is_(None),
+        ~db.exists().where(SessionData.session_id == Session.id))
     entities = db.session.execute(query).scalars()
     return jsonify(list(entities)), status.OK
 
@@ -112,7 +179,22 @@ def get_psst(id: uuid.UUID):
     entity = Session.get(id)
     if not entity:
         return jsonify(msg="Session does not exist!"), status.NOT_FOUND
-    data = BytesIO(entity.data)
+    # Version 1 unless asked otherwise, that is what clients can read.
+    version = request.args.get('version', PSST_VERSION_1, type=int)
+    if version not in PSST_VERSIONS:
+        return jsonify(msg="Invalid version"), status.BAD_REQUEST
+    stored = entity.data
+    if stored and psst_version(stored) != version:
+        try:
+            data = BytesIO(convert_psst(stored, version))
+        except Exception:
+            return jsonify(msg="Session data could not be converted"), \
+                status.BAD_REQUEST
+    elif entity.payload and entity.payload.digest:
+        # Sent straight from the PSST store.
+        data = psst_store.path(entity.payload.digest)
+    else:
+        data = BytesIO(stored)
     return send_file(
         data,
         as_attachment=True,
@@ -130,6 +212,12 @@ def get_last():
     return jsonify(entity), status.OK
 
 
+@bp.route('/telemetry-cache', methods=['GET'])
+@jwt_required()
+def get_telemetry_cache_stats():
+    return jsonify(telemetry_cache.stats()), status.OK
+
+
 @bp.route('/<uuid:id>', methods=['GET'])
 def get(id: uuid.UUID):
     return get_entity(Session, id)
@@ -140,44 +228,80 @@ def filter(id: uuid.UUID):
     entity = Session.get(id)
     if not entity:
         return jsonify(msg="Session does not exist!"), status.NOT_FOUND
-    d = msgpack.unpackb(entity.data)
-    t = dataclass_from_dict(Telemetry, d)
+    try:
+        components, sides = extract_components()
+    except ValueError:
+        return jsonify(msg="Invalid components or side"), status.BAD_REQUEST
+    t = telemetry_cache.get(entity)
 
-    start, end = _extract_range(t.SampleRate)
-    count = len(t.Front.Travel if t.Front.Present else t.Rear.Travel)
-    if not _validate_range(start, end, count):
+    start, end = extract_range(t.SampleRate)
+    if not validate_range(start, end, record_count(entity, t)):
         start = None
         end = None
 
-    updated_data = {'front': None, 'rear': None}
-    tick = 1.0 / t.SampleRate
-    if t.Front.Present:
-        f_strokes = _filter_strokes(t.Front.Strokes, start, end)
-        updated_data['front'] = _update_stroke_based(f_strokes, t.Front)
-        updated_data['front']['fft'] = update_fft(
-            t.Front.Travel[start:end], tick)
-    if t.Rear.Present:
-        r_strokes = _filter_strokes(t.Rear.Strokes, start, end)
-        updated_data['rear'] = _update_stroke_based(r_strokes, t.Rear)
-        updated_data['rear']['fft'] = update_fft(
-            t.Rear.Travel[start:end], tick)
-    if t.Front.Present and t.Rear.Present:
-        updated_data['balance'] = dict(
-            compression=update_balance(
-                f_strokes.Compressions,
-                r_strokes.Compressions,
-                t.Linkage.MaxFrontTravel,
-                t.Linkage.MaxRearTravel
-            ),
-            rebound=update_balance(
-                f_strokes.Rebounds,
-                r_strokes.Rebounds,
-                t.Linkage.MaxFrontTravel,
-                t.Linkage.MaxRearTravel
-            ),
-        )
+    return _filter_response(entity, t, start, end, components, sides)
+
+
+@bp.route('/<uuid:id>/filter', methods=['POST'])
+def filter_batch(id: uuid.UUID):
+    # Same as filter, but for a list of [start, end] ranges (in seconds)
+    # sent as {"ranges": [...]}. The results are returned in a list, in the
+    # same order. The payload and the histogram index are read only once.
+    entity = Session.get(id)
+    if not entity:
+        return jsonify(msg="Session does not exist!"), status.NOT_FOUND
+    try:
+        components, sides = extract_components()
+        ranges = (request.get_json(silent=True) or {})['ranges']
+        if not 0 < len(ranges) <= MAX_FILTER_RANGES:
+            raise ValueError
+        ranges = [(float(start), float(end)) for start, end in ranges]
+    except (KeyError, TypeError, ValueError):
+        return jsonify(msg="Invalid ranges, components or side"), \
+            status.BAD_REQUEST
+    t = telemetry_cache.get(entity)
+
+    count = record_count(entity, t)
+    index = filter_index(entity, components)
+    results = []
+    for start, end in ranges:
+        # Like with a single range, invalid ones select the whole session.
+        try:
+            start = int(start * t.SampleRate)
+            end = int(end * t.SampleRate)
+        except (OverflowError, ValueError):
+            start, end = None, None
+        if not validate_range(start, end, count):
+            start = None
+            end = None
+        results.append(
+            filter_data(t, index, start, end, components, sides))
+    return array_response(results)
+
+
+@bp.route('/<uuid:id>/trace', methods=['GET'])
+def trace(id: uuid.UUID):
+    entity = Session.get(id)
+    if not entity:
+        return jsonify(msg="Session does not exist!"), status.NOT_FOUND
+    t = telemetry_cache.get(entity)
+    pyramid = telemetry_cache.get_derived(
+        entity, 'trace_pyramid', build_trace_pyramid)
+
+    # The visible range of the plot can extend over the session boundaries,
+    # so the range is clamped instead of being rejected.
+    start, end = extract_range(t.SampleRate)
+    if start is not None and end is not None:
+        start, end = max(start, 0), min(end, pyramid.Length)
+    if start is None or end is None or start >= end:
+        start = None
+        end = None
+    try:
+        width = int(request.args.get('width'))
+    except BaseException:
+        return jsonify(msg="Invalid width"), status.BAD_REQUEST
 
-    return jsonify(updated_data)
+    return jsonify(trace_data(t, pyramid, start, end, width))
 
 
 @bp.route('/<uuid:id>', methods=['DELETE'])
@@ -185,32 +309,73 @@ def filter(id: uuid.UUID):
 def delete(id: uuid.UUID):
     delete_entity(Session, id)
     db.session.execute(db.delete(SessionHtml).filter_by(session_id=id))
+    db.session.execute(
+        db.delete(SessionHistogramIndex).filter_by(session_id=id))
+    db.session.execute(db.delete(CacheJob).filter_by(session_id=id))
+    db.session.execute(db.delete(SessionRaw).filter_by(session_id=id))
+    db.session.execute(db.delete(SessionStats).filter_by(session_id=id))
     db.session.commit()
+    telemetry_cache.invalidate(id)
     return '', status.NO_CONTENT
 
 
+def _insert_session(session_dict: dict, setup: uuid.UUID,
+                    telemetry: Telemetry, raw: bytes = None):
+    entity = Session(
+        name=session_dict['name'],
+        description=session_dict.get('description'),
+        setup=setup,
+    )
+    entity.set_psst(psst_from_telemetry(telemetry, stored_psst_version()),
+                    telemetry)
+    db.session.add(entity)
+    db.session.flush()
+    SessionStats.store(entity.id, telemetry)
+    SessionHistogramIndex.store(entity.id, telemetry)
+    if raw is not None:
+        # Kept, so that the session can be reprocessed when its setup changes.
+        db.session.add(SessionRaw(session_id=entity.id, data=raw))
+    db.session.commit()
+    generate_bokeh(entity.id)
+    return jsonify(id=entity.id), status.CREATED
+
+
 @bp.route('', methods=['PUT'])
 @jwt_required()
 def put():
-    api_server = current_app.config['GOSST_HTTP_API']
-    url = f'{api_server}/api/internal/session'
-    resp = requests.put(url, json=request.json)
-    if resp.status_code == status.CREATED:
-        return jsonify(id=resp.json()['id']), status.CREATED
-    else:
+    session_dict = request.json
+    try:
+        setup = Setup.get(uuid.UUID(session_dict['setup']))
+        raw = base64.b64decode(session_dict['data'])
+        front, rear, meta = raw_from_sst(raw)
+        meta.Name = session_dict['name']
+        telemetry = process_recording(front, rear, meta, *setup_data(setup))
+    except Exception:
         return jsonify(msg="Session could not be imported"), status.BAD_REQUEST
+    return _insert_session(session_dict, setup.id, telemetry, raw)
 
 
 @bp.route('/normalized', methods=['PUT'])
 @jwt_required()
 def put_normalized():
-    api_server = current_app.config['GOSST_HTTP_API']
-    url = f'{api_server}/api/internal/session/normalized'
-    resp = requests.put(url, json=request.json)
-    if resp.status_code == status.CREATED:
-        return jsonify(id=resp.json()['id']), status.CREATED
-    else:
+    session_dict = request.json
+    try:
+        linkage = linkage_from_model(
+            Linkage.get(uuid.UUID(session_dict['linkage'])))
+        front, rear = raw_from_normalized(session_dict['data'])
+        meta = Meta(
+            Name=session_dict['name'],
+            Version=NORMALIZED_VERSION,
+            SampleRate=int(session_dict['sample_rate']),
+            Timestamp=int(session_dict['timestamp']),
+        )
+        telemetry = process_recording(
+            front, rear, meta, linkage,
+            fraction_calibrator(linkage.MaxFrontStroke),
+            fraction_calibrator(linkage.MaxRearStroke))
+    except Exception:
         return jsonify(msg="Session could not be imported"), status.BAD_REQUEST
+    return _insert_session(session_dict, None, telemetry)
 
 
 @bp.route('/psst', methods=['PUT'])
@@ -222,11 +387,19 @@ def put_processed():
     if not entity:
         return jsonify(msg="Invalid data for Session"), status.BAD_REQUEST
     try:
-        entity.psst = session_data
+        psst_data = base64.b64decode(session_data)
+        telemetry = telemetry_from_psst(psst_data)
     except BaseException:
         return jsonify(msg="Invalid data for Session"), status.BAD_REQUEST
+    # The payload is set on the merged entity, so that an existing one is
+    # updated instead of being replaced.
     entity = db.session.merge(entity)
+    entity.set_psst(psst_data, telemetry)
+    db.session.flush()
+    SessionStats.store(entity.id, telemetry)
+    SessionHistogramIndex.store(entity.id, telemetry)
     db.session.commit()
+    telemetry_cache.invalidate(entity.id)
     generate_bokeh(entity.id)
     return jsonify(id=entity.id), status.CREATED
 
@@ -269,11 +442,19 @@ def patch_psst(id: uuid.UUID):
     # It is called for each modified session after an /api/sync/pull call. We
     # don't want the 'updated' field set by that call overwritten here, so we
     # set the updated value explicitly.
+    try:
+        telemetry = telemetry_from_psst(request.data)
+    except BaseException:
+        telemetry = None
     db.session.execute(db.update(Session).filter_by(id=id).values(
-        data=request.data,
         updated=session.updated,
+        **psst_properties(telemetry),
     ))
+    session.data = psst_payload(request.data, telemetry)
+    SessionStats.store(id, telemetry)
+    SessionHistogramIndex.store(id, telemetry)
     db.session.commit()
+    telemetry_cache.invalidate(id)
     generate_bokeh(id)
     return '', status.NO_CONTENT
 
@@ -287,7 +468,7 @@ def generate_bokeh(id: uuid.UUID):
     sh = db.session.execute(
         db.select(SessionHtml).filter_by(session_id=id)).scalar_one_or_none()
     if not sh:
-        id_queue.put(id)
+        enqueue_cache_job(id)
         return '', status.NO_CONTENT
 
     return jsonify(msg=f"already generated (session {id})"), status.BAD_REQUEST
@@ -324,7 +505,7 @@ def session_html(session_id: uuid.UUID):
         db.session.execute(db.delete(SessionHtml).filter_by(
                            session_id=session.id))
         db.session.commit()
-        create_cache(session.id, 5, 200)
+        create_cache(session.id, 200)
         session_html = db.session.execute(db.select(SessionHtml).filter_by(
             session_id=session.id)).scalar_one_or_none()
 
@@ -334,19 +515,10 @@ def session_html(session_id: uuid.UUID):
 
     track = Track.get(session.track)
 
-    d = msgpack.unpackb(session.data)
-    t = dataclass_from_dict(Telemetry, d)
-
-    suspension_count = 0
-    if t.Front.Present:
-        suspension_count += 1
-    if t.Rear.Present:
-        suspension_count += 1
-
-    record_num = len(t.Front.Travel) if t.Front.Present else len(t.Rear.Travel)
-    elapsed_time = record_num / t.SampleRate
+    _ensure_psst_properties(session)
+    suspension_count = int(session.front_present) + int(session.rear_present)
     start_time = session.timestamp
-    end_time = start_time + elapsed_time
+    end_time = start_time + session.duration
     full_track, session_track = track_data(track.track if track else None,
                                            start_time, end_time)
 
@@ -385,12 +557,9 @@ def upload_gpx(id: uuid.UUID):
     if not session:
         return jsonify(msg="Session does not exist!"), status.NOT_FOUND
 
-    d = msgpack.unpackb(session.data)
-    t = dataclass_from_dict(Telemetry, d)
-    record_num = len(t.Front.Travel) if t.Front.Present else len(t.Rear.Travel)
-    elapsed_time = record_num / t.SampleRate
+    _ensure_psst_properties(session)
     start_time = session.timestamp
-    end_time = start_time + elapsed_time
+    end_time = start_time + session.duration
 
     track_dict = gpx_to_dict(request.data)
     ts, tf = track_dict['time'][0], track_dict['time'][-1]
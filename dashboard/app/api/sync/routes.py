@@ -7,7 +7,10 @@ from flask_jwt_extended import jwt_required
 from app.api.sync import bp
 from app.extensions import db
 from app.models.board import Board
-from app.models.calibration import CalibrationMethod, Calibration
+from app.models.calibration import (
+    CalibrationMethod,
+    Calibration,
+    calibration_programs)
 from app.models.linkage import Linkage
 from app.models.session import Session
 from app.models.setup import Setup
@@ -16,6 +19,8 @@ from app.telemetry.psst import dataclass_from_dict as dfd
 
 def merge(entity: db.Model) -> db.Model:
     klass = type(entity)
+    if klass is CalibrationMethod:
+        calibration_programs.invalidate(entity.id)
     db_entity = db.session.execute(
         db.select(klass).filter_by(id=entity.id)).scalar_one_or_none()
 
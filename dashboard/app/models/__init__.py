@@ -1,9 +1,15 @@
 from app.models.board import Board
+from app.models.cache_job import CacheJob
 from app.models.calibration import Calibration
 from app.models.calibration import CalibrationMethod
 from app.models.linkage import Linkage
+from app.models.reprocess_job import ReprocessJob
 from app.models.session import Session
+from app.models.session_data import SessionData
+from app.models.session_histogram_index import SessionHistogramIndex
 from app.models.session_html import SessionHtml
+from app.models.session_raw import SessionRaw
+from app.models.session_stats import SessionStats
 from app.models.setup import Setup
 from app.models.track import Track
 from app.models.user import User
\ No newline at end of file
@@ -0,0 +1,25 @@
+import uuid
+
+from dataclasses import dataclass
+
+from app.extensions import db
+
+
+@dataclass
+class CacheJob(db.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    session_id: uuid.UUID = db.Column(db.Uuid(), db.ForeignKey('session.id'),
+                                      primary_key=True)
+    state: str = db.Column(db.String, nullable=False, default=PENDING)
+    attempts: int = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt: int = db.Column(db.Integer, nullable=False, default=0)
+    error: str = db.Column(db.String)
+    updated: int = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_cache_job_state', 'state', 'next_attempt'),
+    )
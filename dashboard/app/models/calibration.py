@@ -1,11 +1,17 @@
+import ast
 import json
 import math
+import threading
 import uuid
 
 from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import inspect
+
 from app.extensions import db
 from app.models.synchronizable import Synchronizable
-from app.utils.expr import ExpressionParser
+from app.utils.expr import ExpressionCompiler, ExpressionParser
 
 
 _std_env = dict(
@@ -23,6 +29,117 @@ _std_env = dict(
 )
 
 
+def _validate(properties: dict) -> bool:
+    env = dict(_std_env)
+    for input in properties['inputs']:
+        env[input] = 1
+    parser = ExpressionParser(env)
+    for k, v in properties['intermediates'].items():
+        if not parser.validate(v):
+            return False
+        env[k] = 1
+    parser = ExpressionParser(env)
+    return parser.validate(properties['expression'])
+
+
+@dataclass
+class CalibrationProgram:
+    """Parsed and compiled form of a calibration method's properties.
+
+    Does not depend on the inputs of a calibration, so one program can be
+    shared by every calibration using the method.
+    """
+
+    valid: bool
+    variables: tuple[str]
+    intermediates: list[tuple[str, ast.Expression]]
+    expression: Callable = None
+    error: Exception = None
+
+    @staticmethod
+    def build(properties: dict) -> 'CalibrationProgram':
+        intermediates = properties['intermediates']
+        variables = ('MAX_STROKE', 'MAX_TRAVEL', *properties['inputs'],
+                     *intermediates)
+        program = CalibrationProgram(_validate(properties), variables, [])
+        try:
+            for k, v in intermediates.items():
+                program.intermediates.append((k, ExpressionParser.parse(v)))
+            program.expression = ExpressionCompiler(_std_env).compile(
+                properties['expression'], ('sample', *variables))
+        except Exception as e:
+            program.valid = False
+            program.error = e
+        return program
+
+    def calibration(self, inputs: dict[str: float], max_stroke: float,
+                    max_travel: float):
+        if self.error is not None:
+            raise self.error
+        env = dict(_std_env, MAX_STROKE=max_stroke, MAX_TRAVEL=max_travel)
+        env.update(inputs)
+        for k, tree in self.intermediates:
+            env[k] = ExpressionParser(env).evaluate(tree)
+        values = {k: env[k] for k in self.variables}
+        return lambda samples: self.expression(sample=samples, **values)
+
+
+@dataclass
+class CalibrationProgramCacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    entries: int = 0
+
+
+class CalibrationProgramCache:
+    """Process-wide cache of calibration programs.
+
+    Entries are keyed by method id and the method's `updated` timestamp.
+    Code paths that overwrite a method must call `invalidate`, because a
+    synced row can keep the timestamp it was written with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = CalibrationProgramCacheStats()
+
+    def get(self, method: 'CalibrationMethod') -> CalibrationProgram:
+        with self._lock:
+            entry = self._entries.get(method.id)
+            if entry and entry[0] == method.updated:
+                self._stats.hits += 1
+                return entry[1]
+            self._stats.misses += 1
+        program = CalibrationProgram.build(method.properties)
+        with self._lock:
+            self._entries[method.id] = (method.updated, program)
+        return program
+
+    def invalidate(self, id: uuid.UUID | str):
+        if isinstance(id, str):
+            id = uuid.UUID(id)
+        with self._lock:
+            if self._entries.pop(id, None):
+                self._stats.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CalibrationProgramCacheStats:
+        with self._lock:
+            return CalibrationProgramCacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                invalidations=self._stats.invalidations,
+                entries=len(self._entries))
+
+
+calibration_programs = CalibrationProgramCache()
+
+
 @dataclass
 class CalibrationMethod(db.Model, Synchronizable):
     id: uuid.UUID = db.Column(db.Uuid(), primary_key=True, default=uuid.uuid4)
@@ -40,17 +157,25 @@ class CalibrationMethod(db.Model, Synchronizable):
     def properties(self, value: dict):
         self.properties_raw = json.dumps(value)
 
+    def _program(self) -> CalibrationProgram:
+        # Only rows that are already in the database are cached, the
+        # properties of a new or detached entity might not match its key.
+        if inspect(self).persistent:
+            return calibration_programs.get(self)
+        return CalibrationProgram.build(self.properties)
+
     def validate(self) -> float:
-        env = dict(_std_env)
-        for input in self.properties['inputs']:
-            env[input] = 1
-        parser = ExpressionParser(env)
-        for k, v in self.properties['intermediates'].items():
-            if not parser.validate(v):
-                return False
-            env[k] = 1
-        parser = ExpressionParser(env)
-        return parser.validate(self.properties['expression'])
+        return self._program().valid
+
+    def compile(self, inputs: dict[str: float], max_stroke: float,
+                max_travel: float):
+        """Returns a function that calibrates an array of samples.
+
+        Intermediates are evaluated once here, only the expression itself is
+        evaluated over the samples.
+        """
+
+        return self._program().calibration(inputs, max_stroke, max_travel)
 
 
 @dataclass
@@ -0,0 +1,41 @@
+import json
+import uuid
+
+from dataclasses import dataclass
+
+from app.extensions import db
+
+
+@dataclass
+class ReprocessJob(db.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    LINKAGE = 'linkage'
+    CALIBRATION = 'calibration'
+    CALIBRATION_METHOD = 'calibration_method'
+
+    id: uuid.UUID = db.Column(db.Uuid(), primary_key=True, default=uuid.uuid4)
+    entity: str = db.Column(db.String, nullable=False)
+    entity_id: uuid.UUID = db.Column(db.Uuid(), nullable=False)
+    state: str = db.Column(db.String, nullable=False, default=PENDING)
+    total: int = db.Column(db.Integer, nullable=False, default=0)
+    done: int = db.Column(db.Integer, nullable=False, default=0)
+    failed: int = db.Column(db.Integer, nullable=False, default=0)
+    # Affected sessions that can't be reprocessed, not included in total.
+    skipped: int = db.Column(db.Integer, nullable=False, default=0)
+    error: str = db.Column(db.String)
+    created: int = db.Column(db.Integer, nullable=False, default=0)
+    updated: int = db.Column(db.Integer, nullable=False, default=0)
+    sessions_raw = db.Column('sessions', db.String, nullable=False,
+                             default='[]')
+
+    @property
+    def sessions(self) -> list[uuid.UUID]:
+        return [uuid.UUID(id) for id in json.loads(self.sessions_raw)]
+
+    @sessions.setter
+    def sessions(self, value: list[uuid.UUID]):
+        self.sessions_raw = json.dumps([id.hex for id in value])
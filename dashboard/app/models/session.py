@@ -1,12 +1,53 @@
 import base64
-import msgpack
 import uuid
 
 from dataclasses import dataclass
 
+from flask import current_app
+
 from app.extensions import db
+from app.models.session_data import SessionData
 from app.models.synchronizable import Synchronizable
-from app.telemetry.psst import Telemetry, dataclass_from_dict
+from app.telemetry.psst import (
+    PSST_VERSION_1,
+    Telemetry,
+    psst_from_telemetry,
+    psst_version,
+    telemetry_from_psst
+)
+
+
+def stored_psst_version() -> int:
+    """Returns the PSST version payloads are stored as (PSST_VERSION)."""
+
+    return int(current_app.config.get('PSST_VERSION', PSST_VERSION_1))
+
+
+def psst_payload(data: bytes, telemetry: Telemetry) -> bytes:
+    """Returns the payload to store for PSST data, re-encoded if it is not
+    the stored version. Data that could not be decoded is stored as-is."""
+
+    version = stored_psst_version()
+    if telemetry is None or psst_version(data) == version:
+        return data
+    return psst_from_telemetry(telemetry, version)
+
+
+def psst_properties(telemetry: Telemetry) -> dict:
+    """Returns the Session column values derived from the PSST payload."""
+
+    if telemetry is None:
+        return dict(sample_rate=None, record_count=None, duration=None,
+                    front_present=None, rear_present=None)
+    front, rear = telemetry.Front, telemetry.Rear
+    record_count = len(front.Travel if front.Present else rear.Travel)
+    return dict(
+        sample_rate=telemetry.SampleRate,
+        record_count=record_count,
+        duration=record_count / telemetry.SampleRate,
+        front_present=front.Present,
+        rear_present=rear.Present,
+    )
 
 
 @dataclass
@@ -19,7 +60,16 @@ class Session(db.Model, Synchronizable):
     timestamp: int = db.Column(db.Integer, nullable=False)
     track: uuid.UUID = db.Column('track_id', db.Uuid(),
                                  db.ForeignKey('track.id'))
-    data = db.Column(db.LargeBinary)
+    # Loaded only when the data property is accessed.
+    payload = db.relationship(SessionData, uselist=False, lazy='select',
+                              cascade='all, delete-orphan')
+    # Derived from data, so that the payload does not have to be decoded
+    # just to get these. Not annotated, because they are not synchronized.
+    sample_rate = db.Column(db.Integer)
+    record_count = db.Column(db.Integer)
+    duration = db.Column(db.Float)
+    front_present = db.Column(db.Boolean)
+    rear_present = db.Column(db.Boolean)
     front_springrate: str = db.Column(db.String)
     rear_springrate: str = db.Column(db.String)
     front_hsc: int = db.Column(db.Integer)
@@ -31,6 +81,23 @@ class Session(db.Model, Synchronizable):
     front_hsr: int = db.Column(db.Integer)
     rear_hsr: int = db.Column(db.Integer)
 
+    __table_args__ = (
+        db.Index('ix_session_timestamp_id', 'timestamp', 'id'),
+    )
+
+    @property
+    def data(self) -> bytes:
+        return self.payload.read() if self.payload else None
+
+    @data.setter
+    def data(self, value: bytes):
+        if value is None:
+            self.payload = None
+            return
+        if not self.payload:
+            self.payload = SessionData()
+        self.payload.write(value)
+
     @property
     def psst(self) -> bytes:
         return self.data
@@ -38,9 +105,13 @@ class Session(db.Model, Synchronizable):
     @psst.setter
     def psst(self, data: str):
         psst_data = base64.b64decode(data)
-        psst_dict = msgpack.unpackb(psst_data,
-                                    strict_map_key=True)
-        telemetry = dataclass_from_dict(Telemetry, psst_dict)
-        self.data = psst_data
-        self.timestamp = telemetry.Timestamp
+        self.set_psst(psst_data, telemetry_from_psst(psst_data))
         self.setup_id = uuid.UUID('00000000000000000000000000000000')
+
+    def set_psst(self, data: bytes, telemetry: Telemetry):
+        """Sets the PSST payload along with the columns derived from it."""
+
+        self.data = psst_payload(data, telemetry)
+        self.timestamp = telemetry.Timestamp
+        for k, v in psst_properties(telemetry).items():
+            setattr(self, k, v)
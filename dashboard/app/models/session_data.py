@@ -0,0 +1,94 @@
+import mmap
+import uuid
+
+from dataclasses import dataclass
+
+from app.extensions import db
+from app.telemetry.psst import convert_psst, psst_version
+from app.utils.file_store import psst_store
+
+
+@dataclass
+class SessionData(db.Model):
+    """The PSST payload of a session.
+
+    Kept out of the session table, so that queries on session metadata
+    don't have to read through the payloads. When the PSST store is enabled,
+    the payload is written there, and only its digest is kept in the row.
+    """
+
+    session_id: uuid.UUID = db.Column(db.Uuid(), db.ForeignKey('session.id'),
+                                      primary_key=True)
+    data = db.Column(db.LargeBinary)
+    digest = db.Column(db.String)
+
+    def read(self) -> bytes | mmap.mmap:
+        if self.digest is not None:
+            return psst_store.get(self.digest)
+        return self.data
+
+    def write(self, data: bytes):
+        if psst_store.enabled:
+            self.digest = psst_store.put(data)
+            self.data = None
+        else:
+            self.digest = None
+            self.data = data
+
+    @staticmethod
+    def migrate(to_store: bool = True) -> int:
+        """Moves payloads to the PSST store, or back to the database. Returns
+        the number of payloads moved."""
+
+        if not psst_store.enabled:
+            raise RuntimeError("the PSST store is not configured")
+        column = SessionData.data if to_store else SessionData.digest
+        ids = db.session.execute(
+            db.select(SessionData.session_id).filter(column.is_not(None))
+        ).scalars().all()
+        # One row at a time, so that we never hold more than one payload.
+        for id in ids:
+            entity = db.session.get(SessionData, id)
+            if to_store:
+                entity.digest = psst_store.put(entity.data)
+                entity.data = None
+            else:
+                entity.data = bytes(psst_store.get(entity.digest))
+                entity.digest = None
+            db.session.commit()
+            db.session.expunge(entity)
+        return len(ids)
+
+    @staticmethod
+    def convert(version: int) -> int:
+        """Re-encodes payloads as the given PSST version. Returns the number
+        of payloads converted."""
+
+        ids = db.session.execute(
+            db.select(SessionData.session_id)).scalars().all()
+        count = 0
+        for id in ids:
+            entity = db.session.get(SessionData, id)
+            data = entity.read()
+            if data and psst_version(data) != version:
+                try:
+                    converted = convert_psst(data, version)
+                except Exception:
+                    # Payloads that can't be decoded are left as they are.
+                    converted = None
+                if converted is not None:
+                    entity.write(converted)
+                    db.session.commit()
+                    count += 1
+            db.session.expunge(entity)
+        return count
+
+    @staticmethod
+    def collect_garbage() -> int:
+        """Removes files of the PSST store that no payload references.
+        Returns the number of files removed."""
+
+        referenced = set(db.session.execute(
+            db.select(SessionData.digest).filter(
+                SessionData.digest.is_not(None))).scalars())
+        return psst_store.collect(referenced)
@@ -0,0 +1,29 @@
+import uuid
+
+from dataclasses import dataclass
+
+from app.extensions import db
+from app.telemetry.histogram_index import (
+    build_histogram_index,
+    pack_histogram_index
+)
+from app.telemetry.psst import Telemetry
+
+
+@dataclass
+class SessionHistogramIndex(db.Model):
+    session_id: uuid.UUID = db.Column(db.Uuid(), db.ForeignKey('session.id'),
+                                      primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    @staticmethod
+    def store(session_id: uuid.UUID, telemetry: Telemetry):
+        """Replaces the histogram index of a session; does not commit."""
+
+        if telemetry is None:
+            db.session.execute(db.delete(SessionHistogramIndex).filter_by(
+                session_id=session_id))
+            return
+        db.session.merge(SessionHistogramIndex(
+            session_id=session_id,
+            data=pack_histogram_index(build_histogram_index(telemetry))))
@@ -0,0 +1,14 @@
+import uuid
+
+from dataclasses import dataclass
+
+from app.extensions import db
+
+
+@dataclass
+class SessionRaw(db.Model):
+    """The recording a session was imported from, kept for reprocessing."""
+
+    session_id: uuid.UUID = db.Column(db.Uuid(), db.ForeignKey('session.id'),
+                                      primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
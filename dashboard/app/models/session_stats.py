@@ -0,0 +1,59 @@
+import uuid
+
+from dataclasses import dataclass
+
+from app.extensions import db
+from app.telemetry.psst import Telemetry
+from app.telemetry.stats import session_stats
+
+
+@dataclass
+class SessionStats(db.Model):
+    """Summary statistics of a session, so that sessions can be compared
+    without decoding their data."""
+
+    session_id: uuid.UUID = db.Column(db.Uuid(), db.ForeignKey('session.id'),
+                                      primary_key=True)
+    front_travel_avg: float = db.Column(db.Float)
+    front_travel_max: float = db.Column(db.Float)
+    front_bottomouts: int = db.Column(db.Integer)
+    front_velocity_avg_rebound: float = db.Column(db.Float)
+    front_velocity_max_rebound: float = db.Column(db.Float)
+    front_velocity_avg_compression: float = db.Column(db.Float)
+    front_velocity_max_compression: float = db.Column(db.Float)
+    front_hsr: float = db.Column(db.Float)
+    front_lsr: float = db.Column(db.Float)
+    front_lsc: float = db.Column(db.Float)
+    front_hsc: float = db.Column(db.Float)
+    rear_travel_avg: float = db.Column(db.Float)
+    rear_travel_max: float = db.Column(db.Float)
+    rear_bottomouts: int = db.Column(db.Integer)
+    rear_velocity_avg_rebound: float = db.Column(db.Float)
+    rear_velocity_max_rebound: float = db.Column(db.Float)
+    rear_velocity_avg_compression: float = db.Column(db.Float)
+    rear_velocity_max_compression: float = db.Column(db.Float)
+    rear_hsr: float = db.Column(db.Float)
+    rear_lsr: float = db.Column(db.Float)
+    rear_lsc: float = db.Column(db.Float)
+    rear_hsc: float = db.Column(db.Float)
+
+    @staticmethod
+    def store(session_id: uuid.UUID, telemetry: Telemetry):
+        """Replaces the statistics of a session; does not commit."""
+
+        if telemetry is None:
+            db.session.execute(
+                db.delete(SessionStats).filter_by(session_id=session_id))
+            return
+        SessionStats.store_stats(session_id, session_stats(telemetry))
+
+    @staticmethod
+    def store_stats(session_id: uuid.UUID, stats: dict):
+        """Like `store`, with statistics already computed by
+        `session_stats`."""
+
+        # Every column is set, so that merging overwrites the stats of a
+        # suspension that is no longer present.
+        values = {c.name: None for c in SessionStats.__table__.columns}
+        values.update(stats, session_id=session_id)
+        db.session.merge(SessionStats(**values))
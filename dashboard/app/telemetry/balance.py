@@ -6,23 +6,18 @@ from bokeh.models import ColumnDataSource
 from bokeh.models.tickers import FixedTicker
 from bokeh.plotting import figure
 
-from app.telemetry.psst import Stroke
+from app.telemetry.psst import StrokeTable
 
 
-def _travel_velocity(strokes: list[Stroke], travel_max) -> (
+def _travel_velocity(strokes: StrokeTable, travel_max) -> (
                      np.array, np.array):
-    t, v = [], []
-    for s in strokes:
-        t.append(s.Stat.MaxTravel / travel_max * 100)
-        v.append(s.Stat.MaxVelocity)
-
-    t = np.array(t)
-    v = np.array(v)
+    t = strokes.MaxTravel / travel_max * 100
+    v = strokes.MaxVelocity
     p = t.argsort()
     return t[p], v[p]
 
 
-def _balance_data(front_strokes: list[Stroke], rear_strokes: list[Stroke],
+def _balance_data(front_strokes: StrokeTable, rear_strokes: StrokeTable,
                   front_max: float, rear_max: float) -> (
                   dict[str, Any], dict[str, Any]):
     ft, fv = _travel_velocity(front_strokes, front_max)
@@ -31,19 +26,19 @@ def _balance_data(front_strokes: list[Stroke], rear_strokes: list[Stroke],
     fp = np.poly1d(np.polyfit(ft, fv, 1))
     rp = np.poly1d(np.polyfit(rt, rv, 1))
 
-    f = dict(travel=ft.tolist(), velocity=fv.tolist(),
-             trend=[fp(t) for t in ft])
-    r = dict(travel=rt.tolist(), velocity=rv.tolist(),
-             trend=[rp(t) for t in rt])
+    f = dict(travel=ft, velocity=fv, trend=fp(ft))
+    r = dict(travel=rt, velocity=rv, trend=rp(rt))
 
     return f, r
 
 
-def balance_figure(front_strokes: list[Stroke], rear_strokes: list[Stroke],
+def balance_figure(front_strokes: StrokeTable, rear_strokes: StrokeTable,
                    front_max: float, rear_max: float, flipped: bool,
                    front_color: tuple[str], rear_color: tuple[str],
                    name: str, title: str) -> (figure):
     f, r = _balance_data(front_strokes, rear_strokes, front_max, rear_max)
+    f = {k: v.tolist() for k, v in f.items()}
+    r = {k: v.tolist() for k, v in r.items()}
     front_source = ColumnDataSource(name='ds_f', data=f)
     rear_source = ColumnDataSource(name='ds_r', data=r)
 
@@ -89,7 +84,7 @@ def balance_figure(front_strokes: list[Stroke], rear_strokes: list[Stroke],
     return p
 
 
-def update_balance(front_strokes: list[Stroke], rear_strokes: list[Stroke],
+def update_balance(front_strokes: StrokeTable, rear_strokes: StrokeTable,
                    front_max: float, rear_max: float):
     f_data, r_data = _balance_data(
         front_strokes, rear_strokes, front_max, rear_max)
@@ -0,0 +1,164 @@
+import numpy as np
+
+from dataclasses import dataclass
+
+from app.telemetry.psst import Telemetry
+
+
+# Samples in the buckets of the finest pyramid level, and the number of
+# buckets of a level that are merged into one bucket of the next level.
+BASE_BUCKET_SIZE = 8
+BUCKET_FACTOR = 4
+
+# Number of horizontal buckets (roughly pixels) of the trace that is embedded
+# into the cached Bokeh document. Detail is fetched on zoom.
+INITIAL_TRACE_WIDTH = 2000
+MAX_TRACE_WIDTH = 10000
+
+
+@dataclass
+class MinMaxLevel:
+    BucketSize: int
+    MinIndex: np.ndarray
+    MaxIndex: np.ndarray
+
+
+def _merge(values: np.ndarray, indices: np.ndarray, factor: int,
+           arg) -> np.ndarray:
+    # Picks the index of the smallest (or largest) value from each group of
+    # `factor` consecutive indices.
+    padded = np.resize(indices, -(-len(indices) // factor) * factor)
+    padded[len(indices):] = indices[-1]
+    groups = padded.reshape(-1, factor)
+    choice = arg(values[groups], axis=1)
+    return groups[np.arange(len(groups)), choice]
+
+
+def _min_max_pyramid(values: np.ndarray) -> list[MinMaxLevel]:
+    # Every level stores the position of the minimum and maximum of each of
+    # its buckets, so that the M4 representation (first, min, max, last) of
+    # any range can be assembled without touching the samples in between.
+    levels = []
+    indices = np.arange(len(values))
+    factor = BASE_BUCKET_SIZE
+    bucket_size = 1
+    min_index, max_index = indices, indices
+    while len(min_index) > 1:
+        bucket_size *= factor
+        min_index = _merge(values, min_index, factor, np.argmin)
+        max_index = _merge(values, max_index, factor, np.argmax)
+        levels.append(MinMaxLevel(bucket_size, min_index, max_index))
+        factor = BUCKET_FACTOR
+    return levels
+
+
+def _group_arg(values: np.ndarray, indices: np.ndarray, edges: np.ndarray,
+               arg) -> np.ndarray:
+    # Applies `arg` to the values at indices[edges[k]:edges[k+1]] for every
+    # k, and returns the selected indices.
+    lengths = np.diff(edges)
+    width = lengths.max()
+    columns = edges[:-1, None] + np.arange(width)
+    valid = columns < edges[1:, None]
+    columns = np.where(valid, columns, edges[:-1, None])
+    candidates = indices[columns]
+    choice = arg(values[candidates], axis=1)
+    return candidates[np.arange(len(candidates)), choice]
+
+
+def _m4_indices(values: np.ndarray, levels: list[MinMaxLevel],
+                lo: int, hi: int, width: int) -> np.ndarray:
+    samples_per_bucket = (hi - lo) / width
+    usable = [lv for lv in levels if lv.BucketSize <= samples_per_bucket]
+    if not usable:
+        return np.arange(lo, hi)
+
+    level = usable[-1]
+    b = level.BucketSize
+    first, last = lo // b, -(-hi // b)
+    min_index = level.MinIndex[first:last].copy()
+    max_index = level.MaxIndex[first:last].copy()
+    # The two buckets at the ends can extend over the range, so their
+    # extremes are searched directly, in the part inside the range.
+    for k, a, z in ((0, lo, min(hi, (first + 1) * b)),
+                    (-1, max(lo, (last - 1) * b), hi)):
+        min_index[k] = a + np.argmin(values[a:z])
+        max_index[k] = a + np.argmax(values[a:z])
+
+    edges = np.unique(np.linspace(0, last - first, width + 1).astype(np.intp))
+    first_index = np.maximum((edges[:-1] + first) * b, lo)
+    last_index = np.minimum((edges[1:] + first) * b, hi) - 1
+    return np.concatenate((
+        first_index,
+        _group_arg(values, min_index, edges, np.argmin),
+        _group_arg(values, max_index, edges, np.argmax),
+        last_index))
+
+
+@dataclass
+class TracePyramid:
+    """Min/max pyramids of the travel and velocity traces of a session."""
+
+    SampleRate: int
+    Length: int
+    FrontTravel: list[MinMaxLevel]
+    RearTravel: list[MinMaxLevel]
+    FrontVelocity: list[MinMaxLevel]
+    RearVelocity: list[MinMaxLevel]
+
+
+def build_trace_pyramid(telemetry: Telemetry) -> TracePyramid:
+    def pyramid(suspension, values):
+        return _min_max_pyramid(values) if suspension.Present else None
+
+    f, r = telemetry.Front, telemetry.Rear
+    return TracePyramid(
+        SampleRate=telemetry.SampleRate,
+        Length=len(f.Travel if f.Present else r.Travel),
+        FrontTravel=pyramid(f, f.Travel),
+        RearTravel=pyramid(r, r.Travel),
+        FrontVelocity=pyramid(f, f.Velocity),
+        RearVelocity=pyramid(r, r.Velocity),
+    )
+
+
+def _trace(pyramid: TracePyramid, lo: int, hi: int, width: int,
+           front: np.ndarray, front_levels: list[MinMaxLevel],
+           rear: np.ndarray, rear_levels: list[MinMaxLevel],
+           scale: float) -> dict[str, list]:
+    # Front and rear share the x coordinates, so the M4 points of both are
+    # merged. This keeps the extremes of both lines, and lets the two share
+    # a single ColumnDataSource.
+    parts = []
+    if front_levels is not None:
+        parts.append(_m4_indices(front, front_levels, lo, hi, width))
+    if rear_levels is not None:
+        parts.append(_m4_indices(rear, rear_levels, lo, hi, width))
+    indices = np.unique(np.concatenate(parts))
+
+    def series(values, levels):
+        if levels is None:
+            return np.zeros(len(indices)).tolist()
+        return (np.around(values[indices], 4) / scale).tolist()
+
+    return dict(
+        t=np.around(indices / pyramid.SampleRate, 4).tolist(),
+        f=series(front, front_levels),
+        r=series(rear, rear_levels),
+    )
+
+
+def trace_data(telemetry: Telemetry, pyramid: TracePyramid, start: int,
+               end: int, width: int) -> dict[str, dict[str, list]]:
+    lo = 0 if start is None else start
+    hi = pyramid.Length if end is None else end
+    width = max(1, min(width, MAX_TRACE_WIDTH))
+    f, r = telemetry.Front, telemetry.Rear
+    return dict(
+        travel=_trace(pyramid, lo, hi, width,
+                      f.Travel, pyramid.FrontTravel,
+                      r.Travel, pyramid.RearTravel, 1),
+        velocity=_trace(pyramid, lo, hi, width,
+                        f.Velocity, pyramid.FrontVelocity,
+                        r.Velocity, pyramid.RearVelocity, 1000),
+    )
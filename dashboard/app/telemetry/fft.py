@@ -10,14 +10,14 @@ from bokeh.plotting import figure
 from scipy.fft import rfft, rfftfreq
 
 
-def _fft_data(travel: list[float], tick: float) -> (dict[str, np.array]):
+def _fft_data(travel: np.ndarray, tick: float) -> (dict[str, np.array]):
     balanced_travel = travel - np.mean(travel)
     n = np.max([20000, len(balanced_travel)])
     balanced_travel_f = rfft(balanced_travel, n=n)
-    balanced_spectrum = np.square(np.abs(balanced_travel_f)).tolist()
+    balanced_spectrum = np.square(np.abs(balanced_travel_f))
 
     freqs = rfftfreq(n, tick)
-    freqs = freqs[freqs <= 10].tolist()  # cut off FFT graph at 10 Hz
+    freqs = freqs[freqs <= 10]  # cut off FFT graph at 10 Hz
 
     # TODO put a label that shows the most prominent frequencies
     # max_freq_idx = np.argpartition(balanced_spectrum, -1)[-1:]
@@ -26,9 +26,9 @@ def _fft_data(travel: list[float], tick: float) -> (dict[str, np.array]):
     return dict(freqs=freqs, spectrum=balanced_spectrum[:len(freqs)])
 
 
-def fft_figure(travel: list[float], tick: float, color: tuple[str], 
+def fft_figure(travel: np.ndarray, tick: float, color: tuple[str], 
                title: str) -> figure:
-    data = _fft_data(travel, tick)
+    data = {k: v.tolist() for k, v in _fft_data(travel, tick).items()}
     source = ColumnDataSource(name='ds_fft', data=data)
     p = figure(
         title=title,
@@ -82,7 +82,7 @@ def fft_figure(travel: list[float], tick: float, color: tuple[str],
     return p
 
 
-def update_fft(travel: list[float], tick: float):
+def update_fft(travel: np.ndarray, tick: float):
     data = _fft_data(travel, tick)
     return dict(
         data=data,
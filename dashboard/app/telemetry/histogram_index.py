@@ -0,0 +1,159 @@
+import msgpack
+import numpy as np
+
+from dataclasses import dataclass
+
+from app.telemetry.psst import StrokeTable, Strokes, Suspension, Telemetry
+from app.telemetry.velocity import TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM
+
+
+# Cumulative histogram counts are stored for every BLOCK_SIZE-th stroke
+# boundary. Counts for an arbitrary stroke range are computed from two stored
+# rows, plus the samples of at most 2 * BLOCK_SIZE strokes at the range ends,
+# so the cost of a query does not depend on the length of the session.
+BLOCK_SIZE = 256
+
+
+@dataclass
+class HistogramIndex:
+    """Prefix sums of the travel and velocity histograms of a suspension.
+
+    Travel, travel x velocity and travel x fine velocity counts share a single
+    flattened column space, so that all three can be counted at once.
+    """
+
+    TravelBins: int
+    VelocityBins: int
+    FineVelocityBins: int
+    Compressions: np.ndarray
+    Rebounds: np.ndarray
+
+    @property
+    def _divider(self) -> int:
+        return self.TravelBins // TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM
+
+    @property
+    def _velocity_offset(self) -> int:
+        return self.TravelBins
+
+    @property
+    def _fine_velocity_offset(self) -> int:
+        return (self.TravelBins +
+                TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM * self.VelocityBins)
+
+    @property
+    def _columns(self) -> int:
+        return (self._fine_velocity_offset +
+                TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM * self.FineVelocityBins)
+
+    def _sample_columns(self, strokes: StrokeTable, lo: int, hi: int) -> (
+                        np.ndarray):
+        # Widened, so that column indices don't overflow narrow types.
+        dt = strokes.DigitizedTravel[lo:hi].astype(np.intp)
+        tbin = dt // self._divider
+        return np.concatenate((
+            dt,
+            self._velocity_offset + tbin * self.VelocityBins +
+            strokes.DigitizedVelocity[lo:hi],
+            self._fine_velocity_offset + tbin * self.FineVelocityBins +
+            strokes.FineDigitizedVelocity[lo:hi]))
+
+    def _count(self, strokes: StrokeTable, i: int, j: int) -> np.ndarray:
+        columns = self._sample_columns(
+            strokes, strokes.Offsets[i], strokes.Offsets[j])
+        return np.bincount(columns, minlength=self._columns)
+
+    def _prefix(self, cumulative: np.ndarray, strokes: StrokeTable,
+                k: int) -> np.ndarray:
+        block = k // BLOCK_SIZE
+        return (cumulative[block].astype(np.int64) +
+                self._count(strokes, block * BLOCK_SIZE, k))
+
+    def _range(self, cumulative: np.ndarray, strokes: StrokeTable,
+               i: int, j: int) -> np.ndarray:
+        if i // BLOCK_SIZE == j // BLOCK_SIZE:
+            return self._count(strokes, i, j)
+        return (self._prefix(cumulative, strokes, j) -
+                self._prefix(cumulative, strokes, i))
+
+    def _cumulative(self, strokes: StrokeTable) -> np.ndarray:
+        blocks = len(strokes) // BLOCK_SIZE
+        hi = strokes.Offsets[blocks * BLOCK_SIZE]
+        lengths = np.diff(strokes.Offsets[:blocks * BLOCK_SIZE + 1])
+        sample_blocks = np.repeat(
+            np.arange(blocks * BLOCK_SIZE) // BLOCK_SIZE, lengths)
+        columns = (np.tile(sample_blocks, 3) * self._columns +
+                   self._sample_columns(strokes, 0, hi))
+        counts = np.bincount(columns, minlength=blocks * self._columns)
+        cumulative = np.zeros((blocks + 1, self._columns), dtype=np.uint32)
+        cumulative[1:] = np.cumsum(counts.reshape(blocks, self._columns),
+                                   axis=0)
+        return cumulative
+
+    def histograms(self, strokes: Strokes,
+                   rows: tuple[(int, int), (int, int)]) -> (
+                   np.ndarray, np.ndarray, np.ndarray):
+        counts = np.zeros(self._columns, dtype=np.int64)
+        for cumulative, table, (i, j) in (
+                (self.Compressions, strokes.Compressions, rows[0]),
+                (self.Rebounds, strokes.Rebounds, rows[1])):
+            counts += self._range(cumulative, table, i, j)
+
+        travel = counts[:self._velocity_offset]
+        velocity = counts[self._velocity_offset:self._fine_velocity_offset]
+        fine_velocity = counts[self._fine_velocity_offset:]
+        return (
+            travel,
+            velocity.reshape(TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM, -1),
+            fine_velocity.reshape(TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM, -1))
+
+
+def _suspension_index(suspension: Suspension) -> HistogramIndex:
+    if not suspension.Present:
+        return None
+    index = HistogramIndex(
+        TravelBins=len(suspension.TravelBins) - 1,
+        VelocityBins=len(suspension.VelocityBins) - 1,
+        FineVelocityBins=len(suspension.FineVelocityBins) - 1,
+        Compressions=None,
+        Rebounds=None,
+    )
+    index.Compressions = index._cumulative(suspension.Strokes.Compressions)
+    index.Rebounds = index._cumulative(suspension.Strokes.Rebounds)
+    return index
+
+
+def build_histogram_index(telemetry: Telemetry) -> (
+                          dict[str, HistogramIndex]):
+    return dict(
+        front=_suspension_index(telemetry.Front),
+        rear=_suspension_index(telemetry.Rear),
+    )
+
+
+def _pack_array(a: np.ndarray) -> dict:
+    return dict(shape=a.shape, data=a.astype('<u4').tobytes())
+
+
+def _unpack_array(d: dict) -> np.ndarray:
+    return np.frombuffer(d['data'], dtype='<u4').reshape(d['shape'])
+
+
+def pack_histogram_index(index: dict[str, HistogramIndex]) -> bytes:
+    return msgpack.packb({k: None if v is None else dict(
+        TravelBins=v.TravelBins,
+        VelocityBins=v.VelocityBins,
+        FineVelocityBins=v.FineVelocityBins,
+        Compressions=_pack_array(v.Compressions),
+        Rebounds=_pack_array(v.Rebounds),
+    ) for k, v in index.items()})
+
+
+def unpack_histogram_index(data: bytes) -> dict[str, HistogramIndex]:
+    return {k: None if v is None else HistogramIndex(
+        TravelBins=v['TravelBins'],
+        VelocityBins=v['VelocityBins'],
+        FineVelocityBins=v['FineVelocityBins'],
+        Compressions=_unpack_array(v['Compressions']),
+        Rebounds=_unpack_array(v['Rebounds']),
+    ) for k, v in msgpack.unpackb(data).items()}
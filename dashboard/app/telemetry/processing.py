@@ -0,0 +1,559 @@
+import csv
+import io
+import math
+import struct
+import uuid
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Callable
+
+from scipy.signal import savgol_filter
+
+from app.models.calibration import Calibration as CalibrationModel
+from app.models.calibration import CalibrationMethod, calibration_programs
+from app.models.linkage import Linkage as LinkageModel
+from app.models.setup import Setup
+from app.telemetry.psst import (
+    Airtime,
+    Calibration,
+    Linkage,
+    StrokeTable,
+    Strokes,
+    Suspension,
+    Telemetry,
+    _ranges
+)
+
+
+# Processing parameters, same as in gosst/formats/psst.
+VELOCITY_ZERO_THRESHOLD = 0.02  # (mm/s) maximum velocity to be considered 0
+IDLING_DURATION_THRESHOLD = 0.10  # (s) minimum duration of an idle period
+AIRTIME_DURATION_THRESHOLD = 0.20  # (s) minimum duration of an airtime
+# (mm/s) minimum velocity after stroke to consider it an airtime
+AIRTIME_VELOCITY_THRESHOLD = 500
+# f&r airtime candidates must overlap at least this amount to be an airtime
+AIRTIME_OVERLAP_THRESHOLD = 0.5
+# stroke f&r mean travel must be below max*this to be an airtime
+AIRTIME_TRAVEL_MEAN_THRESHOLD_RATIO = 0.04
+# (mm) minimum length to consider stroke a compression/rebound
+STROKE_LENGTH_THRESHOLD = 5
+TRAVEL_HIST_BINS = 20  # number of travel histogram bins
+VELOCITY_HIST_STEP = 100.0  # (mm/s) step between velocity histogram bins
+VELOCITY_HIST_STEP_FINE = 15.0  # (mm/s) step between fine velocity bins
+# (mm) bottomouts are regions where travel > max_travel - this value
+BOTTOMOUT_THRESHOLD = 3
+VELOCITY_FILTER_WINDOW = 51
+VELOCITY_FILTER_ORDER = 3
+
+NORMALIZED_VERSION = 255
+_SST_HEADER = struct.Struct('<3sBHHq')
+_SST_ERROR_THRESHOLD = 0x0050
+
+
+@dataclass
+class Meta:
+    Name: str
+    Version: int
+    SampleRate: int
+    Timestamp: int
+
+
+@dataclass
+class Calibrator:
+    """A calibration as stored in the PSST payload, along with the function
+    that turns an array of raw samples into measurements."""
+
+    Calibration: Calibration
+    evaluate: Callable[[np.ndarray], np.ndarray]
+
+
+def raw_from_sst(data: bytes) -> (np.ndarray, np.ndarray, Meta):
+    """Returns the raw front and rear samples (None if the sensor was
+    missing) and the metadata of an SST file."""
+
+    if len(data) < _SST_HEADER.size:
+        raise ValueError("Data is not SST format")
+    magic, version, sample_rate, _, timestamp = _SST_HEADER.unpack_from(data)
+    if magic != b'SST':
+        raise ValueError("Data is not SST format")
+    count = (len(data) - _SST_HEADER.size) // 4
+    if count == 0:
+        raise ValueError("SST file has no records")
+    records = np.frombuffer(data, dtype='<u2', count=count * 2,
+                            offset=_SST_HEADER.size).reshape(count, 2)
+    meta = Meta(Name=None, Version=version, SampleRate=sample_rate,
+                Timestamp=timestamp)
+
+    def column(values: np.ndarray) -> np.ndarray:
+        if values[0] == 0xffff:
+            return None
+        # Rudimentary attempt to fix datasets where the sensor jumps to an
+        # unreasonably large number after a few tenth of seconds, but
+        # measures everything correctly from that baseline.
+        error = np.uint16(0)
+        above = np.flatnonzero(values[1:] > values[0])
+        if len(above):
+            first = values[above[0] + 1]
+            if first - values[0] > _SST_ERROR_THRESHOLD:
+                error = first
+        return values - error  # wraps around, just like in gosst
+
+    return column(records[:, 0]), column(records[:, 1]), meta
+
+
+def raw_from_normalized(data: str) -> (np.ndarray, np.ndarray):
+    """Returns the front and rear samples of a normalized (0-1 or
+    percentage) CSV dataset with Fork and/or Shock columns."""
+
+    reader = csv.reader(io.StringIO(data), delimiter=';')
+    header = next(reader, [])
+    fork = header.index('Fork') if 'Fork' in header else None
+    shock = header.index('Shock') if 'Shock' in header else None
+    if fork is None and shock is None:
+        raise ValueError("Fork or Shock column is required")
+    rows = list(reader)
+
+    def column(idx: int) -> np.ndarray:
+        if idx is None:
+            return None
+        values = np.zeros(len(rows))
+        for i, row in enumerate(rows):
+            try:
+                values[i] = float(row[idx])
+            except (IndexError, ValueError):
+                pass
+        return values
+
+    front, rear = column(fork), column(shock)
+    # If there are samples larger than 1, we treat the dataset as percentage
+    # values.
+    if any(v is not None and np.any(v > 1) for v in (front, rear)):
+        front = front / 100.0 if front is not None else None
+        rear = rear / 100.0 if rear is not None else None
+    return front, rear
+
+
+def linkage_from_raw(name: str, head_angle: float, front_stroke: float,
+                     rear_stroke: float, data: str) -> Linkage:
+    """Builds the PSST linkage from the "wheel travel,leverage ratio" lines of
+    a linkage, fitting a cubic shock travel -> wheel travel polynomial."""
+
+    records = []
+    shock, prev_wheel = 0.0, 0.0
+    for line in data.splitlines():
+        try:
+            wheel, leverage = (float(v) for v in line.split(','))
+        except ValueError:
+            continue
+        records.append((shock, wheel, leverage))
+        shock += (wheel - prev_wheel) / leverage
+        prev_wheel = wheel
+    if not records:
+        raise ValueError("Linkage has no leverage ratio data")
+    records = np.array(records)
+
+    coeffs = np.polynomial.polynomial.polyfit(records[:, 0], records[:, 1], 3)
+    return Linkage(
+        Name=name,
+        HeadAngle=head_angle,
+        MaxFrontStroke=front_stroke,
+        MaxRearStroke=rear_stroke,
+        MaxFrontTravel=math.sin(head_angle * math.pi / 180.0) * front_stroke,
+        MaxRearTravel=float(np.polynomial.polynomial.polyval(rear_stroke,
+                                                             coeffs)),
+        LeverageRatio=records[:, 1:],
+        ShockWheelCoeffs=coeffs,
+    )
+
+
+def _linspace(mn: float, mx: float, num: int) -> np.ndarray:
+    # Not np.linspace, so that the bins are computed exactly as in gosst.
+    return mn + (mx - mn) / (num - 1) * np.arange(num)
+
+
+def _digitize(data: np.ndarray, bins: np.ndarray) -> np.ndarray:
+    # Bin indices starting at 0, where a value exactly on a boundary goes to
+    # the bin starting there, and values at or above the last boundary go to
+    # the bin before that.
+    i = np.searchsorted(bins, data, side='left')
+    on_boundary = bins[np.minimum(i, len(bins) - 1)] == data
+    return i - ((data >= bins[-1]) | ~on_boundary)
+
+
+def _digitize_velocity(v: np.ndarray, step: float) -> (np.ndarray,
+                                                       np.ndarray):
+    # Subtracting half bin ensures that 0 will be at the middle of one bin,
+    # adding 1.5 bins ensures that all values will fit in bins, and that the
+    # last bin fits the step boundary.
+    mn = (math.floor(np.min(v) / step) - 0.5) * step
+    mx = (math.floor(np.max(v) / step) + 1.5) * step
+    bins = _linspace(mn, mx, int((mx - mn) / step) + 1)
+    return bins, _digitize(v, bins)
+
+
+def _sign(v: np.ndarray) -> np.ndarray:
+    return np.where(np.abs(v) <= VELOCITY_ZERO_THRESHOLD, 0,
+                    np.where(np.signbit(v), -1, 1))
+
+
+def _reduce(ufunc: np.ufunc, values: np.ndarray, start: np.ndarray,
+            end: np.ndarray) -> np.ndarray:
+    # ufunc over values[start[k]:end[k]+1] for each k (ranges are ordered and
+    # do not overlap).
+    indices = np.empty(2 * len(start), dtype=np.intp)
+    indices[0::2] = start
+    indices[1::2] = end + 1
+    padded = np.append(values, values[:1])
+    return ufunc.reduceat(padded, indices)[0::2]
+
+
+@dataclass
+class _Strokes:
+    # All strokes of a suspension, before categorization.
+    Start: np.ndarray
+    End: np.ndarray
+    Count: np.ndarray
+    length: np.ndarray
+    duration: np.ndarray
+    SumTravel: np.ndarray
+    MaxTravel: np.ndarray
+    SumVelocity: np.ndarray
+    MaxVelocity: np.ndarray
+    Bottomouts: np.ndarray
+
+
+def _filter_strokes(velocity: np.ndarray, travel: np.ndarray,
+                    max_travel: float, rate: int) -> _Strokes:
+    # Strokes are the runs of samples where the sign of velocity does not
+    # change. A last run consisting of only the last sample is dropped.
+    n = len(velocity)
+    changes = np.flatnonzero(np.diff(_sign(velocity))) + 1
+    start = np.concatenate(([0], changes[changes < n - 1]))
+    end = np.append(start[1:] - 1,
+                    n - 2 if len(changes) and changes[-1] == n - 1 else n - 1)
+    count = end - start + 1
+    duration = count / rate
+    peak = _reduce(np.maximum, travel, start, end)
+
+    # Topout periods often oscillate a bit, so they are split to multiple
+    # strokes. We fix this by concatenating consecutive strokes if their
+    # maximum position is close to zero. The statistics of the first one are
+    # kept as-is.
+    small = peak < STROKE_LENGTH_THRESHOLD
+    merged = np.zeros(len(start), dtype=bool)
+    merged[1:] = small[1:] & small[:-1]
+    heads = np.flatnonzero(~merged)
+    group_end = np.append(heads[1:] - 1, len(start) - 1)
+    stroke_duration = duration[heads]
+    group = np.cumsum(~merged) - 1
+    for k in np.flatnonzero(merged):
+        # Added one by one, like the running sum in gosst.
+        stroke_duration[group[k]] += duration[k]
+
+    start, head_end, count = start[heads], end[heads], count[heads]
+    length = travel[head_end] - travel[start]
+    max_velocity = np.where(length < 0,
+                            _reduce(np.minimum, velocity, start, head_end),
+                            _reduce(np.maximum, velocity, start, head_end))
+    above = travel > max_travel - BOTTOMOUT_THRESHOLD
+    region_starts = np.cumsum(above & ~np.append(False, above[:-1]))
+    bottomouts = (above[start].astype(np.intp) +
+                  region_starts[head_end] - region_starts[start])
+    return _Strokes(
+        Start=start,
+        End=end[group_end],
+        Count=count,
+        length=length,
+        duration=stroke_duration,
+        SumTravel=_reduce(np.add, travel, start, head_end),
+        MaxTravel=peak[heads],
+        SumVelocity=_reduce(np.add, velocity, start, head_end),
+        MaxVelocity=max_velocity,
+        Bottomouts=bottomouts,
+    )
+
+
+def _stroke_table(strokes: _Strokes, rows: np.ndarray, dt: np.ndarray,
+                  dv: np.ndarray, dv_fine: np.ndarray) -> StrokeTable:
+    start, end = strokes.Start[rows], strokes.End[rows]
+    lengths = end - start + 1
+    samples = _ranges(start, lengths)
+    return StrokeTable(
+        Start=start,
+        End=end,
+        Count=strokes.Count[rows],
+        SumTravel=strokes.SumTravel[rows],
+        MaxTravel=strokes.MaxTravel[rows],
+        SumVelocity=strokes.SumVelocity[rows],
+        MaxVelocity=strokes.MaxVelocity[rows],
+        Bottomouts=strokes.Bottomouts[rows],
+        Offsets=np.concatenate(([0], np.cumsum(lengths))),
+        DigitizedTravel=dt[samples],
+        DigitizedVelocity=dv[samples],
+        FineDigitizedVelocity=dv_fine[samples],
+    )
+
+
+def _empty_suspension(calibrator: Calibrator) -> Suspension:
+    empty = np.empty(0)
+    none = np.empty(0, dtype=np.intp)
+    no_strokes = _stroke_table(_Strokes(*(none for _ in range(10))),
+                               none, none, none, none)
+    return Suspension(
+        Present=False,
+        Calibration=calibrator.Calibration if calibrator else None,
+        Travel=empty,
+        Velocity=empty,
+        Strokes=Strokes(Compressions=no_strokes, Rebounds=no_strokes),
+        TravelBins=empty,
+        VelocityBins=empty,
+        FineVelocityBins=empty,
+    )
+
+
+def _process_suspension(travel: np.ndarray, max_travel: float, rate: int,
+                        calibrator: Calibrator) -> (Suspension, np.ndarray):
+    # Returns the suspension, along with the idling strokes that might be
+    # airtimes (as rows of [Start, End]).
+    if len(travel) < VELOCITY_FILTER_WINDOW:
+        raise ValueError("Not enough records")
+
+    travel_bins = _linspace(0, max_travel, TRAVEL_HIST_BINS + 1)
+    dt = _digitize(travel, travel_bins)
+    velocity = savgol_filter(travel, VELOCITY_FILTER_WINDOW,
+                             VELOCITY_FILTER_ORDER, deriv=1,
+                             delta=1.0 / rate, mode='interp')
+    velocity_bins, dv = _digitize_velocity(velocity, VELOCITY_HIST_STEP)
+    fine_velocity_bins, dv_fine = _digitize_velocity(velocity,
+                                                     VELOCITY_HIST_STEP_FINE)
+
+    strokes = _filter_strokes(velocity, travel, max_travel, rate)
+    idling = ((np.abs(strokes.length) < STROKE_LENGTH_THRESHOLD) &
+              (strokes.duration >= IDLING_DURATION_THRESHOLD))
+    compressions = np.flatnonzero(
+        ~idling & (strokes.length >= STROKE_LENGTH_THRESHOLD))
+    rebounds = np.flatnonzero(
+        ~idling & (strokes.length <= -STROKE_LENGTH_THRESHOLD))
+
+    # Idling strokes are tagged as possible airtimes if suitable. Whether or
+    # not they really are, is decided based on both front and rear
+    # candidates.
+    next_velocity = np.append(strokes.MaxVelocity[1:], -np.inf)
+    candidate = (idling &
+                 (strokes.MaxTravel <= STROKE_LENGTH_THRESHOLD) &
+                 (strokes.duration >= AIRTIME_DURATION_THRESHOLD) &
+                 (next_velocity >= AIRTIME_VELOCITY_THRESHOLD))
+    if len(candidate):
+        candidate[0] = False
+    candidates = np.flatnonzero(candidate)
+
+    suspension = Suspension(
+        Present=len(compressions) != 0 or len(rebounds) != 0,
+        Calibration=calibrator.Calibration,
+        Travel=travel,
+        Velocity=velocity,
+        Strokes=Strokes(
+            Compressions=_stroke_table(strokes, compressions, dt, dv,
+                                       dv_fine),
+            Rebounds=_stroke_table(strokes, rebounds, dt, dv, dv_fine),
+        ),
+        TravelBins=travel_bins,
+        VelocityBins=velocity_bins,
+        FineVelocityBins=fine_velocity_bins,
+    )
+    return suspension, np.column_stack((strokes.Start[candidates],
+                                        strokes.End[candidates]))
+
+
+def _overlaps(a: np.ndarray, b: np.ndarray) -> bool:
+    length = max(a[1] - a[0], b[1] - b[0])
+    overlap = min(a[1], b[1]) - max(a[0], b[0])
+    return (np.float32(overlap) >=
+            np.float32(AIRTIME_OVERLAP_THRESHOLD) * np.float32(length))
+
+
+def _airtimes(telemetry: Telemetry, front_candidates: np.ndarray,
+              rear_candidates: np.ndarray) -> list[Airtime]:
+    rate = telemetry.SampleRate
+    front, rear = telemetry.Front, telemetry.Rear
+    airtimes = []
+    if front.Present and rear.Present:
+        front_left = [True] * len(front_candidates)
+        rear_left = [True] * len(rear_candidates)
+        for i, f in enumerate(front_candidates):
+            for j, r in enumerate(rear_candidates):
+                if rear_left[j] and _overlaps(f, r):
+                    front_left[i] = rear_left[j] = False
+                    airtimes.append(Airtime(
+                        Start=float(min(f[0], r[0])) / rate,
+                        End=float(min(f[1], r[1])) / rate))
+                    break
+        max_mean = (telemetry.Linkage.MaxFrontTravel +
+                    telemetry.Linkage.MaxRearTravel) / 2.0
+        remaining = ([c for c, left in zip(front_candidates, front_left)
+                      if left] +
+                     [c for c, left in zip(rear_candidates, rear_left)
+                      if left])
+        for s, e in remaining:
+            mean = (np.mean(front.Travel[s:e + 1]) +
+                    np.mean(rear.Travel[s:e + 1])) / 2
+            if mean <= max_mean * AIRTIME_TRAVEL_MEAN_THRESHOLD_RATIO:
+                airtimes.append(Airtime(Start=float(s) / rate,
+                                        End=float(e) / rate))
+    elif front.Present or rear.Present:
+        candidates = front_candidates if front.Present else rear_candidates
+        airtimes = [Airtime(Start=float(s) / rate, End=float(e) / rate)
+                    for s, e in candidates]
+    return airtimes
+
+
+def process_recording(front: np.ndarray, rear: np.ndarray, meta: Meta,
+                      linkage: Linkage, front_calibrator: Calibrator,
+                      rear_calibrator: Calibrator) -> Telemetry:
+    """Computes travel, velocity, strokes and airtimes from raw samples.
+
+    Equivalent to ProcessRecording in gosst/formats/psst, but vectorized.
+    """
+
+    front = np.empty(0) if front is None else np.asarray(front)
+    rear = np.empty(0) if rear is None else np.asarray(rear)
+    if len(front) == 0 and len(rear) == 0:
+        raise ValueError("Front and rear record arrays are empty")
+    if len(front) and len(rear) and len(front) != len(rear):
+        raise ValueError("Front and rear record counts are not equal")
+    for records, calibrator in ((front, front_calibrator),
+                                (rear, rear_calibrator)):
+        if len(records) and calibrator is None:
+            raise ValueError("Calibration is missing")
+
+    rate = meta.SampleRate
+    front_candidates = rear_candidates = np.empty((0, 2), dtype=np.intp)
+    front_suspension = _empty_suspension(front_calibrator)
+    rear_suspension = _empty_suspension(rear_calibrator)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if len(front):
+            # Travel might under/overshoot because of erroneous data
+            # acquisition, or inaccuracies of the leverage ratio data and
+            # the polynomial fitting, so it is capped.
+            coeff = math.sin(linkage.HeadAngle * math.pi / 180.0)
+            travel = front_calibrator.evaluate(front.astype(np.float64))
+            travel = np.minimum(np.maximum(travel * coeff, 0),
+                                linkage.MaxFrontTravel)
+            front_suspension, front_candidates = _process_suspension(
+                travel, linkage.MaxFrontTravel, rate, front_calibrator)
+        if len(rear):
+            travel = np.polynomial.polynomial.polyval(
+                rear_calibrator.evaluate(rear.astype(np.float64)),
+                linkage.ShockWheelCoeffs)
+            travel = np.minimum(np.maximum(travel, 0), linkage.MaxRearTravel)
+            rear_suspension, rear_candidates = _process_suspension(
+                travel, linkage.MaxRearTravel, rate, rear_calibrator)
+
+    telemetry = Telemetry(
+        Name=meta.Name,
+        Version=meta.Version,
+        SampleRate=rate,
+        Timestamp=meta.Timestamp,
+        Front=front_suspension,
+        Rear=rear_suspension,
+        Linkage=linkage,
+        Airtimes=[],
+    )
+    telemetry.Airtimes = _airtimes(telemetry, front_candidates,
+                                   rear_candidates)
+    return telemetry
+
+
+def fraction_calibrator(max_stroke: float) -> Calibrator:
+    """Calibration of normalized datasets, where samples are fractions of the
+    maximum stroke."""
+
+    return Calibrator(
+        Calibration=Calibration(Name='Fraction', MethodId=uuid.UUID(int=0),
+                                Inputs={}),
+        evaluate=lambda samples: samples * max_stroke,
+    )
+
+
+def linkage_from_model(linkage: LinkageModel) -> Linkage:
+    return linkage_from_raw(linkage.name, linkage.head_angle,
+                            linkage.front_stroke, linkage.rear_stroke,
+                            linkage.data)
+
+
+@dataclass
+class MethodSource:
+    """The parts of a calibration method needed to build its program."""
+
+    id: uuid.UUID
+    updated: int
+    properties: dict
+
+
+@dataclass
+class SetupSource:
+    """Linkage and calibrations of a setup as plain, picklable values.
+
+    Holds everything needed to process a recording, so that processing can
+    run in worker processes without database access.
+    """
+
+    Linkage: Linkage
+    FrontCalibration: Calibration = None
+    FrontMethod: MethodSource = None
+    RearCalibration: Calibration = None
+    RearMethod: MethodSource = None
+
+    @staticmethod
+    def _calibrator(calibration: Calibration, method: MethodSource,
+                    max_stroke: float, max_travel: float) -> Calibrator:
+        if calibration is None:
+            return None
+        program = calibration_programs.get(method)
+        return Calibrator(
+            Calibration=calibration,
+            evaluate=program.calibration(calibration.Inputs, max_stroke,
+                                         max_travel),
+        )
+
+    def data(self) -> (Linkage, Calibrator, Calibrator):
+        linkage = self.Linkage
+        return (
+            linkage,
+            self._calibrator(self.FrontCalibration, self.FrontMethod,
+                             linkage.MaxFrontStroke, linkage.MaxFrontTravel),
+            self._calibrator(self.RearCalibration, self.RearMethod,
+                             linkage.MaxRearStroke, linkage.MaxRearTravel),
+        )
+
+
+def _calibration_source(id: uuid.UUID) -> (Calibration, MethodSource):
+    calibration = CalibrationModel.get(id) if id else None
+    if not calibration:
+        return None, None
+    method = CalibrationMethod.get(calibration.method_id)
+    if not method:
+        raise ValueError("Calibration method does not exist")
+    return (
+        Calibration(Name=calibration.name, MethodId=calibration.method_id,
+                    Inputs=calibration.inputs),
+        MethodSource(id=method.id, updated=method.updated,
+                     properties=method.properties),
+    )
+
+
+def setup_source(setup: Setup) -> SetupSource:
+    linkage = LinkageModel.get(setup.linkage_id) if setup else None
+    if not linkage:
+        raise ValueError("Setup or linkage does not exist")
+    front = _calibration_source(setup.front_calibration_id)
+    rear = _calibration_source(setup.rear_calibration_id)
+    return SetupSource(linkage_from_model(linkage), *front, *rear)
+
+
+def setup_data(setup: Setup) -> (Linkage, Calibrator, Calibrator):
+    """Returns the linkage and the front and rear calibrators of a setup."""
+
+    return setup_source(setup).data()
@@ -1,6 +1,15 @@
+import msgpack
+import numpy as np
 import uuid
 
 from dataclasses import dataclass
+from functools import cached_property, partial
+from itertools import chain
+
+
+PSST_VERSION_1 = 1
+PSST_VERSION_2 = 2
+PSST_VERSIONS = (PSST_VERSION_1, PSST_VERSION_2)
 
 
 @dataclass
@@ -11,8 +20,8 @@ class Linkage:
     MaxRearStroke: float
     MaxFrontTravel: float
     MaxRearTravel: float
-    LeverageRatio: list[float]
-    ShockWheelCoeffs: list[float]
+    LeverageRatio: np.ndarray
+    ShockWheelCoeffs: np.ndarray
 
 
 @dataclass
@@ -21,38 +30,146 @@ class Calibration:
     MethodId: uuid.UUID
     Inputs: dict[str: float]
 
-    def __post_init__(self):
-        self.MethodId = uuid.UUID(self.MethodId)
 
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # Concatenation of arange(start, start + length) for each pair.
+    offsets = np.cumsum(lengths) - lengths
+    return (np.repeat(starts - offsets, lengths) +
+            np.arange(np.sum(lengths), dtype=np.intp))
 
-@dataclass
-class StrokeStat:
-    SumTravel: float
-    MaxTravel: float
-    SumVelocity: float
-    MaxVelocity: float
-    Bottomouts: int
-    Count: int
+
+def sequential_sum(values: np.ndarray) -> float:
+    # Sums values strictly in order (np.sum uses pairwise summation), so that
+    # aggregated statistics are bit-for-bit the same as a running sum.
+    return np.cumsum(values)[-1] if len(values) else 0
+
+
+STROKE_TABLE_COLUMNS = (
+    'Start', 'End', 'Count', 'SumTravel', 'MaxTravel', 'SumVelocity',
+    'MaxVelocity', 'Bottomouts', 'Offsets', 'DigitizedTravel',
+    'DigitizedVelocity', 'FineDigitizedVelocity')
 
 
 @dataclass
-class Stroke:
-    Start: int
-    End: int
-    Stat: StrokeStat
-    DigitizedTravel: list[int]
-    DigitizedVelocity: list[int]
-    FineDigitizedVelocity: list[int]
+class StrokeTable:
+    """Structure-of-arrays representation of a list of strokes.
+
+    Per-stroke statistics are stored in parallel arrays, while the digitized
+    travel and velocity values of all strokes are concatenated into flat
+    arrays; the values of the i-th stroke are at Offsets[i]:Offsets[i+1].
+    """
+
+    Start: np.ndarray
+    End: np.ndarray
+    Count: np.ndarray
+    SumTravel: np.ndarray
+    MaxTravel: np.ndarray
+    SumVelocity: np.ndarray
+    MaxVelocity: np.ndarray
+    Bottomouts: np.ndarray
+    Offsets: np.ndarray
+    DigitizedTravel: np.ndarray
+    DigitizedVelocity: np.ndarray
+    FineDigitizedVelocity: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.Start)
+
+    def sample_indices(self) -> np.ndarray:
+        return _ranges(self.Start, self.Count)
+
+    def search(self, start: int, end: int) -> (int, int):
+        # Strokes are sorted by time and do not overlap, so both Start and End
+        # are ascending, and the strokes that are completely inside
+        # (start, end) form a contiguous range of rows.
+        if start is None or end is None:
+            return 0, len(self)
+        i = int(np.searchsorted(self.Start, start, side='right'))
+        j = int(np.searchsorted(self.End, end, side='left'))
+        return i, max(i, j)
+
+    def slice(self, i: int, j: int) -> 'StrokeTable':
+        # Everything except the (small) rebased offset array is a view.
+        lo, hi = self.Offsets[i], self.Offsets[j]
+        return StrokeTable(
+            Start=self.Start[i:j],
+            End=self.End[i:j],
+            Count=self.Count[i:j],
+            SumTravel=self.SumTravel[i:j],
+            MaxTravel=self.MaxTravel[i:j],
+            SumVelocity=self.SumVelocity[i:j],
+            MaxVelocity=self.MaxVelocity[i:j],
+            Bottomouts=self.Bottomouts[i:j],
+            Offsets=self.Offsets[i:j + 1] - lo,
+            DigitizedTravel=self.DigitizedTravel[lo:hi],
+            DigitizedVelocity=self.DigitizedVelocity[lo:hi],
+            FineDigitizedVelocity=self.FineDigitizedVelocity[lo:hi],
+        )
+
+    def select(self, rows: np.ndarray) -> 'StrokeTable':
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        lengths = np.diff(self.Offsets)[rows]
+        samples = _ranges(self.Offsets[rows], lengths)
+        return StrokeTable(
+            Start=self.Start[rows],
+            End=self.End[rows],
+            Count=self.Count[rows],
+            SumTravel=self.SumTravel[rows],
+            MaxTravel=self.MaxTravel[rows],
+            SumVelocity=self.SumVelocity[rows],
+            MaxVelocity=self.MaxVelocity[rows],
+            Bottomouts=self.Bottomouts[rows],
+            Offsets=np.concatenate(([0], np.cumsum(lengths))),
+            DigitizedTravel=self.DigitizedTravel[samples],
+            DigitizedVelocity=self.DigitizedVelocity[samples],
+            FineDigitizedVelocity=self.FineDigitizedVelocity[samples],
+        )
+
+    @staticmethod
+    def concatenate(tables: list['StrokeTable']) -> 'StrokeTable':
+        offsets = [tables[0].Offsets[:1]]
+        base = 0
+        for t in tables:
+            offsets.append(t.Offsets[1:] + base)
+            base += t.Offsets[-1]
+        return StrokeTable(
+            Start=np.concatenate([t.Start for t in tables]),
+            End=np.concatenate([t.End for t in tables]),
+            Count=np.concatenate([t.Count for t in tables]),
+            SumTravel=np.concatenate([t.SumTravel for t in tables]),
+            MaxTravel=np.concatenate([t.MaxTravel for t in tables]),
+            SumVelocity=np.concatenate([t.SumVelocity for t in tables]),
+            MaxVelocity=np.concatenate([t.MaxVelocity for t in tables]),
+            Bottomouts=np.concatenate([t.Bottomouts for t in tables]),
+            Offsets=np.concatenate(offsets),
+            DigitizedTravel=np.concatenate(
+                [t.DigitizedTravel for t in tables]),
+            DigitizedVelocity=np.concatenate(
+                [t.DigitizedVelocity for t in tables]),
+            FineDigitizedVelocity=np.concatenate(
+                [t.FineDigitizedVelocity for t in tables]),
+        )
 
 
 @dataclass
 class Strokes:
-    Compressions: list[Stroke]
-    Rebounds: list[Stroke]
+    Compressions: StrokeTable
+    Rebounds: StrokeTable
+
+    def all(self) -> StrokeTable:
+        return StrokeTable.concatenate([self.Compressions, self.Rebounds])
 
-    def __post_init__(self):
-        self.Compressions = [dataclass_from_dict(Stroke, d) for d in self.Compressions]
-        self.Rebounds = [dataclass_from_dict(Stroke, d) for d in self.Rebounds]
+    def search(self, start: int, end: int) -> tuple[(int, int), (int, int)]:
+        return (self.Compressions.search(start, end),
+                self.Rebounds.search(start, end))
+
+    def slice(self, rows: tuple[(int, int), (int, int)]) -> 'Strokes':
+        (ci, cj), (ri, rj) = rows
+        return Strokes(
+            Compressions=self.Compressions.slice(ci, cj),
+            Rebounds=self.Rebounds.slice(ri, rj),
+        )
 
 
 @dataclass
@@ -65,12 +182,12 @@ class Airtime:
 class Suspension:
     Present: bool
     Calibration: Calibration
-    Travel: list[float]
-    Velocity: list[float]
+    Travel: np.ndarray
+    Velocity: np.ndarray
     Strokes: Strokes
-    TravelBins: list[float]
-    VelocityBins: list[float]
-    FineVelocityBins: list[float]
+    TravelBins: np.ndarray
+    VelocityBins: np.ndarray
+    FineVelocityBins: np.ndarray
 
 
 @dataclass
@@ -84,8 +201,400 @@ class Telemetry:
     Linkage: Linkage
     Airtimes: list[Airtime]
 
-    def __post_init__(self):
-        self.Airtimes = [dataclass_from_dict(Airtime, d) for d in self.Airtimes]
+
+# The PSST msgpack payload is turned directly into the dataclasses above, with
+# sample arrays, histogram bins and stroke tables stored as NumPy arrays, so
+# that we don't have to build (and later iterate over) huge lists of Python
+# objects.
+#
+# Version 1 is the layout gosst writes: arrays are msgpack arrays, and stroke
+# tables are arrays of per-stroke maps. Version 2 is marked by a leading
+# "Format" key, and stores arrays as msgpack extension types holding the raw
+# little-endian buffer (the extension type determines the element type), and
+# stroke tables as maps of such columns. These are wrapped by np.frombuffer
+# without parsing individual values. Arrays decoded that way are read-only.
+
+_ARRAY_TYPES = {
+    2: np.dtype('<f4'),
+    3: np.dtype('<f8'),
+    4: np.dtype('u1'),
+    5: np.dtype('<u2'),
+    6: np.dtype('<i8'),
+}
+_ARRAY_CODES = {dtype: code for code, dtype in _ARRAY_TYPES.items()}
+
+
+def _ext_hook(code: int, data: bytes):
+    if code in _ARRAY_TYPES:
+        return np.frombuffer(data, dtype=_ARRAY_TYPES[code])
+    return msgpack.ExtType(code, data)
+
+
+def _array(values, dtype=np.float64) -> np.ndarray:
+    # Nil slices are encoded as None by the Go side.
+    if values is None:
+        return np.empty(0, dtype=dtype)
+    if isinstance(values, np.ndarray):
+        return values
+    return np.array(values, dtype=dtype)
+
+
+def _uuid(value) -> uuid.UUID:
+    # gosst encodes UUIDs as msgpack extension type 1 holding the string form.
+    if value is None:
+        return None
+    if isinstance(value, msgpack.ExtType):
+        value = value.data.decode('ascii')
+    if not isinstance(value, str):
+        raise ValueError(f"invalid UUID: {value!r}")
+    return uuid.UUID(value)
+
+
+def _calibration(d: dict) -> Calibration:
+    return Calibration(
+        Name=d.get('Name'),
+        MethodId=_uuid(d.get('MethodId')),
+        Inputs=d.get('Inputs'),
+    )
+
+
+def _stroke_table(strokes: tuple[dict]) -> StrokeTable:
+    strokes = strokes or ()
+    stats = [s['Stat'] for s in strokes]
+    lengths = np.fromiter((len(s['DigitizedTravel'] or ()) for s in strokes),
+                          dtype=np.intp, count=len(strokes))
+
+    def stat(name: str, dtype) -> np.ndarray:
+        return np.fromiter((st[name] for st in stats),
+                           dtype=dtype, count=len(stats))
+
+    def digitized(name: str) -> np.ndarray:
+        return np.fromiter(chain.from_iterable(s[name] or () for s in strokes),
+                           dtype=np.intp, count=np.sum(lengths))
+
+    table = StrokeTable(
+        Start=np.fromiter((s['Start'] for s in strokes),
+                          dtype=np.intp, count=len(strokes)),
+        End=np.fromiter((s['End'] for s in strokes),
+                        dtype=np.intp, count=len(strokes)),
+        Count=stat('Count', np.intp),
+        SumTravel=stat('SumTravel', np.float64),
+        MaxTravel=stat('MaxTravel', np.float64),
+        SumVelocity=stat('SumVelocity', np.float64),
+        MaxVelocity=stat('MaxVelocity', np.float64),
+        Bottomouts=stat('Bottomouts', np.intp),
+        Offsets=np.concatenate(([0], np.cumsum(lengths))),
+        DigitizedTravel=digitized('DigitizedTravel'),
+        DigitizedVelocity=digitized('DigitizedVelocity'),
+        FineDigitizedVelocity=digitized('FineDigitizedVelocity'),
+    )
+    # Range lookups rely on the strokes being ordered by time. gosst emits
+    # them in order, so this is normally a no-op.
+    if np.any(np.diff(table.Start) < 0):
+        table = table.select(np.argsort(table.Start, kind='stable'))
+    return table
+
+
+def _stroke_columns(d: dict) -> StrokeTable:
+    return StrokeTable(**{k: d[k] for k in STROKE_TABLE_COLUMNS})
+
+
+def _strokes(d: dict, version: int) -> Strokes:
+    table = _stroke_table if version == PSST_VERSION_1 else _stroke_columns
+    return Strokes(
+        Compressions=table(d['Compressions']),
+        Rebounds=table(d['Rebounds']),
+    )
+
+
+def _suspension(d: dict, version: int) -> Suspension:
+    return Suspension(
+        Present=d['Present'],
+        Calibration=_calibration(d['Calibration']),
+        Travel=_array(d['Travel']),
+        Velocity=_array(d['Velocity']),
+        Strokes=_strokes(d['Strokes'], version),
+        TravelBins=_array(d['TravelBins']),
+        VelocityBins=_array(d['VelocityBins']),
+        FineVelocityBins=_array(d['FineVelocityBins']),
+    )
+
+
+def _linkage(d: dict) -> Linkage:
+    return Linkage(
+        Name=d['Name'],
+        HeadAngle=d['HeadAngle'],
+        MaxFrontStroke=d['MaxFrontStroke'],
+        MaxRearStroke=d['MaxRearStroke'],
+        MaxFrontTravel=d['MaxFrontTravel'],
+        MaxRearTravel=d['MaxRearTravel'],
+        LeverageRatio=_array(d['LeverageRatio']),
+        ShockWheelCoeffs=_array(d['ShockWheelCoeffs']),
+    )
+
+
+def _unpack(data: bytes) -> (dict, int):
+    d = msgpack.unpackb(data, use_list=False, ext_hook=_ext_hook)
+    version = d.get('Format', PSST_VERSION_1)
+    if version not in PSST_VERSIONS:
+        raise ValueError(f"unsupported PSST version: {version}")
+    return d, version
+
+
+def psst_version(data: bytes) -> int:
+    # Only the first key is read, that is "Format" for every version but 1.
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(data[:16])
+    try:
+        unpacker.read_map_header()
+        if unpacker.unpack() == 'Format':
+            return unpacker.unpack()
+    except (msgpack.OutOfData, ValueError):
+        pass
+    return PSST_VERSION_1
+
+
+def telemetry_from_psst(data: bytes) -> Telemetry:
+    d, version = _unpack(data)
+    return Telemetry(
+        Name=d['Name'],
+        Version=d['Version'],
+        SampleRate=d['SampleRate'],
+        Timestamp=d['Timestamp'],
+        Front=_suspension(d['Front'], version),
+        Rear=_suspension(d['Rear'], version),
+        Linkage=_linkage(d['Linkage']),
+        Airtimes=_airtimes(d['Airtimes']),
+    )
+
+
+def _airtimes(values: tuple[dict]) -> list[Airtime]:
+    return [Airtime(Start=a['Start'], End=a['End']) for a in values or ()]
+
+
+def _index(buffer: memoryview) -> dict[str, (int, int)]:
+    # Byte ranges of the values of a msgpack map, found without decoding
+    # them. Skipping a msgpack array still has to step over its elements,
+    # skipping a version 2 buffer does not.
+    unpacker = msgpack.Unpacker(max_buffer_size=max(len(buffer), 1))
+    unpacker.feed(buffer)
+    sections = {}
+    for _ in range(unpacker.read_map_header()):
+        key = unpacker.unpack()
+        start = unpacker.tell()
+        unpacker.skip()
+        sections[key] = (start, unpacker.tell())
+    return sections
+
+
+def _section(name: str, decode=None) -> cached_property:
+    def get(self):
+        value = self._decode(name)
+        return decode(value) if decode else value
+    return cached_property(get)
+
+
+class _MapView:
+    def __init__(self, buffer: memoryview, version: int):
+        self._buffer = buffer
+        self._version = version
+        self._sections = _index(buffer)
+
+    def _slice(self, name: str) -> memoryview:
+        start, end = self._sections[name]
+        return self._buffer[start:end]
+
+    def _decode(self, name: str):
+        return msgpack.unpackb(self._slice(name), use_list=False,
+                               ext_hook=_ext_hook)
+
+    def decoded(self) -> dict:
+        """Sections that were decoded so far, by name."""
+
+        return {k: v for k, v in vars(self).items() if not k.startswith('_')}
+
+
+class SuspensionView(_MapView):
+    """A Suspension whose sections are decoded on first access."""
+
+    Present = _section('Present')
+    Calibration = _section('Calibration', _calibration)
+    Travel = _section('Travel', _array)
+    Velocity = _section('Velocity', _array)
+    TravelBins = _section('TravelBins', _array)
+    VelocityBins = _section('VelocityBins', _array)
+    FineVelocityBins = _section('FineVelocityBins', _array)
+
+    @cached_property
+    def Strokes(self) -> Strokes:
+        return _strokes(self._decode('Strokes'), self._version)
+
+
+class TelemetryView(_MapView):
+    """Telemetry backed by a PSST payload, read section by section.
+
+    Only the byte ranges of the top-level sections are located up front.
+    Each section (e.g. Front.Travel, Rear.Strokes, Linkage) is decoded on
+    first access, and kept afterwards. The payload must not change while
+    the view is in use.
+    """
+
+    def __init__(self, data: bytes):
+        super().__init__(memoryview(data), PSST_VERSION_1)
+        if 'Format' in self._sections:
+            self._version = self._decode('Format')
+        if self._version not in PSST_VERSIONS:
+            raise ValueError(f"unsupported PSST version: {self._version}")
+
+    @property
+    def nbytes(self) -> int:
+        return self._buffer.nbytes
+
+    Name = _section('Name')
+    Version = _section('Version')
+    SampleRate = _section('SampleRate')
+    Timestamp = _section('Timestamp')
+    Linkage = _section('Linkage', _linkage)
+    Airtimes = _section('Airtimes', _airtimes)
+
+    @cached_property
+    def Front(self) -> SuspensionView:
+        return SuspensionView(self._slice('Front'), self._version)
+
+    @cached_property
+    def Rear(self) -> SuspensionView:
+        return SuspensionView(self._slice('Rear'), self._version)
+
+
+def _list(values: np.ndarray) -> list:
+    return values.tolist() if len(values) else None
+
+
+def _pack_uuid(value: uuid.UUID) -> msgpack.ExtType:
+    value = value or uuid.UUID(int=0)
+    return msgpack.ExtType(1, str(value).encode('ascii'))
+
+
+def _pack_array(values: np.ndarray, dtype) -> msgpack.ExtType:
+    values = np.asarray(values, dtype=dtype)
+    return msgpack.ExtType(_ARRAY_CODES[values.dtype], values.tobytes())
+
+
+def _pack_indices(values: np.ndarray) -> msgpack.ExtType:
+    # Bin indices are stored in the smallest type that can hold them, which
+    # is almost always a single byte.
+    dtype = '<i8'
+    if len(values) == 0 or np.min(values) >= 0:
+        mx = np.max(values, initial=0)
+        if mx <= np.iinfo(np.uint8).max:
+            dtype = 'u1'
+        elif mx <= np.iinfo(np.uint16).max:
+            dtype = '<u2'
+    return _pack_array(values, dtype)
+
+
+def _pack_stroke_columns(table: StrokeTable) -> dict:
+    return dict(
+        Start=_pack_array(table.Start, '<i8'),
+        End=_pack_array(table.End, '<i8'),
+        Count=_pack_array(table.Count, '<i8'),
+        SumTravel=_pack_array(table.SumTravel, '<f8'),
+        MaxTravel=_pack_array(table.MaxTravel, '<f8'),
+        SumVelocity=_pack_array(table.SumVelocity, '<f8'),
+        MaxVelocity=_pack_array(table.MaxVelocity, '<f8'),
+        Bottomouts=_pack_array(table.Bottomouts, '<i8'),
+        Offsets=_pack_array(table.Offsets, '<i8'),
+        DigitizedTravel=_pack_indices(table.DigitizedTravel),
+        DigitizedVelocity=_pack_indices(table.DigitizedVelocity),
+        FineDigitizedVelocity=_pack_indices(table.FineDigitizedVelocity),
+    )
+
+
+def _pack_stroke_table(table: StrokeTable) -> list[dict]:
+    columns = {k: getattr(table, k).tolist() for k in STROKE_TABLE_COLUMNS}
+    offsets = columns['Offsets']
+    return [dict(
+        Start=columns['Start'][i],
+        End=columns['End'][i],
+        Stat=dict(
+            SumTravel=columns['SumTravel'][i],
+            MaxTravel=columns['MaxTravel'][i],
+            SumVelocity=columns['SumVelocity'][i],
+            MaxVelocity=columns['MaxVelocity'][i],
+            Bottomouts=columns['Bottomouts'][i],
+            Count=columns['Count'][i],
+        ),
+        DigitizedTravel=columns['DigitizedTravel'][lo:hi],
+        DigitizedVelocity=columns['DigitizedVelocity'][lo:hi],
+        FineDigitizedVelocity=columns['FineDigitizedVelocity'][lo:hi],
+    ) for i, (lo, hi) in enumerate(zip(offsets, offsets[1:]))]
+
+
+def _pack_suspension(s: Suspension, version: int) -> dict:
+    calibration = s.Calibration or Calibration(None, None, None)
+    if version == PSST_VERSION_1:
+        samples = bins = _list
+        table = _pack_stroke_table
+    else:
+        samples = partial(_pack_array, dtype='<f4')
+        bins = partial(_pack_array, dtype='<f8')
+        table = _pack_stroke_columns
+    return dict(
+        Present=s.Present,
+        Calibration=dict(
+            Name=calibration.Name,
+            MethodId=_pack_uuid(calibration.MethodId),
+            Inputs=calibration.Inputs,
+        ),
+        Travel=samples(s.Travel),
+        Velocity=samples(s.Velocity),
+        Strokes=dict(
+            Compressions=table(s.Strokes.Compressions),
+            Rebounds=table(s.Strokes.Rebounds),
+        ),
+        TravelBins=bins(s.TravelBins),
+        VelocityBins=bins(s.VelocityBins),
+        FineVelocityBins=bins(s.FineVelocityBins),
+    )
+
+
+def psst_from_telemetry(telemetry: Telemetry,
+                        version: int = PSST_VERSION_1) -> bytes:
+    """Encodes telemetry as a PSST payload. Version 1 is the same layout as
+    gosst writes, version 2 stores travel and velocity as float32."""
+
+    if version not in PSST_VERSIONS:
+        raise ValueError(f"unsupported PSST version: {version}")
+    linkage = telemetry.Linkage
+    header = {} if version == PSST_VERSION_1 else dict(Format=version)
+    return msgpack.packb(dict(
+        **header,
+        Name=telemetry.Name,
+        Version=telemetry.Version,
+        SampleRate=telemetry.SampleRate,
+        Timestamp=telemetry.Timestamp,
+        Front=_pack_suspension(telemetry.Front, version),
+        Rear=_pack_suspension(telemetry.Rear, version),
+        Linkage=dict(
+            Name=linkage.Name,
+            HeadAngle=linkage.HeadAngle,
+            MaxFrontStroke=linkage.MaxFrontStroke,
+            MaxRearStroke=linkage.MaxRearStroke,
+            MaxFrontTravel=linkage.MaxFrontTravel,
+            MaxRearTravel=linkage.MaxRearTravel,
+            LeverageRatio=_list(linkage.LeverageRatio),
+            ShockWheelCoeffs=_list(linkage.ShockWheelCoeffs),
+        ),
+        Airtimes=[dict(Start=a.Start, End=a.End) for a in telemetry.Airtimes],
+    ))
+
+
+def convert_psst(data: bytes, version: int) -> bytes:
+    """Re-encodes a PSST payload of any version as the given version."""
+
+    if psst_version(data) == version:
+        return data
+    return psst_from_telemetry(telemetry_from_psst(data), version)
 
 
 def _dfd(klass: type, d: dict):
@@ -1,4 +1,3 @@
-import msgpack
 import numpy as np
 import uuid
 
@@ -14,10 +13,16 @@ from app.extensions import db
 from app.models.session import Session
 from app.models.session_html import SessionHtml
 from app.telemetry.balance import balance_figure
+from app.telemetry.downsample import (
+    INITIAL_TRACE_WIDTH,
+    build_trace_pyramid,
+    trace_data
+)
 from app.telemetry.fft import fft_figure
 from app.telemetry.leverage import leverage_ratio_figure, shock_wheel_figure
 from app.telemetry.map import map_figure
 from app.telemetry.psst import Telemetry, dataclass_from_dict
+from app.telemetry.telemetry_cache import telemetry_cache
 from app.telemetry.travel import travel_figure, travel_histogram_figure
 from app.telemetry.velocity import velocity_figure
 from app.telemetry.velocity import (
@@ -26,16 +31,15 @@ from app.telemetry.velocity import (
 )
 
 
-def create_cache(session_id: uuid.UUID, lod: int, hst: int):
-    front_color, rear_color = Spectral11[1], Spectral11[2]
-
-    session = Session.get(session_id)
-    if not session:
-        return None
+def build_cache(session_id: uuid.UUID, telemetry: Telemetry,
+                hst: int) -> dict:
+    """Builds the Bokeh components of a session.
 
-    d = msgpack.unpackb(session.data)
-    telemetry = dataclass_from_dict(Telemetry, d)
+    Does not touch the database, so that it can run in a worker process. The
+    results are stored with `store_cache`.
+    """
 
+    front_color, rear_color = Spectral11[1], Spectral11[2]
     tick = 1.0 / telemetry.SampleRate  # time step length in seconds
 
     if telemetry.Front.Present:
@@ -88,8 +92,11 @@ def create_cache(session_id: uuid.UUID, lod: int, hst: int):
             rear_color,
             "Frequencies (rear)")
 
-    p_travel = travel_figure(telemetry, lod, front_color, rear_color)
-    p_velocity = velocity_figure(telemetry, lod, front_color, rear_color)
+    pyramid = build_trace_pyramid(telemetry)
+    trace = trace_data(telemetry, pyramid, None, None, INITIAL_TRACE_WIDTH)
+    p_travel = travel_figure(telemetry, trace['travel'], front_color,
+                             rear_color)
+    p_velocity = velocity_figure(trace['velocity'], front_color, rear_color)
     p_travel.x_range.js_link('start', p_velocity.x_range, 'start')
     p_travel.x_range.js_link('end', p_velocity.x_range, 'end')
     p_velocity.x_range.js_link('start', p_travel.x_range, 'start')
@@ -98,8 +105,8 @@ def create_cache(session_id: uuid.UUID, lod: int, hst: int):
     '''
     Leverage-related graphs. These are input data, not something measured.
     '''
-    p_lr = leverage_ratio_figure(
-        np.array(telemetry.Linkage.LeverageRatio), Spectral11[5])
+    p_lr = leverage_ratio_figure(telemetry.Linkage.LeverageRatio,
+                                 Spectral11[5])
     p_sw = shock_wheel_figure(telemetry.Linkage.ShockWheelCoeffs,
                               telemetry.Linkage.MaxRearStroke,
                               Spectral11[5])
@@ -210,8 +217,19 @@ def create_cache(session_id: uuid.UUID, lod: int, hst: int):
         args=dict(), code='SST.init_models();'))
 
     script, divs = components(document.roots, theme=dark_minimal_theme)
-    components_data = dict(zip(columns, [session_id, script] + list(divs)))
-    session_html = dataclass_from_dict(SessionHtml, components_data)
+    return dict(zip(columns, [session_id, script] + list(divs)))
 
+
+def store_cache(components_data: dict):
+    session_html = dataclass_from_dict(SessionHtml, components_data)
     db.session.add(session_html)
     db.session.commit()
+
+
+def create_cache(session_id: uuid.UUID, hst: int):
+    session = Session.get(session_id)
+    if not session:
+        return None
+
+    telemetry = telemetry_cache.get(session)
+    store_cache(build_cache(session_id, telemetry, hst))
@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+
+from app.telemetry.psst import Strokes, Suspension, Telemetry, sequential_sum
+
+
+# Velocity (mm/s) above which a stroke sample counts as high speed. Same as
+# the threshold the dashboard is rendered with.
+HIGH_SPEED_THRESHOLD = 200
+
+
+def travel_stats(strokes: Strokes) -> (float, float, int):
+    s = strokes.all()
+    avg = sequential_sum(s.SumTravel) / np.sum(s.Count)
+    mx = np.max(s.MaxTravel, initial=0)
+    bo = np.sum(s.Bottomouts)
+    return avg, mx, bo
+
+
+def velocity_stats(strokes: Strokes) -> (float, float, float, float):
+    c = strokes.Compressions
+    avgc = sequential_sum(c.SumVelocity) / np.sum(c.Count)
+    maxc = np.max(c.MaxVelocity, initial=0)
+
+    r = strokes.Rebounds
+    avgr = sequential_sum(r.SumVelocity) / np.sum(r.Count)
+    maxr = np.min(r.MaxVelocity, initial=0)
+    return avgr, maxr, avgc, maxc
+
+
+def velocity_band_stats(strokes: Strokes, velocity: np.ndarray,
+                        high_speed_threshold: float) -> (
+                        float, float, float, float):
+    c = strokes.Compressions
+    lsc = np.count_nonzero(
+        velocity[c.sample_indices()] < high_speed_threshold)
+    hsc = np.sum(c.Count) - lsc
+
+    r = strokes.Rebounds
+    lsr = np.count_nonzero(
+        velocity[r.sample_indices()] > -high_speed_threshold)
+    hsr = np.sum(r.Count) - lsr
+
+    total_count = np.sum(c.Count) + np.sum(r.Count)
+
+    lsc = lsc / total_count * 100.0
+    hsc = hsc / total_count * 100.0
+    lsr = lsr / total_count * 100.0
+    hsr = hsr / total_count * 100.0
+
+    return hsr, lsr, lsc, hsc
+
+
+def _value(v) -> float | int:
+    # Stats of a suspension without strokes are NaN, they are stored as NULL.
+    v = v.item() if isinstance(v, np.generic) else v
+    return None if isinstance(v, float) and math.isnan(v) else v
+
+
+def _suspension_stats(suspension: Suspension) -> dict:
+    if not suspension.Present:
+        return {}
+    strokes = suspension.Strokes
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg, mx, bo = travel_stats(strokes)
+        avgr, maxr, avgc, maxc = velocity_stats(strokes)
+        hsr, lsr, lsc, hsc = velocity_band_stats(
+            strokes, suspension.Velocity, HIGH_SPEED_THRESHOLD)
+    stats = dict(
+        travel_avg=avg,
+        travel_max=mx,
+        bottomouts=bo,
+        velocity_avg_rebound=avgr,
+        velocity_max_rebound=maxr,
+        velocity_avg_compression=avgc,
+        velocity_max_compression=maxc,
+        hsr=hsr,
+        lsr=lsr,
+        lsc=lsc,
+        hsc=hsc,
+    )
+    return {k: _value(v) for k, v in stats.items()}
+
+
+def session_stats(telemetry: Telemetry) -> dict:
+    """Returns the summary statistics of a session, keyed by column name."""
+
+    stats = {}
+    for prefix, suspension in (('front_', telemetry.Front),
+                               ('rear_', telemetry.Rear)):
+        for k, v in _suspension_stats(suspension).items():
+            stats[prefix + k] = v
+    return stats
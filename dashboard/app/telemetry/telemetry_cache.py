@@ -0,0 +1,211 @@
+import threading
+import uuid
+
+from collections import OrderedDict
+from dataclasses import dataclass, fields, is_dataclass
+
+import numpy as np
+
+from flask import Flask
+
+from app.telemetry.psst import SuspensionView, TelemetryView
+
+
+DEFAULT_TELEMETRY_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class ResultCache:
+    """Small LRU mapping of results computed from a session's telemetry.
+
+    Meant to be stored with `TelemetryCache.get_derived`, so that results
+    are dropped along with the telemetry they were computed from.
+    """
+
+    def __init__(self, max_entries: int):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def values(self) -> list:
+        with self._lock:
+            return list(self._entries.values())
+
+
+def _nbytes(o) -> int:
+    # Only NumPy buffers and encoded results are counted; they make up the
+    # bulk of a decoded session, the rest is a few small Python objects.
+    if isinstance(o, np.ndarray):
+        return o.nbytes
+    if isinstance(o, bytes):
+        return len(o)
+    if isinstance(o, ResultCache):
+        return sum(_nbytes(v) for v in o.values())
+    if isinstance(o, TelemetryView):
+        # The payload the view holds on to, and the sections decoded so far.
+        return o.nbytes + sum(_nbytes(v) for v in o.decoded().values())
+    if isinstance(o, SuspensionView):
+        return sum(_nbytes(v) for v in o.decoded().values())
+    if is_dataclass(o):
+        return sum(_nbytes(getattr(o, f.name)) for f in fields(o))
+    if isinstance(o, (list, tuple)):
+        return sum(_nbytes(v) for v in o)
+    if isinstance(o, dict):
+        return sum(_nbytes(v) for v in o.values())
+    return 0
+
+
+@dataclass
+class _Entry:
+    updated: int
+    telemetry: TelemetryView
+    size: int
+    derived: dict
+
+
+@dataclass
+class TelemetryCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    size: int = 0
+    max_size: int = 0
+
+
+class TelemetryCache:
+    """In-process LRU cache of PSST payloads.
+
+    Payloads are kept as a `TelemetryView`, so only the sections requests
+    actually use are decoded. Since sections are decoded after an entry was
+    stored, the size of an entry is measured again whenever it is used.
+
+    Entries are keyed by session id and the session's `updated` timestamp, so
+    a stale entry is never returned for a session that was modified through
+    the ORM. Endpoints that replace the payload without touching `updated`
+    must call `invalidate` explicitly.
+
+    Data derived from the telemetry (e.g. downsampling pyramids) can be
+    stored along with it using `get_derived`, and shares its lifetime. It
+    is measured along with the entry.
+
+    Decoded telemetry is shared between requests, and must not be modified.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._stats = TelemetryCacheStats(
+            max_size=DEFAULT_TELEMETRY_CACHE_SIZE)
+
+    def init_app(self, app: Flask):
+        with self._lock:
+            self._entries.clear()
+            self._stats = TelemetryCacheStats(max_size=int(app.config.get(
+                'TELEMETRY_CACHE_SIZE', DEFAULT_TELEMETRY_CACHE_SIZE)))
+
+    def _evict(self):
+        while self._stats.size > self._stats.max_size and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._stats.size -= entry.size
+            self._stats.evictions += 1
+
+    def _measure(self, entry: _Entry):
+        size = (_nbytes(entry.telemetry) +
+                sum(_nbytes(v) for v in entry.derived.values()))
+        self._stats.size += size - entry.size
+        entry.size = size
+
+    def get(self, session) -> TelemetryView:
+        with self._lock:
+            entry = self._entries.get(session.id)
+            if entry and entry.updated == session.updated:
+                self._entries.move_to_end(session.id)
+                self._stats.hits += 1
+                self._measure(entry)
+                self._evict()
+                return entry.telemetry
+            self._stats.misses += 1
+            generation = self._generation
+
+        # Indexing happens outside the lock, so that a slow read does not
+        # block requests for other sessions.
+        telemetry = TelemetryView(session.data)
+        size = _nbytes(telemetry)
+        if size > self._stats.max_size:
+            return telemetry
+
+        with self._lock:
+            # Do not store the result if the cache was invalidated while we
+            # were decoding, because it might be from the replaced payload.
+            if generation != self._generation:
+                return telemetry
+            old = self._entries.pop(session.id, None)
+            if old:
+                self._stats.size -= old.size
+            self._entries[session.id] = _Entry(
+                session.updated, telemetry, size, {})
+            self._stats.size += size
+            self._evict()
+        return telemetry
+
+    def get_derived(self, session, name: str, build):
+        telemetry = self.get(session)
+        with self._lock:
+            entry = self._entries.get(session.id)
+            if entry and entry.telemetry is telemetry and (
+                    name in entry.derived):
+                return entry.derived[name]
+
+        value = build(telemetry)
+        with self._lock:
+            # The entry might have been evicted or replaced while building.
+            if entry and self._entries.get(session.id) is entry:
+                entry.derived[name] = value
+                self._measure(entry)
+                self._evict()
+        return value
+
+    def invalidate(self, session_id: uuid.UUID):
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.pop(session_id, None)
+            if entry:
+                self._stats.size -= entry.size
+                self._stats.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._stats.size = 0
+
+    def stats(self) -> TelemetryCacheStats:
+        with self._lock:
+            return TelemetryCacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                invalidations=self._stats.invalidations,
+                entries=len(self._entries),
+                size=self._stats.size,
+                max_size=self._stats.max_size,
+            )
+
+
+telemetry_cache = TelemetryCache()
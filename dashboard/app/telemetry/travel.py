@@ -11,28 +11,20 @@ from bokeh.palettes import Spectral11
 from bokeh.plotting import figure
 
 from app.telemetry.psst import Airtime, Strokes, Telemetry
+from app.telemetry.stats import travel_stats
 
 
 HISTOGRAM_RANGE_MULTIPLIER = 1.3
 
 
-def travel_figure(telemetry: Telemetry, lod: int,
+def travel_figure(telemetry: Telemetry, trace: dict[str, list],
                   front_color: tuple[str], rear_color: tuple[str]) -> figure:
-    length = len(telemetry.Front.Travel if telemetry.Front.Present else
-                 telemetry.Rear.Travel)
-    time = np.around(np.arange(0, length, lod) / telemetry.SampleRate, 4)
     front_max = telemetry.Linkage.MaxFrontTravel
     rear_max = telemetry.Linkage.MaxRearTravel
 
-    if telemetry.Front.Present:
-        tf_lod = np.around(telemetry.Front.Travel[::lod], 4)
-    else:
-        tf_lod = np.full(length, 0)[::lod]
-    if telemetry.Rear.Present:
-        tr_lod = np.around(telemetry.Rear.Travel[::lod], 4)
-    else:
-        tr_lod = np.full(length, 0)[::lod]
-    source = ColumnDataSource(data=dict(t=time, f=tf_lod, r=tr_lod,))
+    # The trace is a min/max envelope of the whole session; a more detailed
+    # one is fetched by the frontend for the visible range on zoom.
+    source = ColumnDataSource(name='ds_trace', data=trace)
     p = figure(
         name='travel',
         title="Wheel travel",
@@ -57,7 +49,11 @@ def travel_figure(telemetry: Telemetry, lod: int,
     p.extra_y_ranges = {'rear': Range1d(start=rear_max, end=0)}
     p.add_layout(LinearAxis(y_range_name='rear'), 'right')
 
-    p.x_range = Range1d(0, time[-1], bounds='auto')
+    p.x_range = Range1d(0, trace['t'][-1], bounds='auto')
+    p.x_range.js_on_change('start', CustomJS(
+        code='SST.update.trace(cb_obj.start, cb_obj.end);'))
+    p.x_range.js_on_change('end', CustomJS(
+        code='SST.update.trace(cb_obj.start, cb_obj.end);'))
 
     line = p.line(
         't', 'f',
@@ -146,22 +142,25 @@ def travel_figure(telemetry: Telemetry, lod: int,
     return p
 
 
-def _travel_histogram_data(strokes: Strokes, bins: list[float]) -> (
-                           dict[str, list[float]]):
-    hist = np.zeros(len(bins) - 1)
-    total_count = 0
-    for s in strokes.Compressions + strokes.Rebounds:
-        total_count += s.Stat.Count
-        for d in s.DigitizedTravel:
-            hist[d] += 1
+def _travel_histogram_data(strokes: Strokes, bins: np.ndarray,
+                           hist: np.ndarray = None) -> (
+                           dict[str, np.ndarray]):
+    # Histogram counts can be supplied by the caller, e.g. from a histogram
+    # index; otherwise they are counted from the strokes' digitized travel.
+    if hist is None:
+        hist = sum(np.bincount(s.DigitizedTravel, minlength=len(bins) - 1)
+                   for s in (strokes.Compressions, strokes.Rebounds))
+    total_count = (np.sum(strokes.Compressions.Count) +
+                   np.sum(strokes.Rebounds.Count))
     hist = hist / total_count * 100.0
-    return dict(y=bins[:-1], right=hist.tolist())
+    return dict(y=bins[:-1], right=hist)
 
 
-def travel_histogram_figure(strokes: Strokes, bins: list[float],
+def travel_histogram_figure(strokes: Strokes, bins: np.ndarray,
                             color: tuple[str], title: str) -> figure:
     max_travel = bins[-1]
-    data = _travel_histogram_data(strokes, bins)
+    data = {k: v.tolist()
+            for k, v in _travel_histogram_data(strokes, bins).items()}
     source = ColumnDataSource(name='ds_hist', data=data)
     p = figure(
         title=title,
@@ -187,17 +186,7 @@ def travel_histogram_figure(strokes: Strokes, bins: list[float],
 
 def _travel_stats(strokes: Strokes, max_travel: float) -> (
                   float, float, str, str):
-    sum = 0
-    count = 0
-    mx = 0
-    bo = 0
-    for s in strokes.Compressions + strokes.Rebounds:
-        sum += s.Stat.SumTravel
-        count += s.Stat.Count
-        bo += s.Stat.Bottomouts
-        if s.Stat.MaxTravel > mx:
-            mx = s.Stat.MaxTravel
-    avg = sum / count
+    avg, mx, bo = travel_stats(strokes)
 
     avg_text = f"avg.: {avg:.2f} mm ({avg/max_travel*100:.1f}%)"
     mx_text = (f"max.: {mx:.2f} mm ({mx/max_travel*100:.1f}%) / "
@@ -254,8 +243,9 @@ def _add_airtime_labels(p_travel: figure, airtimes: list[Airtime]):
         p_travel.add_layout(airtime_label)
 
 
-def update_travel_histogram(strokes: Strokes, bins: list[float]):
-    data = _travel_histogram_data(strokes, bins)
+def update_travel_histogram(strokes: Strokes, bins: np.ndarray,
+                            hist: np.ndarray = None):
+    data = _travel_histogram_data(strokes, bins, hist)
     avg, mx, avg_text, mx_text = _travel_stats(strokes, bins[-1])
     return dict(
         data=data,
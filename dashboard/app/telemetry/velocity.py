@@ -15,7 +15,8 @@ from bokeh.palettes import Spectral11
 from bokeh.plotting import figure
 from scipy.stats import norm
 
-from app.telemetry.psst import Strokes, Telemetry
+from app.telemetry.psst import Strokes
+from app.telemetry.stats import velocity_band_stats, velocity_stats
 
 
 TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM = 10
@@ -24,25 +25,9 @@ HISTOGRAM_RANGE_HIGH = 2000
 HISTOGRAM_RANGE_LOW = -HISTOGRAM_RANGE_HIGH
 
 
-def velocity_figure(telemetry: Telemetry, lod: int,
-                    front_color: tuple[str], rear_color: tuple[str]) -> figure:
-    length = len(telemetry.Front.Velocity if telemetry.Front.Present else
-                 telemetry.Rear.Velocity)
-    time = np.around(np.arange(0, length, lod) / telemetry.SampleRate, 4)
-
-    if telemetry.Front.Present:
-        vf_lod = np.around(telemetry.Front.Velocity[::lod], 4) / 1000
-    else:
-        vf_lod = np.full(length, 0)[::lod]
-    if telemetry.Rear.Present:
-        vr_lod = np.around(telemetry.Rear.Velocity[::lod], 4) / 1000
-    else:
-        vr_lod = np.full(length, 0)[::lod]
-    source = ColumnDataSource(data=dict(
-        t=time,
-        f=vf_lod,
-        r=vr_lod,
-    ))
+def velocity_figure(trace: dict[str, list], front_color: tuple[str],
+                    rear_color: tuple[str]) -> figure:
+    source = ColumnDataSource(name='ds_trace', data=trace)
     p = figure(
         name='velocity',
         title="Suspension velocity",
@@ -61,7 +46,7 @@ def velocity_figure(telemetry: Telemetry, lod: int,
         y_axis_label="Velocity (m/s)",
         output_backend='webgl')
 
-    p.x_range = Range1d(0, time[-1], bounds='auto')
+    p.x_range = Range1d(0, trace['t'][-1], bounds='auto')
 
     line = p.line(
         't', 'f',
@@ -88,40 +73,60 @@ def velocity_figure(telemetry: Telemetry, lod: int,
     return p
 
 
-def _normal_distribution_data(strokes: Strokes, velocity: list[float],
+def _normal_distribution_data(strokes: Strokes, velocity: np.ndarray,
                               step: float) -> dict[str, np.array]:
-    stroke_velocity = []
-    for s in strokes.Compressions + strokes.Rebounds:
-        stroke_velocity.extend(velocity[s.Start:s.End+1])
-    stroke_velocity = np.array(stroke_velocity)
+    stroke_velocity = velocity[strokes.all().sample_indices()]
     mu, std = norm.fit(stroke_velocity)
     ny = np.linspace(stroke_velocity.min(), stroke_velocity.max(), 100)
     pdf = norm.pdf(ny, mu, std) * step * 100
-    return dict(pdf=pdf.tolist(), ny=ny.tolist())
+    return dict(pdf=pdf, ny=ny)
 
 
-def _velocity_histogram_data(strokes: Strokes, hst: int, tbins: list[float],
-                             vbins: list[float], vbins_fine: list[float]) -> (
+def _bincount2d(x: np.ndarray, y: np.ndarray,
+                shape: tuple[int, int]) -> np.ndarray:
+    # Counts occurrences of each (x, y) index pair using a flattened index.
+    # Indices might be stored in a narrow type, they are widened so that the
+    # flattened index does not overflow.
+    counts = np.bincount(x.astype(np.intp) * shape[1] + y,
+                         minlength=shape[0] * shape[1])
+    return counts.reshape(shape)
+
+
+def _velocity_histogram_counts(strokes: Strokes, tbins: np.ndarray,
+                               vbins: np.ndarray, vbins_fine: np.ndarray) -> (
+                               np.ndarray, np.ndarray):
+    divider = (len(tbins) - 1) // TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM
+    shape = (TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM, len(vbins) - 1)
+    shape_fine = (TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM, len(vbins_fine) - 1)
+    hist = np.zeros(shape, dtype=np.int64)
+    hist_fine = np.zeros(shape_fine, dtype=np.int64)
+    for s in (strokes.Compressions, strokes.Rebounds):
+        tbin = s.DigitizedTravel // divider
+        hist += _bincount2d(tbin, s.DigitizedVelocity, shape)
+        hist_fine += _bincount2d(tbin, s.FineDigitizedVelocity, shape_fine)
+    return hist, hist_fine
+
+
+def _velocity_histogram_data(strokes: Strokes, hst: int, tbins: np.ndarray,
+                             vbins: np.ndarray, vbins_fine: np.ndarray,
+                             hist: np.ndarray = None,
+                             hist_fine: np.ndarray = None) -> (
                              dict[str, Any], float):
     step = vbins[1] - vbins[0]
     step_lowspeed = vbins_fine[1] - vbins_fine[0]
-    divider = (len(tbins) - 1) // TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM
-    hist = np.zeros((TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM, len(vbins) - 1))
-    total_count = 0
-
-    hist_lowspeed = np.zeros((TRAVEL_BINS_FOR_VELOCITY_HISTOGRAM,
-                              len(vbins_fine) - 1))
-
-    for s in strokes.Compressions + strokes.Rebounds:
-        total_count += s.Stat.Count
-        for i in range(s.Stat.Count):
-            vbin = s.DigitizedVelocity[i]
-            tbin = s.DigitizedTravel[i] // divider
-            hist[tbin][vbin] += 1
-
-            vbin_fine = s.FineDigitizedVelocity[i]
-            if -(hst+step_lowspeed) <= vbins_fine[vbin_fine] < hst:
-                hist_lowspeed[tbin][vbin_fine] += 1
+    # Histogram counts can be supplied by the caller, e.g. from a histogram
+    # index; otherwise they are counted from the strokes' digitized values.
+    if hist is None or hist_fine is None:
+        hist, hist_fine = _velocity_histogram_counts(
+            strokes, tbins, vbins, vbins_fine)
+    total_count = (np.sum(strokes.Compressions.Count) +
+                   np.sum(strokes.Rebounds.Count))
+
+    # Only fine bins starting within the low-speed range are counted.
+    lowspeed_bins = np.logical_and(-(hst+step_lowspeed) <= vbins_fine[:-1],
+                                   vbins_fine[:-1] < hst)
+    hist_lowspeed = np.where(lowspeed_bins, hist_fine, 0)
+
     hist = hist / total_count * 100.0
     hist_lowspeed = hist_lowspeed / total_count * 100.0
 
@@ -139,25 +144,27 @@ def _velocity_histogram_data(strokes: Strokes, hst: int, tbins: list[float],
         if sm > largest_bin_lowspeed:
             largest_bin_lowspeed = sm
 
-    sd = {str(k): v.tolist() for k, v in enumerate(hist)}
-    sd['y'] = (np.array(vbins[:-1]) + step / 2).tolist()
+    sd = {str(k): v for k, v in enumerate(hist)}
+    sd['y'] = vbins[:-1] + step / 2
 
-    sd_lowspeed = {str(k): v.tolist() for k, v in enumerate(hist_lowspeed)}
-    sd_lowspeed['y'] = (np.array(vbins_fine[:-1]) + step_lowspeed / 2).tolist()
+    sd_lowspeed = {str(k): v for k, v in enumerate(hist_lowspeed)}
+    sd_lowspeed['y'] = vbins_fine[:-1] + step_lowspeed / 2
 
     return (sd, sd_lowspeed,
             HISTOGRAM_RANGE_MULTIPLIER * largest_bin,
             HISTOGRAM_RANGE_MULTIPLIER * largest_bin_lowspeed)
 
 
-def velocity_histogram_figure(strokes: Strokes, velocity: list[float],
-                              tbins: list[float], vbins: list[float],
-                              vbins_fine: list[float], hst: int,
+def velocity_histogram_figure(strokes: Strokes, velocity: np.ndarray,
+                              tbins: np.ndarray, vbins: np.ndarray,
+                              vbins_fine: np.ndarray, hst: int,
                               title: str, title_lowspeed: str) -> figure:
     step = vbins[1] - vbins[0]
     step_lowspeed = vbins_fine[1] - vbins_fine[0]
     sd, sd_lowspeed, mx, mx_lowspeed = _velocity_histogram_data(
         strokes, hst, tbins, vbins, vbins_fine)
+    sd = {k: v.tolist() for k, v in sd.items()}
+    sd_lowspeed = {k: v.tolist() for k, v in sd_lowspeed.items()}
     source = ColumnDataSource(name='ds_hist', data=sd)
     source_lowspeed = ColumnDataSource(name='ds_hist_lowspeed',
                                        data=sd_lowspeed)
@@ -184,7 +191,8 @@ def velocity_histogram_figure(strokes: Strokes, velocity: list[float],
 
     source_normal = ColumnDataSource(
         name='ds_normal',
-        data=_normal_distribution_data(strokes, velocity, step))
+        data={k: v.tolist() for k, v in _normal_distribution_data(
+            strokes, velocity, step).items()})
     p.line(x='pdf', y='ny', line_width=2, source=source_normal,
            line_dash='dashed', color=Spectral11[-2])
 
@@ -211,7 +219,8 @@ def velocity_histogram_figure(strokes: Strokes, velocity: list[float],
 
     source_normal_lowspeed = ColumnDataSource(
         name='ds_normal_lowspeed',
-        data=_normal_distribution_data(strokes, velocity, step_lowspeed))
+        data={k: v.tolist() for k, v in _normal_distribution_data(
+            strokes, velocity, step_lowspeed).items()})
     p_lowspeed.line(x='pdf', y='ny', line_width=2,
                     source=source_normal_lowspeed,
                     line_dash='dashed', color=Spectral11[-2])
@@ -256,7 +265,7 @@ def velocity_histogram_figure(strokes: Strokes, velocity: list[float],
 
 
 def _add_velocity_stat_labels(p: figure, strokes: Strokes, mx):
-    avgr, maxr, avgc, maxc = _velocity_stats(strokes)
+    avgr, maxr, avgc, maxc = velocity_stats(strokes)
 
     s_avgr = Span(name='s_avgr', location=avgr, dimension='width',
                   line_color='gray', line_dash='dashed', line_width=2)
@@ -316,62 +325,10 @@ def _add_velocity_stat_labels(p: figure, strokes: Strokes, mx):
     p.add_layout(l_maxc)
 
 
-def _velocity_stats(strokes: Strokes) -> (float, float, float, float):
-    csum = 0
-    ccount = 0
-    maxc = 0
-    for c in strokes.Compressions:
-        csum += c.Stat.SumVelocity
-        ccount += c.Stat.Count
-        if c.Stat.MaxVelocity > maxc:
-            maxc = c.Stat.MaxVelocity
-    avgc = csum / ccount
-
-    rsum = 0
-    rcount = 0
-    maxr = 0
-    for r in strokes.Rebounds:
-        rsum += r.Stat.SumVelocity
-        rcount += r.Stat.Count
-        if r.Stat.MaxVelocity < maxr:
-            maxr = r.Stat.MaxVelocity
-    avgr = rsum / rcount
-    return avgr, maxr, avgc, maxc
-
-
-def _velocity_band_stats(strokes: Strokes, velocity: list[float],
-                         high_speed_threshold: float) -> (
-                         float, float, float, float):
-    velocity_ = np.array(velocity)
-    total_count = 0
-    lsc, hsc = 0, 0
-    for c in strokes.Compressions:
-        total_count += c.Stat.Count
-        stroke_lsc = np.count_nonzero(
-            velocity_[c.Start:c.End+1] < high_speed_threshold)
-        lsc += stroke_lsc
-        hsc += c.Stat.Count - stroke_lsc
-
-    lsr, hsr = 0, 0
-    for r in strokes.Rebounds:
-        total_count += r.Stat.Count
-        stroke_lsr = np.count_nonzero(
-            velocity_[r.Start:r.End+1] > -high_speed_threshold)
-        lsr += stroke_lsr
-        hsr += r.Stat.Count - stroke_lsr
-
-    lsc = lsc / total_count * 100.0
-    hsc = hsc / total_count * 100.0
-    lsr = lsr / total_count * 100.0
-    hsr = hsr / total_count * 100.0
-
-    return hsr, lsr, lsc, hsc
-
-
-def velocity_band_stats_figure(strokes: Strokes, velocity: list[float],
+def velocity_band_stats_figure(strokes: Strokes, velocity: np.ndarray,
                                high_speed_threshold: float) -> figure:
-    hsr, lsr, lsc, hsc = _velocity_band_stats(strokes, velocity,
-                                              high_speed_threshold)
+    hsr, lsr, lsc, hsc = velocity_band_stats(strokes, velocity,
+                                             high_speed_threshold)
     source = ColumnDataSource(name='ds_stats', data=dict(
         x=[0], hsc=[hsc], lsc=[lsc], lsr=[lsr], hsr=[hsr]))
     p = figure(
@@ -419,15 +376,18 @@ def velocity_band_stats_figure(strokes: Strokes, velocity: list[float],
     return p
 
 
-def update_velocity_histogram(strokes: Strokes, velocity: list[float],
-                              tbins: list[float], vbins: list[float],
-                              vbins_fine: list[float],
-                              high_speed_threshold: int):
+def update_velocity_histogram(strokes: Strokes, velocity: np.ndarray,
+                              tbins: np.ndarray, vbins: np.ndarray,
+                              vbins_fine: np.ndarray,
+                              high_speed_threshold: int,
+                              hist: np.ndarray = None,
+                              hist_fine: np.ndarray = None):
     step = vbins[1] - vbins[0]
     step_lowspeed = vbins_fine[1] - vbins_fine[0]
     data, data_lowspeed, mx, mx_lowspeed = _velocity_histogram_data(
-        strokes, high_speed_threshold, tbins, vbins, vbins_fine)
-    avgr, maxr, avgc, maxc = _velocity_stats(strokes)
+        strokes, high_speed_threshold, tbins, vbins, vbins_fine,
+        hist, hist_fine)
+    avgr, maxr, avgc, maxc = velocity_stats(strokes)
     return dict(
         data=data,
         mx=mx,
@@ -447,10 +407,10 @@ def update_velocity_histogram(strokes: Strokes, velocity: list[float],
     )
 
 
-def update_velocity_band_stats(strokes: Strokes, velocity: list[float],
+def update_velocity_band_stats(strokes: Strokes, velocity: np.ndarray,
                                high_speed_threshold: float):
-    hsr, lsr, lsc, hsc = _velocity_band_stats(strokes, velocity,
-                                              high_speed_threshold)
+    hsr, lsr, lsc, hsc = velocity_band_stats(strokes, velocity,
+                                             high_speed_threshold)
     return dict(
         data=dict(x=[0], hsc=[hsc], lsc=[lsc], lsr=[lsr], hsr=[hsr]),
         hsr=hsr,
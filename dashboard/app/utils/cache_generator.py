@@ -0,0 +1,181 @@
+import threading
+import uuid
+
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app.extensions import db, sio
+from app.models.cache_job import CacheJob
+from app.models.session import Session
+from app.models.session_data import SessionData
+from app.models.session_html import SessionHtml
+from app.telemetry.psst import telemetry_from_psst
+from app.telemetry.session_html import build_cache, store_cache
+from app.utils.process_pool import process_pool
+
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF = 30  # seconds, doubled after each failed attempt
+POLL_INTERVAL = 5
+
+# Set when a job is queued, so that idle workers don't have to wait for the
+# next poll.
+_wakeup = threading.Event()
+
+
+def _build(session_id: uuid.UUID, data: bytes, hst: int) -> dict:
+    telemetry = telemetry_from_psst(data)
+    return build_cache(session_id, telemetry, hst)
+
+
+def _now() -> int:
+    return int(datetime.now().timestamp())
+
+
+def enqueue_cache_job(session_id: uuid.UUID):
+    job = db.session.get(CacheJob, session_id)
+    if job and job.state in (CacheJob.PENDING, CacheJob.RUNNING):
+        return
+    if not job:
+        job = CacheJob(session_id=session_id)
+        db.session.add(job)
+    job.state = CacheJob.PENDING
+    job.attempts = 0
+    job.next_attempt = _now()
+    job.error = None
+    job.updated = _now()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Somebody else has queued the same session in the meantime.
+        db.session.rollback()
+    _wakeup.set()
+
+
+def _claim_job() -> uuid.UUID:
+    now = _now()
+    candidates = db.session.execute(
+        db.select(CacheJob.session_id)
+        .filter(CacheJob.state == CacheJob.PENDING,
+                CacheJob.next_attempt <= now)
+        .order_by(CacheJob.next_attempt)
+        .limit(10)).scalars().all()
+    for id in candidates:
+        # Only one worker can move a given job out of the pending state.
+        result = db.session.execute(
+            db.update(CacheJob)
+            .filter_by(session_id=id, state=CacheJob.PENDING)
+            .values(state=CacheJob.RUNNING,
+                    attempts=CacheJob.attempts + 1,
+                    updated=now))
+        db.session.commit()
+        if result.rowcount == 1:
+            return id
+    return None
+
+
+def _finish_job(app: Flask, id: uuid.UUID, error: str = None):
+    job = db.session.get(CacheJob, id)
+    if not job:
+        return
+    job.error = error
+    job.updated = _now()
+    retries = int(app.config.get('CACHE_GENERATOR_RETRIES', DEFAULT_RETRIES))
+    if error is None:
+        job.state = CacheJob.DONE
+    elif job.attempts <= retries:
+        job.state = CacheJob.PENDING
+        job.next_attempt = _now() + RETRY_BACKOFF * 2 ** (job.attempts - 1)
+    else:
+        job.state = CacheJob.FAILED
+    db.session.commit()
+
+
+def _generate(app: Flask, id: uuid.UUID, timeout: float):
+    session = Session.get(id)
+    if not session or not session.data:
+        raise RuntimeError("session does not exist or has no data")
+    # The payload might be memory-mapped, which can't be sent to a worker.
+    data = bytes(session.data)
+    app.logger.info(f"generating cache for session {id}")
+    store_cache(process_pool.run(_build, id, data, 200, timeout=timeout))
+    sio.emit("session_ready")
+    app.logger.info(f"cache ready for session {id}")
+
+
+def _worker(app: Flask):
+    timeout = float(app.config.get('CACHE_GENERATOR_TIMEOUT',
+                                   DEFAULT_TIMEOUT))
+    with app.app_context():
+        while True:
+            _wakeup.clear()
+            id = None
+            try:
+                id = _claim_job()
+                if id:
+                    _generate(app, id, timeout)
+                    _finish_job(app, id)
+            except BaseException as e:
+                app.logger.error(f"cache failed for session {id}: {e}")
+                db.session.rollback()
+                if id:
+                    try:
+                        _finish_job(app, id, str(e))
+                    except BaseException:
+                        db.session.rollback()
+            finally:
+                # Each job gets a fresh DB session, so that a failed job does
+                # not leave a broken transaction behind.
+                db.session.remove()
+            if not id:
+                _wakeup.wait(POLL_INTERVAL)
+
+
+def _recover(app: Flask):
+    # Jobs that were running when the server stopped are started again, and
+    # sessions that lost their job (e.g. queued before jobs were persisted)
+    # are queued.
+    with app.app_context():
+        try:
+            db.session.execute(
+                db.update(CacheJob)
+                .filter_by(state=CacheJob.RUNNING)
+                .values(state=CacheJob.PENDING, next_attempt=_now()))
+            missing = db.session.execute(
+                db.select(Session.id)
+                .filter(Session.deleted.is_(None),
+                        db.exists().where(
+                            SessionData.session_id == Session.id),
+                        ~db.exists().where(
+                            SessionHtml.session_id == Session.id),
+                        ~db.exists().where(
+                            CacheJob.session_id == Session.id))
+            ).scalars().all()
+            for id in missing:
+                db.session.add(CacheJob(session_id=id, updated=_now()))
+            db.session.commit()
+        except SQLAlchemyError as e:
+            # The database might not have been initialized yet.
+            app.logger.warning(f"could not recover cache jobs: {e}")
+        finally:
+            db.session.remove()
+
+
+def start_cache_generators(app: Flask):
+    # Jobs are only queued when generation is disabled. Every worker thread
+    # waits for one job at a time in the process pool, so the default keeps
+    # all of the pool's processes busy.
+    workers = int(app.config.get('CACHE_GENERATOR_WORKERS',
+                                 process_pool.workers))
+    if workers == 0:
+        app.logger.info("Bokeh HTML generator disabled")
+        return
+    _recover(app)
+    for _ in range(workers):
+        t = threading.Thread(target=_worker, args=(app,))
+        t.daemon = True
+        t.start()
+    app.logger.info(f"Bokeh HTML generator started ({workers} workers)")
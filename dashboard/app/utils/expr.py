@@ -1,7 +1,27 @@
 import math
 import numbers
 import ast
+import io
 import operator as op
+import tokenize
+
+import numpy as np
+
+from typing import Callable
+
+
+def _parse(expr: str) -> ast.Expression:
+    # Calibration expressions are shared with gosst, where '^' is the power
+    # operator, binding tighter than multiplication. Python parses it as a
+    # low precedence XOR, so 'a^2+b^2' would become 'a^(2+b)^2'.
+    tokens = []
+    for t in tokenize.generate_tokens(io.StringIO(expr).readline):
+        if t.type == tokenize.OP and t.string == '**':
+            raise SyntaxError("'**' is not supported, use '^'")
+        if t.type == tokenize.OP and t.string == '^':
+            t = t._replace(string='**')
+        tokens.append((t.type, t.string))
+    return ast.parse(tokenize.untokenize(tokens), mode='eval')
 
 
 class ExpressionParser:
@@ -16,6 +36,7 @@ class ExpressionParser:
         ast.Div: op.truediv,
         ast.Mod: op.mod,
         ast.BitXor: op.pow,
+        ast.Pow: op.pow,
         ast.Not: op.not_,
         ast.And: op.and_,
         ast.Or:  op.or_,
@@ -23,10 +44,9 @@ class ExpressionParser:
         ast.UAdd: lambda a: a,
     }
 
-    _vars = {}
-    _names2func = {}
-
     def __init__(self, env):
+        self._vars = {}
+        self._names2func = {}
         for k, v in env.items():
             if callable(v):
                 self._names2func[k] = v
@@ -87,7 +107,6 @@ class ExpressionParser:
         if isinstance(node, ast.Attribute):
             return getattr(self._eval(node.value), node.attr)
         if isinstance(node, ast.Call):
-            print(node.func)
             return self._eval(node.func)(
                       *(self._eval(a) for a in node.args),
                       **{k.arg: self._eval(k.value) for k in node.keywords}
@@ -95,12 +114,117 @@ class ExpressionParser:
         else:
             raise TypeError(node)
 
+    @staticmethod
+    def parse(expr) -> ast.Expression:
+        return _parse(expr)
+
     def evaluate(self, expr):
-        return self._eval(ast.parse(expr, mode='eval'))
+        if not isinstance(expr, ast.Expression):
+            expr = _parse(expr)
+        return self._eval(expr)
 
     def validate(self, expr) -> bool:
         try:
-            self._validate(ast.parse(expr, mode='eval'))
+            self._validate(_parse(expr))
             return True
         except BaseException:
             return False
+
+
+# NumPy counterparts of math functions whose names differ.
+_math2numpy = dict(
+    asin=np.arcsin,
+    acos=np.arccos,
+    atan=np.arctan,
+    atan2=np.arctan2,
+    asinh=np.arcsinh,
+    acosh=np.arccosh,
+    atanh=np.arctanh,
+    pow=np.power,
+)
+
+
+def _vectorized(func: Callable) -> Callable:
+    name = getattr(func, '__name__', None)
+    if name and getattr(math, name, None) is func:
+        ufunc = _math2numpy.get(name, getattr(np, name, None))
+        if isinstance(ufunc, np.ufunc):
+            return ufunc
+    return np.vectorize(func, otypes=[np.float64])
+
+
+class ExpressionCompiler(ExpressionParser):
+    """ Compiles expressions into functions that evaluate them over NumPy
+    arrays. Accepts exactly the constructs `_validate` does (except for
+    attributes starting with an underscore), and resolves every name at
+    compile time, so that errors surface before evaluation.
+    """
+
+    _vector_operators = {
+        **ExpressionParser._operators2method,
+        ast.Not: np.logical_not,
+    }
+
+    def _func(self, name):
+        try:
+            func = self._names2func[name]
+        except KeyError:
+            func = self._alt_name(name)
+        if not callable(func):
+            raise TypeError(f"{name!r} is not callable")
+        return _vectorized(func)
+
+    def _compile(self, node, variables):
+        if isinstance(node, ast.Expression):
+            return self._compile(node.body, variables)
+        if isinstance(node, ast.Constant):
+            if not isinstance(node.value, numbers.Number):
+                raise TypeError(node)
+            value = node.value
+            return lambda v: value
+        if isinstance(node, ast.Name):
+            name = node.id
+            if name in variables:
+                return lambda v: v[name]
+            value = self._Name(name)
+            return lambda v: value
+        if isinstance(node, ast.BinOp):
+            method = self._vector_operators[type(node.op)]
+            left = self._compile(node.left, variables)
+            right = self._compile(node.right, variables)
+            return lambda v: method(left(v), right(v))
+        if isinstance(node, ast.UnaryOp):
+            method = self._vector_operators[type(node.op)]
+            operand = self._compile(node.operand, variables)
+            return lambda v: method(operand(v))
+        if isinstance(node, ast.Attribute):
+            if node.attr.startswith('_'):
+                raise NameError(f"{node.attr!r}")
+            value = self._compile(node.value, variables)
+            attr = node.attr
+            return lambda v: getattr(value(v), attr)
+        if isinstance(node, ast.Call):
+            func = self._func(node.func.id)
+            args = [self._compile(a, variables) for a in node.args]
+            kwargs = {k.arg: self._compile(k.value, variables)
+                      for k in node.keywords}
+            return lambda v: func(*(a(v) for a in args),
+                                  **{k: a(v) for k, a in kwargs.items()})
+        else:
+            raise TypeError(node)
+
+    def compile(self, expr, variables: tuple[str]) -> Callable:
+        """Returns a function that takes the values of `variables` as keyword
+        arguments (scalars or arrays), and returns the value of `expr` as a
+        float64 array shaped like the broadcast inputs."""
+
+        f = self._compile(_parse(expr), frozenset(variables))
+
+        def evaluate(**values):
+            values = {k: np.asarray(v, dtype=np.float64)
+                      for k, v in values.items()}
+            shape = np.broadcast_shapes(*(v.shape for v in values.values()))
+            result = np.asarray(f(values), dtype=np.float64)
+            return np.array(np.broadcast_to(result, shape))
+
+        return evaluate
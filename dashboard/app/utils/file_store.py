@@ -0,0 +1,90 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+
+# Files younger than this are never collected, because the row referencing
+# a freshly written file might not have been committed yet.
+GC_GRACE_PERIOD = 3600  # seconds
+
+
+class ContentStore:
+    """Immutable files named by the SHA-256 of their content.
+
+    Storing the same content twice results in one file. Files are read via
+    `mmap`, so reading does not copy the content into a Python object. The
+    store is disabled (`enabled` is False) unless a directory is configured.
+    """
+
+    def __init__(self, config_key: str):
+        self._config_key = config_key
+        self.root = None
+
+    def init_app(self, app: Flask):
+        self.root = app.config.get(self._config_key)
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def path(self, digest: str) -> str:
+        if not self.root:
+            raise RuntimeError(f"{self._config_key} is not configured")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            # Restarts the grace period, the file is about to be referenced.
+            os.utime(path)
+            return digest
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest
+
+    def get(self, digest: str) -> mmap.mmap | bytes:
+        with open(self.path(digest), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def digests(self) -> list[str]:
+        if not self.root:
+            return []
+        return [name
+                for directory in os.scandir(self.root) if directory.is_dir()
+                for name in os.listdir(directory.path)
+                if not name.startswith('.')]
+
+    def collect(self, referenced: set[str]) -> int:
+        """Removes files that are not referenced, returns their number."""
+
+        count = 0
+        threshold = time.time() - GC_GRACE_PERIOD
+        for digest in self.digests():
+            path = self.path(digest)
+            if digest in referenced or os.path.getmtime(path) > threshold:
+                continue
+            os.unlink(path)
+            count += 1
+        return count
+
+
+psst_store = ContentStore('PSST_STORE_DIR')
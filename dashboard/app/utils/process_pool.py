@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import threading
+import weakref
+
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from flask import Flask
+
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_MAX_TASKS = 100
+
+# Workers are spawned: forking a server that eventlet has monkey-patched is
+# not safe, and the forkserver can't pass file descriptors through eventlet's
+# sockets. Spawning is slow, which is why the workers are kept around.
+_mp = multiprocessing.get_context('spawn')
+
+
+class ProcessPool:
+    """Worker processes for CPU-bound work that would stall the server.
+
+    Workers are started on the first task, and replaced after a number of
+    tasks to give back the memory large payloads leave behind. A task that
+    runs for too long, or a worker that crashes, costs the tasks in flight
+    (their callers retry them), not the server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        # The pool each task was submitted to, so that a timed out task
+        # never restarts a pool it is not running in.
+        self._executors = weakref.WeakKeyDictionary()
+        self.workers = DEFAULT_WORKERS
+        self.max_tasks = DEFAULT_MAX_TASKS
+
+    def init_app(self, app: Flask):
+        self.workers = int(app.config.get('PROCESS_POOL_WORKERS',
+                                          DEFAULT_WORKERS))
+        self.max_tasks = int(app.config.get('PROCESS_POOL_MAX_TASKS',
+                                            DEFAULT_MAX_TASKS))
+
+    def _get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, mp_context=_mp,
+                    max_tasks_per_child=self.max_tasks)
+            return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # A running task can't be cancelled, only its worker killed. The
+        # other tasks of the pool fail with BrokenProcessPool.
+        for p in list(executor._processes.values()):
+            p.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        executor = self._get()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker crashed since the last task.
+            self._restart(executor)
+            executor = self._get()
+            future = executor.submit(fn, *args)
+        self._executors[future] = executor
+        return future
+
+    def result(self, future: Future, timeout: float = None):
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            executor = self._executors.get(future)
+            if executor:
+                self._restart(executor)
+            raise TimeoutError(f"timed out after {timeout} s")
+        except BrokenProcessPool:
+            executor = self._executors.get(future)
+            if executor:
+                self._restart(executor)
+            raise RuntimeError("worker exited abruptly")
+
+    def run(self, fn: Callable, *args, timeout: float = None):
+        return self.result(self.submit(fn, *args), timeout)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+process_pool = ProcessPool()
@@ -0,0 +1,243 @@
+import threading
+import uuid
+
+from collections import deque
+from concurrent.futures import Future
+
+from flask import Flask, current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.extensions import db, sio
+from app.models.calibration import Calibration
+from app.models.reprocess_job import ReprocessJob
+from app.models.session import Session, stored_psst_version
+from app.models.session_histogram_index import SessionHistogramIndex
+from app.models.session_html import SessionHtml
+from app.models.session_raw import SessionRaw
+from app.models.session_stats import SessionStats
+from app.models.setup import Setup
+from app.telemetry.processing import (
+    SetupSource,
+    process_recording,
+    raw_from_sst,
+    setup_source
+)
+from app.telemetry.psst import Telemetry, psst_from_telemetry
+from app.telemetry.telemetry_cache import telemetry_cache
+from app.utils.cache_generator import _now, enqueue_cache_job
+from app.utils.process_pool import process_pool
+
+
+DEFAULT_TIMEOUT = 300
+
+# The properties of each entity that processing depends on.
+_processing_properties = {
+    ReprocessJob.LINKAGE: ('head_angle', 'front_stroke', 'rear_stroke',
+                           'data'),
+    ReprocessJob.CALIBRATION: ('method_id', 'inputs'),
+    ReprocessJob.CALIBRATION_METHOD: ('properties',),
+}
+
+# Jobs run one after the other, each of them already uses every worker.
+_lock = threading.Lock()
+
+
+def _reprocess(data: bytes, name: str, source: SetupSource,
+               version: int) -> (bytes, Telemetry):
+    front, rear, meta = raw_from_sst(data)
+    meta.Name = name
+    telemetry = process_recording(front, rear, meta, *source.data())
+    return psst_from_telemetry(telemetry, version), telemetry
+
+
+def affected_sessions(entity: str, id: uuid.UUID) -> (
+                      list[uuid.UUID], int):
+    """Returns the sessions that can be reprocessed after an entity changed,
+    and the number of affected sessions that can't.
+
+    Affected sessions are the ones recorded with a setup that references the
+    entity. Only those that still have the data they were imported from can
+    be reprocessed; sessions imported before recordings were kept, or
+    uploaded already processed or normalized, are skipped.
+    """
+
+    setups = db.select(Setup.id).filter(Setup.deleted.is_(None))
+    if entity == ReprocessJob.LINKAGE:
+        setups = setups.filter(Setup.linkage_id == id)
+    elif entity == ReprocessJob.CALIBRATION:
+        setups = setups.filter(db.or_(Setup.front_calibration_id == id,
+                                      Setup.rear_calibration_id == id))
+    elif entity == ReprocessJob.CALIBRATION_METHOD:
+        calibrations = db.select(Calibration.id).filter(
+            Calibration.deleted.is_(None), Calibration.method_id == id)
+        setups = setups.filter(db.or_(
+            Setup.front_calibration_id.in_(calibrations),
+            Setup.rear_calibration_id.in_(calibrations)))
+    else:
+        raise ValueError(f"unknown entity: {entity}")
+    rows = db.session.execute(
+        db.select(Session.id,
+                  db.exists().where(SessionRaw.session_id == Session.id))
+        .filter(Session.deleted.is_(None),
+                Session.setup.in_(setups))
+        .order_by(Session.timestamp)).all()
+    sessions = [id for id, has_raw in rows if has_raw]
+    return sessions, len(rows) - len(sessions)
+
+
+def _progress(job: ReprocessJob):
+    job.updated = _now()
+    db.session.commit()
+    sio.emit("reprocess_progress", dict(
+        id=str(job.id),
+        state=job.state,
+        total=job.total,
+        done=job.done,
+        failed=job.failed,
+        skipped=job.skipped,
+    ))
+
+
+def _arguments(id: uuid.UUID, sources: dict) -> tuple:
+    session = Session.get(id)
+    raw = db.session.get(SessionRaw, id)
+    if not session or not raw:
+        return None
+    if session.setup not in sources:
+        try:
+            sources[session.setup] = setup_source(Setup.get(session.setup))
+        except Exception:
+            sources[session.setup] = None
+    if not sources[session.setup]:
+        return None
+    return (raw.data, session.name, sources[session.setup],
+            stored_psst_version())
+
+
+def _store(app: Flask, job: ReprocessJob, id: uuid.UUID, future: Future,
+           timeout: float):
+    try:
+        data, telemetry = process_pool.result(future, timeout)
+        session = Session.get(id)
+        if not session:
+            raise RuntimeError("session does not exist")
+        session.set_psst(data, telemetry)
+        db.session.execute(db.delete(SessionHtml).filter_by(session_id=id))
+        SessionStats.store(id, telemetry)
+        SessionHistogramIndex.store(id, telemetry)
+        job.done += 1
+        db.session.commit()
+    except Exception as e:
+        app.logger.error(f"reprocessing failed for session {id}: {e}")
+        db.session.rollback()
+        job.failed += 1
+        _progress(job)
+        return
+    telemetry_cache.invalidate(id)
+    enqueue_cache_job(id)
+    _progress(job)
+
+
+def _process(app: Flask, job: ReprocessJob):
+    timeout = float(app.config.get('REPROCESSOR_TIMEOUT', DEFAULT_TIMEOUT))
+    sources = {}
+    in_flight = deque()
+    for id in job.sessions:
+        # Only a few sessions are in flight at a time, so that the raw
+        # data of every session is not loaded at once.
+        if len(in_flight) >= 2 * process_pool.workers:
+            _store(app, job, *in_flight.popleft(), timeout)
+        arguments = _arguments(id, sources)
+        if not arguments:
+            job.failed += 1
+            _progress(job)
+            continue
+        in_flight.append((id, process_pool.submit(_reprocess, *arguments)))
+    while in_flight:
+        _store(app, job, *in_flight.popleft(), timeout)
+
+
+def _run(app: Flask, job_id: uuid.UUID):
+    with _lock, app.app_context():
+        job = None
+        try:
+            job = db.session.get(ReprocessJob, job_id)
+            job.state = ReprocessJob.RUNNING
+            job.done = 0
+            job.failed = 0
+            job.error = None
+            _progress(job)
+            app.logger.info(f"reprocessing {job.total} sessions, "
+                            f"{job.skipped} skipped ({job_id})")
+            _process(app, job)
+            job.state = ReprocessJob.DONE
+            _progress(job)
+            app.logger.info(f"reprocessing done ({job_id})")
+        except BaseException as e:
+            app.logger.error(f"reprocessing failed ({job_id}): {e}")
+            db.session.rollback()
+            if job:
+                job.state = ReprocessJob.FAILED
+                job.error = str(e)
+                _progress(job)
+        finally:
+            db.session.remove()
+
+
+def _start(app: Flask, job_id: uuid.UUID):
+    # Test apps share a single in-memory database connection, so their
+    # jobs run in the request instead of a thread.
+    if app.testing:
+        _run(app, job_id)
+        return
+    t = threading.Thread(target=_run, args=(app, job_id))
+    t.daemon = True
+    t.start()
+
+
+def processing_properties(entity: str, obj) -> tuple:
+    """Returns the properties of a linkage, calibration or calibration method
+    that its sessions were processed with, or None for no object."""
+
+    if obj is None:
+        return None
+    return tuple(getattr(obj, p) for p in _processing_properties[entity])
+
+
+def start_reprocessing(entity: str, id: uuid.UUID,
+                       if_affected: bool = False) -> ReprocessJob:
+    """Starts reprocessing the sessions affected by a change of an entity.
+    With if_affected, no job is created (and None is returned) when there
+    are no affected sessions."""
+
+    sessions, skipped = affected_sessions(entity, id)
+    if if_affected and not sessions and not skipped:
+        return None
+    job = ReprocessJob(entity=entity, entity_id=id, total=len(sessions),
+                       skipped=skipped, created=_now(), updated=_now())
+    job.sessions = sessions
+    db.session.add(job)
+    db.session.commit()
+    _start(current_app._get_current_object(), job.id)
+    return job
+
+
+def start_reprocessors(app: Flask):
+    # Jobs that were interrupted by a shutdown are started again. Processing
+    # the same recording twice gives the same result, so sessions that were
+    # already done don't need to be skipped.
+    with app.app_context():
+        try:
+            ids = db.session.execute(
+                db.select(ReprocessJob.id)
+                .filter(ReprocessJob.state.in_((ReprocessJob.PENDING,
+                                                ReprocessJob.RUNNING)))
+                .order_by(ReprocessJob.created)).scalars().all()
+        except SQLAlchemyError as e:
+            # The database might not have been initialized yet.
+            app.logger.warning(f"could not recover reprocess jobs: {e}")
+            ids = []
+        finally:
+            db.session.remove()
+    for id in ids:
+        _start(app, id)
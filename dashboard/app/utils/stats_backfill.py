@@ -0,0 +1,65 @@
+import threading
+
+from flask import Flask
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.extensions import db
+from app.models.session import Session
+from app.models.session_data import SessionData
+from app.models.session_stats import SessionStats
+from app.telemetry.psst import telemetry_from_psst
+from app.telemetry.stats import session_stats
+from app.utils.process_pool import process_pool
+
+
+TIMEOUT = 300
+
+
+def _stats(data: bytes) -> dict:
+    return session_stats(telemetry_from_psst(data))
+
+
+def backfill_session_stats(app: Flask) -> int:
+    """Computes the statistics of sessions that don't have them yet (e.g.
+    ones imported before statistics were stored). Returns their number."""
+
+    count = 0
+    with app.app_context():
+        try:
+            ids = db.session.execute(
+                db.select(Session.id)
+                .filter(Session.deleted.is_(None),
+                        db.exists().where(
+                            SessionData.session_id == Session.id),
+                        ~db.exists().where(
+                            SessionStats.session_id == Session.id))
+            ).scalars().all()
+        except SQLAlchemyError as e:
+            # The database might not have been initialized yet.
+            app.logger.warning(f"could not backfill session stats: {e}")
+            db.session.remove()
+            return 0
+        # One session at a time, so that we never hold more than one payload
+        # and leave the rest of the process pool to the cache generators.
+        for id in ids:
+            try:
+                # The payload might be memory-mapped, which can't be sent to
+                # a worker.
+                data = bytes(db.session.get(SessionData, id).read())
+                stats = process_pool.run(_stats, data, timeout=TIMEOUT)
+                SessionStats.store_stats(id, stats)
+                db.session.commit()
+                count += 1
+            except Exception as e:
+                app.logger.error(f"could not compute stats for {id}: {e}")
+                db.session.rollback()
+        db.session.remove()
+    if count:
+        app.logger.info(f"computed stats for {count} sessions")
+    return count
+
+
+def start_stats_backfill(app: Flask):
+    t = threading.Thread(target=backfill_session_stats, args=(app,))
+    t.daemon = True
+    t.start()
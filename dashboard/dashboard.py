@@ -1,7 +1,8 @@
-from app import create_app
+from app import create_app, start_workers
 from app.extensions import sio
 
 app = create_app()
 
 if __name__ == '__main__':
+    start_workers(app)
     sio.run(app)
@@ -1,5 +1,6 @@
 var m = require("mithril")
 var Session = require("./Session")
+var Socket = require("./Socket")
 var Login = require("../views/Login")
 var VideoPlayer = require("../views/VideoPlayer")
 var Layout = require("../views/Layout")
@@ -78,18 +79,54 @@ var SST = {
       }
     },
     plots: function(start, end) {
-      const args = "?start=" + start + "&end=" + end;
-      m.request({
-        method: "GET",
-        url: '/api/session/' + Session.current.id + '/filter' + args,
-      })
-      .then((update) => {
-          Session.current.suspension_count == 2 ? SST.update.process_double_json(update) :
-                                                  SST.update.process_single_json(update);
-      })
-      .catch((error) => {
-        SST.setError('Invalid range!')
-      })
+      // Filters are computed via the socket, where a newer request
+      // supersedes the ones of the same session still being computed.
+      // Results of superseded requests are ignored here too.
+      SST.update.plotsSeq = (SST.update.plotsSeq || 0) + 1;
+      Socket.emit("filter", {
+        id: Session.current.id,
+        start: start,
+        end: end,
+        seq: SST.update.plotsSeq,
+      });
+    },
+    plots_current: function(result) {
+      // False for results and errors of superseded requests, and of other
+      // sessions.
+      return result.id == Session.current.id &&
+             result.seq == SST.update.plotsSeq;
+    },
+    plots_result: function(result) {
+      if (!SST.update.plots_current(result)) {
+        return;
+      }
+      const update = JSON.parse(new TextDecoder().decode(result.data));
+      Session.current.suspension_count == 2 ? SST.update.process_double_json(update) :
+                                              SST.update.process_single_json(update);
+    },
+    plots_error: function(result) {
+      if (SST.update.plots_current(result)) {
+        SST.setError('Invalid range!');
+      }
+    },
+    trace: function(start, end) {
+      // Range changes are fired continuously while panning or zooming, so
+      // only the last one in a short period results in a request.
+      clearTimeout(SST.update.traceTimer);
+      SST.update.traceTimer = setTimeout(() => {
+        const travel = Bokeh.documents[0].get_model_by_name("travel");
+        const velocity = Bokeh.documents[0].get_model_by_name("velocity");
+        const width = Math.max(1, Math.round(travel.inner_width));
+        const args = "?start=" + start + "&end=" + end + "&width=" + width;
+        m.request({
+          method: "GET",
+          url: '/api/session/' + Session.current.id + '/trace' + args,
+        })
+        .then((update) => {
+          travel.select_one("ds_trace").data = update.travel;
+          velocity.select_one("ds_trace").data = update.velocity;
+        })
+      }, 150);
     },
     fft: function(p, u) {
       p.select_one("ds_fft").data = u.data;
@@ -204,4 +241,7 @@ var SST = {
   }
 }
 
+Socket.on("filter_result", SST.update.plots_result)
+Socket.on("filter_error", SST.update.plots_error)
+
 module.exports = SST
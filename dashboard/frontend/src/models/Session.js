@@ -8,28 +8,44 @@ var timestampToString = function(timestamp) {
   })
 }
 
+const SESSION_PAGE_SIZE = 50
+
 var Session = {
   gpxError: "",
   list: {},
-  loadList: function() {
+  next: null,
+  loadPage: function(cursor) {
     return m.request({
       method: "GET",
       url: "/api/session",
+      params: {
+        fields: "id,name,description,timestamp",
+        limit: SESSION_PAGE_SIZE,
+        cursor: cursor || "",
+      },
+      extract: function(xhr) {
+        Session.next = xhr.getResponseHeader("X-Next-Cursor")
+        return JSON.parse(xhr.responseText)
+      },
     })
     .then(function(result) {
-      Session.list = {}
-      let lastDate = ""
-      result.forEach(function(item, index) {
+      result.forEach(function(item) {
         const d = timestampToString(item.timestamp)
-        if (d != lastDate) {
-          Session.list[d] = [item]
-          lastDate = d
-        } else {
-          Session.list[d].push(item)
+        if (!(d in Session.list)) {
+          Session.list[d] = []
         }
+        Session.list[d].push(item)
       })
     })
   },
+  loadList: function() {
+    Session.list = {}
+    Session.next = null
+    return Session.loadPage(null)
+  },
+  loadMore: function() {
+    return Session.loadPage(Session.next)
+  },
   putNormalized: function(normalizedSession) {
     return m.request({
       method: "PUT",
@@ -0,0 +1,4 @@
+var io = require("socket.io-client");
+
+// One connection is shared by the whole application.
+module.exports = io()
@@ -46,6 +46,9 @@ module.exports = {
       return m(".session-list-day", [m(SessionDayItem, d)].concat(s.map(function(session) {
         return m(SessionListItem, [session])
       })))
-    }))
+    }).concat(Session.next ? [m("button", {
+      style: "display: block; margin: 10px auto;",
+      onclick: Session.loadMore,
+    }, "Load more")] : []))
   },
 }
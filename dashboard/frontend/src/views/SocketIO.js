@@ -1,16 +1,21 @@
 var m = require("mithril")
-var io = require("socket.io-client");
 var Session = require("../models/Session")
+var Socket = require("../models/Socket")
 
 module.exports = {
   oninit: function(vnode) {
-    this.socket = io();
+    this.socket = Socket;
 
     this.socket.on("session_ready", function(data) {
       Session.loadList()
     });
   },
 
+  onremove: function(vnode) {
+    // The connection is shared, only the handler goes with the component.
+    this.socket.off("session_ready");
+  },
+
   view: function() {
     return null
   }
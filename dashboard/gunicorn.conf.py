@@ -0,0 +1,6 @@
+def post_worker_init(worker):
+    # Background work runs in the server process only. The app is imported
+    # here, after the worker has loaded it and eventlet has patched the
+    # standard library, not when the arbiter reads this file.
+    from app import start_workers
+    start_workers(worker.wsgi)
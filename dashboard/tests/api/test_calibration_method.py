@@ -1,9 +1,12 @@
 import uuid
 
+import numpy as np
 import pytest
 
 from http import HTTPStatus as status
 
+from app.models.calibration import CalibrationMethod, _std_env
+from app.utils.expr import ExpressionCompiler, ExpressionParser
 from conftest import DB_IDS
 
 
@@ -83,6 +86,54 @@ def test_put_invalid_expression(client, auth, intermediate, expression):
     assert response.status_code == status.BAD_REQUEST
 
 
+def test_compile(app):
+    with app.app_context():
+        cm = CalibrationMethod.get(DB_IDS['calibration_method_triangle'])
+        inputs = {'arm1': 98.9, 'arm2': 202.8, 'max': 230}
+        calibrate = cm.compile(inputs, 65, 160)
+        samples = np.arange(0, 4096, 16)
+        travel = calibrate(samples)
+
+        env = dict(_std_env, MAX_STROKE=65, MAX_TRAVEL=160, **inputs)
+        for k, v in cm.properties['intermediates'].items():
+            env[k] = ExpressionParser(env).evaluate(v)
+        for sample, value in zip(samples, travel):
+            env['sample'] = float(sample)
+            expected = ExpressionParser(env).evaluate(
+                cm.properties['expression'])
+            assert value == pytest.approx(expected)
+
+
+@pytest.mark.parametrize(
+    'expression',
+    ('__import__("os")', 'sample.__class__', 'xxxx(sample)', 'sample**2')
+)
+def test_compile_rejects(expression):
+    compiler = ExpressionCompiler(dict(_std_env))
+    with pytest.raises((NameError, SyntaxError)):
+        compiler.compile(expression, ('sample',))
+
+
+def test_program_cache(app, client, auth):
+    auth.login()
+
+    id = DB_IDS['calibration_method_triangle']
+    before = client.get('/api/calibration-method/program-cache').json
+    with app.app_context():
+        cm = CalibrationMethod.get(id)
+        cm.compile({'arm1': 98.9, 'arm2': 202.8, 'max': 230}, 65, 160)
+        cm.compile({'arm1': 90.0, 'arm2': 200.0, 'max': 230}, 65, 160)
+        cm_json = client.get(f'/api/calibration-method/{id}').json
+    after = client.get('/api/calibration-method/program-cache').json
+    assert after['hits'] - before['hits'] >= 1
+    assert after['entries'] >= 1
+
+    response = client.put('/api/calibration-method', json=cm_json)
+    assert response.status_code == status.CREATED
+    response = client.get('/api/calibration-method/program-cache')
+    assert response.json['invalidations'] > after['invalidations']
+
+
 def test_delete(client, auth):
     auth.login()
 
@@ -0,0 +1,140 @@
+import base64
+import time
+import uuid
+
+import pytest
+
+from http import HTTPStatus as status
+
+from app.extensions import db
+from app.models.reprocess_job import ReprocessJob
+from app.models.session import Session
+from app.models.session_html import SessionHtml
+from conftest import DB_IDS, AuthActions, sst_data
+
+
+def _import_session(client) -> uuid.UUID:
+    s_json = dict(
+        name="test_session",
+        setup=DB_IDS['setup'],
+        data=base64.b64encode(sst_data).decode('utf-8'),
+    )
+    response = client.put('/api/session', json=s_json)
+    return uuid.UUID(response.json['id'])
+
+
+def _wait(client, id: str) -> dict:
+    for _ in range(600):
+        job = client.get(f'/api/reprocess/{id}').json
+        if job['state'] in (ReprocessJob.DONE, ReprocessJob.FAILED):
+            return job
+        time.sleep(0.1)
+    pytest.fail("reprocessing did not finish")
+
+
+def test_reprocess(app, client, auth):
+    auth.login()
+
+    id = _import_session(client)
+    with app.app_context():
+        before = Session.get(id).data
+
+    c_json = dict(
+        id=DB_IDS['front_calibration'],
+        name='front_calibration',
+        method_id=DB_IDS['calibration_method_isosceles'],
+        inputs={'arm': 134.9375, 'max': 220},
+    )
+    # Changing a calibration reprocesses the sessions recorded with it.
+    response = client.put('/api/calibration', json=c_json)
+    assert response.status_code == status.CREATED
+    jobs = client.get('/api/reprocess').json
+    assert len(jobs) == 1
+    assert jobs[0]['entity'] == 'calibration'
+    assert jobs[0]['entity_id'] == str(DB_IDS['front_calibration'])
+    assert jobs[0]['total'] == 1
+    # The sessions of the test data have no raw recording.
+    assert jobs[0]['skipped'] == 2
+
+    job = _wait(client, jobs[0]['id'])
+    assert job['state'] == ReprocessJob.DONE
+    assert job['done'] == 1 and job['failed'] == 0
+    with app.app_context():
+        assert Session.get(id).data != before
+        assert db.session.get(SessionHtml, id) is None
+
+
+def test_reprocess_unchanged(client, auth):
+    auth.login()
+
+    _import_session(client)
+    # Properties that are not used for processing don't start a job, and
+    # neither do new entities.
+    c_json = dict(
+        id=DB_IDS['front_calibration'],
+        name='renamed_calibration',
+        method_id=DB_IDS['calibration_method_isosceles'],
+        inputs={'arm': 134.9375, 'max': 234.15625},
+    )
+    assert client.put('/api/calibration',
+                      json=c_json).status_code == status.CREATED
+    del c_json['id']
+    assert client.put('/api/calibration',
+                      json=c_json).status_code == status.CREATED
+    assert client.get('/api/reprocess').json == []
+
+
+def test_reprocess_thread(threaded_app):
+    client = threaded_app.test_client()
+    AuthActions(client).login()
+
+    id = _import_session(client)
+    with threaded_app.app_context():
+        before = Session.get(id).data
+
+    c_json = dict(
+        id=DB_IDS['rear_calibration'],
+        name='rear_calibration',
+        method_id=DB_IDS['calibration_method_triangle'],
+        inputs={'arm1': 98.9, 'arm2': 202.8, 'max': 220},
+    )
+    response = client.put('/api/calibration', json=c_json)
+    assert response.status_code == status.CREATED
+    jobs = client.get('/api/reprocess').json
+    assert len(jobs) == 1
+
+    job = _wait(client, jobs[0]['id'])
+    assert job['state'] == ReprocessJob.DONE
+    assert job['done'] == 1 and job['failed'] == 0
+    with threaded_app.app_context():
+        assert Session.get(id).data != before
+
+
+@pytest.mark.parametrize(
+    ('entity', 'id', 'code'),
+    (
+        ('linkage', str(DB_IDS['linkage']), status.CREATED),
+        ('calibration_method', str(DB_IDS['calibration_method_triangle']),
+         status.CREATED),
+        ('linkage', str(DB_IDS['nonexistent']), status.NOT_FOUND),
+        ('setup', str(DB_IDS['setup']), status.BAD_REQUEST),
+        ('linkage', 'xxxx', status.BAD_REQUEST),
+    )
+)
+def test_put(client, auth, entity, id, code):
+    auth.login()
+
+    response = client.put('/api/reprocess', json=dict(entity=entity, id=id))
+    assert response.status_code == code
+    if code == status.CREATED:
+        # Sessions without their raw recording are not reprocessed.
+        assert response.json['total'] == 0
+        assert response.json['skipped'] == 2
+        assert _wait(client, response.json['id'])['state'] == 'done'
+
+
+def test_get_nonexistent(client, auth):
+    auth.login()
+
+    response = client.get(f'/api/reprocess/{DB_IDS["nonexistent"]}')
+    assert response.status_code == status.NOT_FOUND
@@ -1,15 +1,28 @@
 import base64
 import hashlib
+import json
 import uuid
 
+import msgpack
+import numpy as np
 import pytest
 
-from flask import current_app
 from http import HTTPStatus as status
 
-from app.extensions import db
+import app.api.session.filtering as filtering
+
+from app.extensions import db, sio
+from app.models.cache_job import CacheJob
 from app.models.session import Session
-from conftest import DB_IDS, session_data, track_gpx
+from app.models.session_histogram_index import SessionHistogramIndex
+from app.telemetry.psst import (
+    PSST_VERSION_1,
+    PSST_VERSION_2,
+    psst_version,
+    telemetry_from_psst
+)
+from app.utils.stats_backfill import backfill_session_stats
+from conftest import DB_IDS, session_data, sst_data, track_gpx
 
 
 def test_get_all(client):
@@ -18,6 +31,39 @@ def test_get_all(client):
     assert str(DB_IDS['session']) in ids
 
 
+def test_get_all_paginated(client):
+    ids = []
+    cursor = ''
+    while cursor is not None:
+        response = client.get(f'/api/session?limit=1&cursor={cursor}')
+        assert response.status_code == status.OK
+        assert len(response.json) == 1
+        ids += [c['id'] for c in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+    all_ids = [c['id'] for c in client.get('/api/session').json]
+    assert ids == all_ids
+
+
+def test_get_all_fields(client):
+    response = client.get('/api/session?fields=id,name')
+    assert response.status_code == status.OK
+    assert all(set(c) == {'id', 'name'} for c in response.json)
+
+
+@pytest.mark.parametrize(
+    ('query'),
+    (
+        ('fields=id,data'),
+        ('limit=0'),
+        ('limit=x'),
+        ('cursor=xxxx'),
+    )
+)
+def test_get_all_invalid_input(client, query):
+    response = client.get(f'/api/session?{query}')
+    assert response.status_code == status.BAD_REQUEST
+
+
 def test_get_incomplete(app, client):
     with app.app_context():
         session = Session.get(DB_IDS['session'])
@@ -27,6 +73,13 @@ def test_get_incomplete(app, client):
     assert str(DB_IDS['session']) in response.json
 
 
+def test_data_lazy(app):
+    with app.app_context():
+        session = Session.get(DB_IDS['session'])
+        assert 'payload' not in session.__dict__
+        assert session.data == session_data
+
+
 def test_get_psst(client):
     id = str(DB_IDS['session'])
     response = client.get(f'/api/session/{id}/psst')
@@ -34,6 +87,33 @@ def test_get_psst(client):
     assert hashlib.sha256(response.data).digest().hex() == session_data_hash
 
 
+def test_get_psst_version(app, client, auth):
+    id = str(DB_IDS['session'])
+    response = client.get(f'/api/session/{id}/psst?version=2')
+    assert response.status_code == status.OK
+    assert psst_version(response.data) == PSST_VERSION_2
+
+    response = client.get(f'/api/session/{id}/psst?version=3')
+    assert response.status_code == status.BAD_REQUEST
+
+    # Payloads are stored as the configured version, but sent as version 1
+    # unless asked otherwise.
+    app.config['PSST_VERSION'] = PSST_VERSION_2
+    auth.login()
+    client.patch(f'/api/session/{id}/psst', data=session_data)
+    with app.app_context():
+        session = Session.get(DB_IDS['session'])
+        assert psst_version(session.data) == PSST_VERSION_2
+    response = client.get(f'/api/session/{id}/psst')
+    assert psst_version(response.data) == PSST_VERSION_1
+    assert telemetry_from_psst(response.data).Name == \
+        telemetry_from_psst(session_data).Name
+
+    for url in (f'/api/session/{id}/filter?start=10&end=13',
+                f'/api/session/{id}/trace?start=10&end=13&width=50'):
+        assert client.get(url).status_code == status.OK
+
+
 def test_get_psst_nonexistent(client):
     response = client.get(f'/api/session/{DB_IDS["nonexistent"]}/psst')
     assert response.status_code == status.NOT_FOUND
@@ -78,6 +158,144 @@ def test_filter(client):
             'e68e4aec59b75367578bd7045e43d2914f0b5152b7a09794ee4f87de08d16124')
 
 
+def test_filter_msgpack(client):
+    def ext_hook(code, data):
+        assert code == 2
+        return np.frombuffer(data, dtype='<f4')
+
+    id = str(DB_IDS['session'])
+    url = f'/api/session/{id}/filter?start=10&end=13'
+    expected = client.get(url).json
+    response = client.get(url, headers={'Accept': 'application/msgpack'})
+    assert response.status_code == status.OK
+    assert response.mimetype == 'application/msgpack'
+    assert 'Accept' in response.vary
+    data = msgpack.unpackb(response.data, ext_hook=ext_hook)
+    for side in ('front', 'rear'):
+        fft = data[side]['fft']['data']
+        expected_fft = expected[side]['fft']['data']
+        assert fft['spectrum'].dtype == np.float32
+        assert np.allclose(fft['freqs'], expected_fft['freqs'])
+        vhist = data[side]['vhist']
+        assert np.allclose(vhist['data']['y'],
+                           expected[side]['vhist']['data']['y'])
+        assert vhist['avgr_text'] == expected[side]['vhist']['avgr_text']
+    assert data['balance']['compression']['range_end'] == \
+        expected['balance']['compression']['range_end']
+
+
+def test_filter_components(client):
+    id = str(DB_IDS['session'])
+    url = f'/api/session/{id}/filter?start=10&end=13'
+    full = client.get(url).json
+
+    response = client.get(f'{url}&components=thist,fft&side=rear')
+    assert response.status_code == status.OK
+    assert response.json['front'] is None
+    assert 'balance' not in response.json
+    assert set(response.json['rear']) == {'thist', 'fft'}
+    assert response.json['rear']['thist'] == full['rear']['thist']
+
+    response = client.get(f'{url}&components=balance')
+    assert response.json['balance'] == full['balance']
+
+
+@pytest.mark.parametrize('query', (
+    'components=thist,xxx',
+    'components=,',
+    'side=both',
+))
+def test_filter_components_invalid(client, query):
+    id = str(DB_IDS['session'])
+    response = client.get(f'/api/session/{id}/filter?{query}')
+    assert response.status_code == status.BAD_REQUEST
+
+
+def test_filter_etag(client, monkeypatch):
+    id = str(DB_IDS['session'])
+    url = f'/api/session/{id}/filter?start=10&end=13'
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert response.cache_control.no_cache
+
+    # Results are served from the cache, for the same samples too.
+    def fail(*args):
+        raise AssertionError("filter results were computed again")
+    monkeypatch.setattr(filtering, 'filter_data', fail)
+    response = client.get(url.replace('start=10', 'start=10.0000001'))
+    assert response.status_code == status.OK
+    assert response.headers['ETag'] == etag
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == status.NOT_MODIFIED
+    assert response.data == b''
+
+    response = client.get(url, headers={'If-None-Match': '"xxxx"'})
+    assert response.status_code == status.OK
+
+
+def test_filter_socket(app, client):
+    id = str(DB_IDS['session'])
+    sio_client = sio.test_client(app, flask_test_client=client)
+    sio_client.emit('filter', dict(id=id, start=10, end=13, seq=1))
+    received = sio_client.get_received()
+    assert [r['name'] for r in received] == ['filter_result']
+    result = received[0]['args'][0]
+    assert result['id'] == id
+    assert result['seq'] == 1
+    expected = client.get(f'/api/session/{id}/filter?start=10&end=13').json
+    assert json.loads(result['data']) == expected
+
+    sio_client.emit('filter', dict(id=id, components=['fft'], seq=2))
+    received = sio_client.get_received()
+    assert [r['name'] for r in received] == ['filter_error']
+    assert received[0]['args'][0]['id'] == id
+    assert received[0]['args'][0]['seq'] == 2
+
+
+def test_filter_socket_latest_wins(app, client, monkeypatch):
+    id = str(DB_IDS['session'])
+    sio_client = sio.test_client(app, flask_test_client=client)
+
+    # A newer request arrives while the first one yields at a checkpoint.
+    sleep = sio.sleep
+    def newer_request(seconds):
+        monkeypatch.setattr(sio, 'sleep', sleep)
+        sio_client.emit('filter', dict(id=id, start=2, end=5, seq=2))
+    monkeypatch.setattr(sio, 'sleep', newer_request)
+
+    sio_client.emit('filter', dict(id=id, start=10, end=13, seq=1))
+    received = sio_client.get_received()
+    assert [r['args'][0]['seq'] for r in received] == [2]
+
+
+def test_filter_batch(client):
+    id = str(DB_IDS['session'])
+    ranges = [[10, 13], [2, 5.5], [13, 0]]
+    response = client.post(f'/api/session/{id}/filter?components=thist,fft',
+                           json=dict(ranges=ranges))
+    assert response.status_code == status.OK
+    assert len(response.json) == len(ranges)
+    for (start, end), result in zip(ranges, response.json):
+        expected = client.get(f'/api/session/{id}/filter?start={start}'
+                              f'&end={end}&components=thist,fft').json
+        assert result == expected
+
+
+@pytest.mark.parametrize('body', (
+    None,
+    dict(),
+    dict(ranges=[]),
+    dict(ranges=[[1, 2, 3]]),
+    dict(ranges=[['a', 'b']]),
+    dict(ranges=[[0, 1]] * 65),
+))
+def test_filter_batch_invalid_input(client, body):
+    id = str(DB_IDS['session'])
+    response = client.post(f'/api/session/{id}/filter', json=body)
+    assert response.status_code == status.BAD_REQUEST
+
+
 @pytest.mark.parametrize(
     ('start', 'end'),
     (
@@ -94,6 +312,56 @@ def test_filter_invalid_input(client, start, end):
             '83a1412a9a8c0f7b97b15121c6c33eedca0e89babe2312d65739d79c7c23d9c7')
 
 
+def test_filter_histogram_index(app, client, auth):
+    id = DB_IDS['session']
+    url = f'/api/session/{id}/filter?start=10&end=13'
+
+    def stored_index():
+        with app.app_context():
+            return db.session.get(SessionHistogramIndex, id)
+
+    # Reads build the index in memory, it is stored along with the payload.
+    expected = client.get(url).json
+    assert stored_index() is None
+    auth.login()
+    client.patch(f'/api/session/{id}/psst', data=session_data)
+    assert stored_index() is not None
+    assert client.get(url).json == expected
+
+
+def test_telemetry_cache(client, auth):
+    id = DB_IDS['session']
+    auth.login()
+    before = client.get('/api/session/telemetry-cache').json
+    client.get(f'/api/session/{id}/filter?start=10&end=13')
+    client.get(f'/api/session/{id}/filter?start=11&end=14')
+    after = client.get('/api/session/telemetry-cache').json
+    assert after['hits'] - before['hits'] >= 1
+    assert after['entries'] >= 1
+    assert 0 < after['size'] <= after['max_size']
+
+    client.patch(f'/api/session/{id}/psst', data=session_data)
+    response = client.get('/api/session/telemetry-cache')
+    assert response.json['invalidations'] > after['invalidations']
+
+
+def test_trace(client):
+    id = DB_IDS['session']
+    response = client.get(f'/api/session/{id}/trace?start=10&end=13&width=50')
+    assert response.status_code == status.OK
+    for trace in (response.json['travel'], response.json['velocity']):
+        assert len(trace['t']) == len(trace['f']) == len(trace['r'])
+        assert 0 < len(trace['t']) <= 4 * 50 * 2
+        assert 10 <= trace['t'][0] and trace['t'][-1] < 13
+        assert trace['t'] == sorted(trace['t'])
+
+
+def test_trace_invalid_width(client):
+    id = DB_IDS['session']
+    response = client.get(f'/api/session/{id}/trace?start=10&end=13')
+    assert response.status_code == status.BAD_REQUEST
+
+
 def test_delete(client, auth):
     auth.login()
 
@@ -102,57 +370,107 @@ def test_delete(client, auth):
     assert response.status_code == status.NOT_FOUND
 
 
-def test_put(app, client, auth, requests_mock):
+def test_put(app, client, auth):
     auth.login()
 
-    with app.app_context():
-        api_server = current_app.config['GOSST_HTTP_API']
-    url = f'{api_server}/api/internal/session'
-    id = str(uuid.uuid4())
-    requests_mock.put(url, json={'id': id}, status_code=status.CREATED)
-
-    response = client.put('/api/session', json={"id": "dummy"})
+    s_json = dict(
+        name="test_session",
+        description="session description",
+        setup=DB_IDS['setup'],
+        data=base64.b64encode(sst_data).decode('utf-8'),
+    )
+    response = client.put('/api/session', json=s_json)
     assert response.status_code == status.CREATED
-    assert response.json['id'] == id
+
+    with app.app_context():
+        session = Session.get(uuid.UUID(response.json['id']))
+        assert session.timestamp == 1683457678
+        assert session.front_present and session.rear_present
+        assert session.record_count == (len(sst_data) - 16) // 4
 
 
-def test_put_invalid_data(app, client, auth, requests_mock):
+def test_stats(app, client, auth):
     auth.login()
 
-    with app.app_context():
-        api_server = current_app.config['GOSST_HTTP_API']
-    url = f'{api_server}/api/internal/session'
-    id = str(uuid.uuid4())
-    requests_mock.put(url, json={'id': id}, status_code=status.BAD_REQUEST)
+    s_json = dict(
+        name="test_session",
+        setup=DB_IDS['setup'],
+        data=base64.b64encode(sst_data).decode('utf-8'),
+    )
+    id = client.put('/api/session', json=s_json).json['id']
+    response = client.get(f'/api/session/stats?id={id}')
+    assert response.status_code == status.OK
+    assert [s['session_id'] for s in response.json] == [id]
+    stats = response.json[0]
+    assert 0 < stats['front_travel_avg'] < stats['front_travel_max']
+    assert stats['rear_velocity_max_rebound'] < 0
+    assert sum(stats[f'front_{k}'] for k in ('hsr', 'lsr', 'lsc', 'hsc')) == (
+        pytest.approx(100))
+
 
-    response = client.put('/api/session', json={"id": "dummy"})
+def test_stats_backfill(app, client):
+    id = str(DB_IDS['session'])
+    assert client.get(f'/api/session/stats?id={id}').json == []
+    assert backfill_session_stats(app) >= 1
+    response = client.get(f'/api/session/stats?id={id}')
+    assert response.json[0]['session_id'] == id
+
+
+def test_stats_invalid_id(client):
+    response = client.get('/api/session/stats?id=xxxx')
     assert response.status_code == status.BAD_REQUEST
 
 
-def test_put_normalized(app, client, auth, requests_mock):
+@pytest.mark.parametrize(
+    ('setup', 'data'),
+    (
+        (DB_IDS['setup'], b'test'),
+        (DB_IDS['nonexistent'], sst_data),
+    )
+)
+def test_put_invalid_data(client, auth, setup, data):
     auth.login()
 
-    with app.app_context():
-        api_server = current_app.config['GOSST_HTTP_API']
-    url = f'{api_server}/api/internal/session/normalized'
-    id = str(uuid.uuid4())
-    requests_mock.put(url, json={'id': id}, status_code=status.CREATED)
-
-    response = client.put('/api/session/normalized', json={"id": "dummy"})
-    assert response.status_code == status.CREATED
-    assert response.json['id'] == id
+    s_json = dict(
+        name="test_session",
+        setup=setup,
+        data=base64.b64encode(data).decode('utf-8'),
+    )
+    response = client.put('/api/session', json=s_json)
+    assert response.status_code == status.BAD_REQUEST
 
 
-def test_put_normalized_invalid_data(app, client, auth, requests_mock):
+def test_put_normalized(app, client, auth):
     auth.login()
 
+    samples = [(i % 200) / 2 for i in range(2000)]
+    s_json = dict(
+        name="normalized_session",
+        timestamp=1683457678,
+        sample_rate=100,
+        linkage=DB_IDS['linkage'],
+        data='Fork;Shock\n' + '\n'.join(f'{v};{v}' for v in samples),
+    )
+    response = client.put('/api/session/normalized', json=s_json)
+    assert response.status_code == status.CREATED
+
     with app.app_context():
-        api_server = current_app.config['GOSST_HTTP_API']
-    url = f'{api_server}/api/internal/session'
-    id = str(uuid.uuid4())
-    requests_mock.put(url, json={'id': id}, status_code=status.BAD_REQUEST)
+        session = Session.get(uuid.UUID(response.json['id']))
+        assert session.sample_rate == 100
+        assert session.record_count == len(samples)
 
-    response = client.put('/api/session', json={"id": "dummy"})
+
+def test_put_normalized_invalid_data(client, auth):
+    auth.login()
+
+    s_json = dict(
+        name="normalized_session",
+        timestamp=1683457678,
+        sample_rate=100,
+        linkage=DB_IDS['linkage'],
+        data='Time;Travel\n0;1\n',
+    )
+    response = client.put('/api/session/normalized', json=s_json)
     assert response.status_code == status.BAD_REQUEST
 
 
@@ -233,6 +551,16 @@ def test_generate_bokeh(client, id, message):
             message in response.data)
 
 
+def test_generate_bokeh_deduplicated(app, client):
+    id = DB_IDS['session']
+    client.put(f'/api/session/{id}/bokeh')
+    client.put(f'/api/session/{id}/bokeh')
+    with app.app_context():
+        jobs = db.session.execute(db.select(CacheJob).filter_by(
+            session_id=id)).scalars().all()
+        assert len(jobs) == 1
+
+
 @pytest.mark.parametrize(
     ('id', 'status'),
     (
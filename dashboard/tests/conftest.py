@@ -52,6 +52,9 @@ with open(os.path.join(os.path.dirname(__file__), 'track.gpx'), 'rb') as f:
 with open(os.path.join(os.path.dirname(__file__), 'test.psst'), 'rb') as f:
     session_data = f.read()
 
+with open(os.path.join(os.path.dirname(__file__), 'test.SST'), 'rb') as f:
+    sst_data = f.read()
+
 with open(os.path.join(os.path.dirname(__file__), 'session.js'), 'rb') as f:
     session_script = f.read().decode('utf8')
 
@@ -140,14 +143,11 @@ def add_test_data():
     db.session.commit()
 
 
-@pytest.fixture
-def app():
+def _create_app(tmp_dir: str, db_uri: str, **config):
     global db_created_timestamp
 
-    tmp_dir = tempfile.mkdtemp()
     priv_key = f'{tmp_dir}/private_key.pem'
     pub_key = f'{tmp_dir}/public_key.pem'
-    db_uri = 'sqlite://'
 
     _generate_rsa_keys(priv_key, pub_key)
 
@@ -157,6 +157,8 @@ def app():
         'JWT_PRIVATE_KEY_FILE': priv_key,
         'JWT_PUBLIC_KEY_FILE': pub_key,
         'JWT_CSRF_METHODS': [],
+        'CACHE_GENERATOR_WORKERS': 0,
+        **config,
     })
 
     with app.app_context():
@@ -171,8 +173,23 @@ def app():
 
         db_created_timestamp = int(datetime.now().timestamp())
 
-    yield app
+    return app
 
+
+@pytest.fixture
+def app():
+    tmp_dir = tempfile.mkdtemp()
+    yield _create_app(tmp_dir, 'sqlite://')
+    shutil.rmtree(tmp_dir)
+
+
+@pytest.fixture
+def threaded_app():
+    # Background jobs of test apps run in the request, because threads would
+    # share the single connection of the in-memory database. This one runs
+    # them in threads, like a server does, with a database file.
+    tmp_dir = tempfile.mkdtemp()
+    yield _create_app(tmp_dir, f'sqlite:///{tmp_dir}/sst.db', TESTING=False)
     shutil.rmtree(tmp_dir)
 
 
@@ -0,0 +1,22 @@
+#!/bin/sh
+# Regenerates the gosst reference output the processing tests compare the
+# dashboard's pipeline to. The inputs are the linkage and calibrations of
+# the test setup in conftest.py, the recordings are tests/test.SST and the
+# samples in test_utils/sample_sst. Needs Go and network access for the
+# gosst modules.
+
+set -e
+
+here=$(cd "$(dirname "$0")" && pwd)
+root="$here/../../.."
+
+(cd "$root/gosst" && go build -o "$here/gosst-file" ./cmd/gosst-file)
+for sst in "$here/../test.SST" "$root"/test_utils/sample_sst/*.SST; do
+	name=$(basename "$sst" .SST)
+	"$here/gosst-file" \
+		--telemetry "$sst" \
+		--linkage "$here/linkage.json" \
+		--calibration "$here/calibrations.json" \
+		--output "$here/$name.PSST"
+done
+rm "$here/gosst-file"
@@ -0,0 +1,36 @@
+from app.extensions import db
+from app.models.cache_job import CacheJob
+from app.models.session_html import SessionHtml
+from app.utils.cache_generator import (
+    DEFAULT_TIMEOUT,
+    _claim_job,
+    _finish_job,
+    _generate,
+    enqueue_cache_job
+)
+from conftest import DB_IDS
+
+
+def test_generate(app):
+    id = DB_IDS['session']
+    with app.app_context():
+        enqueue_cache_job(id)
+        assert _claim_job() == id
+        _generate(app, id, DEFAULT_TIMEOUT)
+        _finish_job(app, id)
+        assert db.session.get(CacheJob, id).state == CacheJob.DONE
+        assert db.session.get(SessionHtml, id) is not None
+        assert _claim_job() is None
+
+
+def test_retry(app):
+    id = DB_IDS['session']
+    with app.app_context():
+        enqueue_cache_job(id)
+        assert _claim_job() == id
+        _finish_job(app, id, "failed")
+        job = db.session.get(CacheJob, id)
+        assert job.state == CacheJob.PENDING
+        assert job.error == "failed"
+        # Failed jobs are retried later, not right away.
+        assert _claim_job() is None
@@ -0,0 +1,71 @@
+import hashlib
+import os
+
+from http import HTTPStatus as status
+
+from app.extensions import db
+from app.models.session import Session
+from app.models.session_data import SessionData
+from app.utils.file_store import ContentStore, psst_store
+from conftest import DB_IDS, session_data
+
+
+def _age(store: ContentStore, digest: str):
+    path = store.path(digest)
+    os.utime(path, (0, 0))
+
+
+def test_put_get(tmp_path):
+    store = ContentStore('TEST_STORE_DIR')
+    store.root = str(tmp_path)
+    digest = store.put(b'test')
+    assert digest == hashlib.sha256(b'test').hexdigest()
+    assert store.put(b'test') == digest
+    assert store.digests() == [digest]
+    assert store.get(digest)[:] == b'test'
+    assert store.get(store.put(b'')) == b''
+
+
+def test_collect(tmp_path):
+    store = ContentStore('TEST_STORE_DIR')
+    store.root = str(tmp_path)
+    kept, removed, young = store.put(b'a'), store.put(b'b'), store.put(b'c')
+    _age(store, kept)
+    _age(store, removed)
+    assert store.collect({kept}) == 1
+    assert sorted(store.digests()) == sorted([kept, young])
+
+
+def test_migrate(app, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(psst_store, 'root', str(tmp_path))
+    id = DB_IDS['session']
+    with app.app_context():
+        assert SessionData.migrate() >= 1
+        payload = db.session.get(SessionData, id)
+        assert payload.data is None
+        assert Session.get(id).data[:] == session_data
+
+    # Both sessions have the same payload, it is stored once.
+    digest = hashlib.sha256(session_data).hexdigest()
+    assert psst_store.digests() == [digest]
+    response = client.get(f'/api/session/{id}/psst')
+    assert response.data == session_data
+
+    with app.app_context():
+        assert SessionData.migrate(to_store=False) >= 1
+        assert db.session.get(SessionData, id).data == session_data
+        _age(psst_store, digest)
+        assert SessionData.collect_garbage() == 1
+    assert psst_store.digests() == []
+
+
+def test_write(app, client, auth, tmp_path, monkeypatch):
+    monkeypatch.setattr(psst_store, 'root', str(tmp_path))
+    id = DB_IDS['session']
+    auth.login()
+    response = client.patch(f'/api/session/{id}/psst', data=session_data)
+    assert response.status_code == status.NO_CONTENT
+    with app.app_context():
+        payload = db.session.get(SessionData, id)
+        assert payload.digest == hashlib.sha256(session_data).hexdigest()
+        assert payload.data is None
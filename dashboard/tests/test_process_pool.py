@@ -0,0 +1,46 @@
+import os
+import time
+
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from app.utils.process_pool import ProcessPool
+
+
+def _square(x):
+    return x * x
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def _crash():
+    os._exit(1)
+
+
+@pytest.fixture
+def pool():
+    pool = ProcessPool()
+    pool.workers = 1
+    pool.max_tasks = 2
+    yield pool
+    pool.shutdown()
+
+
+def test_run(pool):
+    # More tasks than a worker runs before it is replaced.
+    assert [pool.run(_square, x) for x in range(5)] == [0, 1, 4, 9, 16]
+
+
+def test_timeout(pool):
+    with pytest.raises(TimeoutError):
+        pool.run(_sleep, 60, timeout=1)
+    assert pool.run(_square, 3, timeout=60) == 9
+
+
+def test_crash(pool):
+    with pytest.raises(RuntimeError):
+        pool.run(_crash)
+    assert pool.run(_square, 3, timeout=60) == 9
@@ -0,0 +1,437 @@
+import bisect
+import glob
+import math
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from app.models.setup import Setup
+from app.telemetry.processing import (
+    process_recording,
+    raw_from_normalized,
+    raw_from_sst,
+    setup_data
+)
+from app.telemetry.psst import (
+    PSST_VERSION_1,
+    PSST_VERSION_2,
+    STROKE_TABLE_COLUMNS,
+    TelemetryView,
+    convert_psst,
+    psst_from_telemetry,
+    psst_version,
+    telemetry_from_psst
+)
+from conftest import DB_IDS, session_data
+
+
+# Some of the tests below compare the vectorized pipeline to a
+# straightforward port of gosst's ProcessRecording (including the
+# Savitzky-Golay implementation gosst uses), run on the first RECORDS records
+# of the sample recordings. That catches vectorization mistakes. Parity with
+# gosst itself is checked against its output in GOSST_DIR, which is created
+# by tests/gosst/generate.sh and committed along with the tests.
+RECORDS = 20000
+
+_tests_dir = os.path.dirname(__file__)
+SST_FILES = [os.path.join(_tests_dir, 'test.SST')] + sorted(glob.glob(
+    os.path.join(_tests_dir, '..', '..', 'test_utils', 'sample_sst', '*.SST')))
+GOSST_DIR = os.path.join(_tests_dir, 'gosst')
+
+
+def _gram_poly(i, m, k, s):
+    if k > 0:
+        return ((4 * k - 2) / (k * (2 * m - k + 1)) *
+                (i * _gram_poly(i, m, k - 1, s) +
+                 s * _gram_poly(i, m, k - 1, s - 1)) -
+                ((k - 1) * (2 * m + k)) / (k * (2 * m - k + 1)) *
+                _gram_poly(i, m, k - 2, s))
+    return 1 if k == 0 and s == 0 else 0
+
+
+def _gen_fact(a, b):
+    gf = 1
+    if a >= b:
+        for j in range(a - b + 1, a + 1):
+            gf *= j
+    return gf
+
+
+def _weight(i, t, m, n, s):
+    return sum((2 * k + 1) * (_gen_fact(2 * m, k) /
+                              _gen_fact(2 * m + k + 1, k + 1)) *
+               _gram_poly(i, m, k, 0) * _gram_poly(t, m, k, s)
+               for k in range(n + 1))
+
+
+def _savitzky_golay(ys, xs, window, derivative, polynomial):
+    half = window // 2
+    n = len(ys)
+    weights = np.array([[_weight(j, t, half, polynomial, derivative)
+                         for j in range(-half, half + 1)]
+                        for t in range(-half, half + 1)])
+
+    def hs(center):
+        d = [xs[i + 1] - xs[i] for i in range(center - half, center + half)
+             if 0 <= i < n - 1]
+        return (sum(d) / len(d)) ** derivative
+
+    ans = [0.0] * n
+    for i in range(half):
+        ans[half - i - 1] = (np.dot(weights[half - i - 1], ys[:window]) /
+                             hs(half - i - 1))
+        ans[n - half + i] = (np.dot(weights[half + i + 1], ys[n - window:]) /
+                             hs(n - half + i))
+    for i in range(window, n + 1):
+        ans[i - half - 1] = (np.dot(weights[half], ys[i - window:i]) /
+                             hs(i - half - 1))
+    return ans
+
+
+def _digitize(data, bins):
+    inds = []
+    for v in data:
+        i = bisect.bisect_left(bins, v)
+        if v >= bins[-1] or v != bins[i]:
+            i -= 1
+        inds.append(i)
+    return inds
+
+
+def _linspace(mn, mx, num):
+    step = (mx - mn) / (num - 1)
+    return [mn + step * i for i in range(num)]
+
+
+def _digitize_velocity(v, step):
+    mn = (math.floor(min(v) / step) - 0.5) * step
+    mx = (math.floor(max(v) / step) + 1.5) * step
+    bins = _linspace(mn, mx, int((mx - mn) / step) + 1)
+    return bins, _digitize(v, bins)
+
+
+def _sign(v):
+    if abs(v) <= 0.02:
+        return 0
+    return -1 if math.copysign(1, v) < 0 else 1
+
+
+def _new_stroke(start, end, duration, travel, velocity, max_travel):
+    length = travel[end] - travel[start]
+    v = velocity[start:end + 1]
+    bo = 0
+    i = start
+    while i <= end:
+        if travel[i] > max_travel - 3:
+            bo += 1
+            while i < len(travel) and travel[i] > max_travel - 3:
+                i += 1
+        i += 1
+    return dict(Start=start, End=end, length=length, duration=duration,
+                air=False, Stat=dict(
+                    SumTravel=sum(travel[start:end + 1]),
+                    MaxTravel=max(travel[start:end + 1]),
+                    SumVelocity=sum(v),
+                    MaxVelocity=min(v) if length < 0 else max(v),
+                    Bottomouts=bo,
+                    Count=end - start + 1))
+
+
+def _filter_strokes(velocity, travel, max_travel, rate):
+    strokes = []
+    i = 0
+    while i < len(velocity) - 1:
+        start = i
+        start_sign = _sign(velocity[i])
+        while i < len(velocity) - 1 and _sign(velocity[i + 1]) == start_sign:
+            i += 1
+        d = (i - start + 1) / rate
+        if (max(travel[start:i + 1]) < 5 and strokes and
+                strokes[-1]['Stat']['MaxTravel'] < 5):
+            strokes[-1]['End'] = i
+            strokes[-1]['duration'] += d
+        else:
+            strokes.append(_new_stroke(start, i, d, travel, velocity,
+                                       max_travel))
+        i += 1
+    return strokes
+
+
+def _suspension(travel, max_travel, rate):
+    t = [1.0 / rate * i for i in range(len(travel))]
+    tbins = _linspace(0, max_travel, 21)
+    dt = _digitize(travel, tbins)
+    v = _savitzky_golay(travel, t, 51, 1, 3)
+    vbins, dv = _digitize_velocity(v, 100.0)
+    vbins_fine, dv_fine = _digitize_velocity(v, 15.0)
+    strokes = _filter_strokes(v, travel, max_travel, rate)
+    compressions, rebounds, idlings = [], [], []
+    for i, s in enumerate(strokes):
+        if abs(s['length']) < 5 and s['duration'] >= 0.1:
+            if (0 < i < len(strokes) - 1 and s['Stat']['MaxTravel'] <= 5 and
+                    s['duration'] >= 0.2 and
+                    strokes[i + 1]['Stat']['MaxVelocity'] >= 500):
+                s['air'] = True
+            idlings.append(s)
+        elif s['length'] >= 5:
+            compressions.append(s)
+        elif s['length'] <= -5:
+            rebounds.append(s)
+    for s in compressions + rebounds:
+        s['DigitizedTravel'] = dt[s['Start']:s['End'] + 1]
+        s['DigitizedVelocity'] = dv[s['Start']:s['End'] + 1]
+        s['FineDigitizedVelocity'] = dv_fine[s['Start']:s['End'] + 1]
+    return dict(
+        Present=bool(compressions or rebounds),
+        Travel=travel, Velocity=v, TravelBins=tbins, VelocityBins=vbins,
+        FineVelocityBins=vbins_fine, Compressions=compressions,
+        Rebounds=rebounds, idlings=idlings)
+
+
+def _overlaps(a, b):
+    length = max(a['End'] - a['Start'], b['End'] - b['Start'])
+    s = max(a['Start'], b['Start'])
+    e = min(a['End'], b['End'])
+    return np.float32(e - s) >= np.float32(0.5) * np.float32(length)
+
+
+def _airtimes(front, rear, rate, max_front, max_rear):
+    airtimes = []
+    if front['Present'] and rear['Present']:
+        for f in front['idlings']:
+            if not f['air']:
+                continue
+            for r in rear['idlings']:
+                if r['air'] and _overlaps(f, r):
+                    f['air'] = r['air'] = False
+                    airtimes.append((min(f['Start'], r['Start']) / rate,
+                                     min(f['End'], r['End']) / rate))
+                    break
+        max_mean = (max_front + max_rear) / 2.0
+        for s in front['idlings'] + rear['idlings']:
+            if s['air']:
+                sl = slice(s['Start'], s['End'] + 1)
+                mean = (np.mean(front['Travel'][sl]) +
+                        np.mean(rear['Travel'][sl])) / 2
+                if mean <= max_mean * 0.04:
+                    airtimes.append((s['Start'] / rate, s['End'] / rate))
+    else:
+        for p in (front, rear):
+            if p['Present']:
+                airtimes = [(s['Start'] / rate, s['End'] / rate)
+                            for s in p['idlings'] if s['air']]
+                break
+    return airtimes
+
+
+def _reference(sst, linkage, front_calibrator, rear_calibrator):
+    _, _, sample_rate, _, _ = struct.unpack_from('<3sBHHq', sst)
+    records = [struct.unpack_from('<HH', sst, o)
+               for o in range(16, len(sst) - 3, 4)]
+    fork = [r[0] for r in records]
+    shock = [r[1] for r in records]
+
+    def fix(values):
+        error = 0
+        for v in values[1:]:
+            if v > values[0]:
+                if v - values[0] > 0x50:
+                    error = v
+                break
+        return [(v - error) & 0xffff for v in values]
+
+    coeff = math.sin(linkage.HeadAngle * math.pi / 180.0)
+    calibrated = front_calibrator.evaluate(np.array(fix(fork), dtype=float))
+    front_travel = [min(max(0, x * coeff), linkage.MaxFrontTravel)
+                    for x in calibrated.tolist()]
+    calibrated = rear_calibrator.evaluate(np.array(fix(shock), dtype=float))
+    c0, c1, c2, c3 = linkage.ShockWheelCoeffs.tolist()
+    rear_travel = [min(max(0, c0 + x * (c1 + x * (c2 + x * c3))),
+                       linkage.MaxRearTravel)
+                   for x in calibrated.tolist()]
+    front = _suspension(front_travel, linkage.MaxFrontTravel, sample_rate)
+    rear = _suspension(rear_travel, linkage.MaxRearTravel, sample_rate)
+    airtimes = _airtimes(front, rear, sample_rate, linkage.MaxFrontTravel,
+                         linkage.MaxRearTravel)
+    return front, rear, airtimes
+
+
+def _compare_strokes(table, strokes):
+    assert len(table) == len(strokes)
+    assert table.Start.tolist() == [s['Start'] for s in strokes]
+    assert table.End.tolist() == [s['End'] for s in strokes]
+    for k in ('Count', 'Bottomouts'):
+        assert getattr(table, k).tolist() == [s['Stat'][k] for s in strokes]
+    for k in ('SumTravel', 'MaxTravel', 'SumVelocity', 'MaxVelocity'):
+        assert getattr(table, k) == pytest.approx(
+            [s['Stat'][k] for s in strokes], rel=1e-9, abs=1e-9)
+    for k in ('DigitizedTravel', 'DigitizedVelocity',
+              'FineDigitizedVelocity'):
+        assert getattr(table, k).tolist() == sum((s[k] for s in strokes), [])
+
+
+@pytest.mark.parametrize('path', SST_FILES, ids=os.path.basename)
+def test_process_recording_parity(app, path):
+    with open(path, 'rb') as f:
+        sst = f.read(16 + 4 * RECORDS)
+    with app.app_context():
+        linkage, fc, rc = setup_data(Setup.get(DB_IDS['setup']))
+    front, rear, meta = raw_from_sst(sst)
+    telemetry = process_recording(front, rear, meta, linkage, fc, rc)
+    ref_front, ref_rear, ref_airtimes = _reference(sst, linkage, fc, rc)
+
+    for s, ref in ((telemetry.Front, ref_front), (telemetry.Rear, ref_rear)):
+        assert s.Present == ref['Present']
+        assert s.Travel.tolist() == ref['Travel']
+        assert s.Velocity == pytest.approx(ref['Velocity'], rel=1e-9,
+                                           abs=1e-6)
+        assert s.TravelBins.tolist() == ref['TravelBins']
+        assert s.VelocityBins == pytest.approx(ref['VelocityBins'])
+        assert s.FineVelocityBins == pytest.approx(ref['FineVelocityBins'])
+        _compare_strokes(s.Strokes.Compressions, ref['Compressions'])
+        _compare_strokes(s.Strokes.Rebounds, ref['Rebounds'])
+    assert [(a.Start, a.End) for a in telemetry.Airtimes] == ref_airtimes
+
+
+def _compare_stroke_tables(table, ref):
+    assert len(table) == len(ref)
+    for k in ('Start', 'End', 'Count', 'Bottomouts', 'DigitizedTravel',
+              'DigitizedVelocity', 'FineDigitizedVelocity'):
+        assert np.array_equal(getattr(table, k), getattr(ref, k)), k
+    for k in ('SumTravel', 'MaxTravel', 'SumVelocity', 'MaxVelocity'):
+        assert getattr(table, k) == pytest.approx(
+            getattr(ref, k), rel=1e-9, abs=1e-9), k
+
+
+@pytest.mark.parametrize('path', SST_FILES, ids=os.path.basename)
+def test_process_recording_gosst(app, path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    reference = os.path.join(GOSST_DIR, f'{name}.PSST')
+    if not os.path.exists(reference):
+        pytest.fail(f"no gosst output for {name}, "
+                    "run tests/gosst/generate.sh")
+    with open(reference, 'rb') as f:
+        ref = telemetry_from_psst(f.read())
+    with open(path, 'rb') as f:
+        sst = f.read()
+    with app.app_context():
+        setup = setup_data(Setup.get(DB_IDS['setup']))
+    front, rear, meta = raw_from_sst(sst)
+    telemetry = process_recording(front, rear, meta, *setup)
+
+    assert telemetry.SampleRate == ref.SampleRate
+    assert telemetry.Timestamp == ref.Timestamp
+    assert telemetry.Linkage.MaxFrontTravel == pytest.approx(
+        ref.Linkage.MaxFrontTravel)
+    assert telemetry.Linkage.MaxRearTravel == pytest.approx(
+        ref.Linkage.MaxRearTravel)
+    for s, r in ((telemetry.Front, ref.Front), (telemetry.Rear, ref.Rear)):
+        assert s.Present == r.Present
+        if not s.Present:
+            continue
+        assert s.Travel == pytest.approx(r.Travel, rel=1e-9, abs=1e-9)
+        assert s.Velocity == pytest.approx(r.Velocity, rel=1e-9, abs=1e-6)
+        assert s.TravelBins == pytest.approx(r.TravelBins)
+        assert s.VelocityBins == pytest.approx(r.VelocityBins)
+        assert s.FineVelocityBins == pytest.approx(r.FineVelocityBins)
+        _compare_stroke_tables(s.Strokes.Compressions,
+                               r.Strokes.Compressions)
+        _compare_stroke_tables(s.Strokes.Rebounds, r.Strokes.Rebounds)
+    assert telemetry.Airtimes == ref.Airtimes
+
+
+def test_psst_roundtrip(app):
+    with open(SST_FILES[0], 'rb') as f:
+        sst = f.read()
+    with app.app_context():
+        setup = setup_data(Setup.get(DB_IDS['setup']))
+    front, rear, meta = raw_from_sst(sst)
+    telemetry = process_recording(front, rear, meta, *setup)
+    decoded = telemetry_from_psst(psst_from_telemetry(telemetry))
+    assert decoded.Timestamp == meta.Timestamp
+    assert decoded.Front.Calibration == telemetry.Front.Calibration
+    assert decoded.Airtimes == telemetry.Airtimes
+    for s, d in ((telemetry.Front, decoded.Front),
+                 (telemetry.Rear, decoded.Rear)):
+        assert np.array_equal(s.Velocity, d.Velocity)
+        for k in ('Compressions', 'Rebounds'):
+            a, b = getattr(s.Strokes, k), getattr(d.Strokes, k)
+            assert np.array_equal(a.Offsets, b.Offsets)
+            assert np.array_equal(a.FineDigitizedVelocity,
+                                  b.FineDigitizedVelocity)
+
+
+def test_psst_v2(app):
+    with open(SST_FILES[0], 'rb') as f:
+        sst = f.read()
+    with app.app_context():
+        setup = setup_data(Setup.get(DB_IDS['setup']))
+    front, rear, meta = raw_from_sst(sst)
+    telemetry = process_recording(front, rear, meta, *setup)
+    v1 = psst_from_telemetry(telemetry)
+    v2 = convert_psst(v1, PSST_VERSION_2)
+    assert psst_version(v1) == PSST_VERSION_1
+    assert psst_version(v2) == PSST_VERSION_2
+    assert len(v2) < len(v1)
+
+    decoded = telemetry_from_psst(v2)
+    assert decoded.Timestamp == meta.Timestamp
+    assert decoded.Front.Calibration == telemetry.Front.Calibration
+    assert decoded.Airtimes == telemetry.Airtimes
+    for s, d in ((telemetry.Front, decoded.Front),
+                 (telemetry.Rear, decoded.Rear)):
+        assert d.Travel.dtype == d.Velocity.dtype == np.float32
+        assert np.array_equal(s.Velocity.astype(np.float32), d.Velocity)
+        assert np.array_equal(s.TravelBins, d.TravelBins)
+        for k in ('Compressions', 'Rebounds'):
+            a, b = getattr(s.Strokes, k), getattr(d.Strokes, k)
+            assert b.DigitizedTravel.dtype == np.uint8
+            for column in STROKE_TABLE_COLUMNS:
+                assert np.array_equal(getattr(a, column), getattr(b, column))
+
+    # Converting back keeps the float32 values.
+    decoded = telemetry_from_psst(convert_psst(v2, PSST_VERSION_1))
+    assert np.array_equal(decoded.Rear.Travel,
+                          telemetry.Rear.Travel.astype(np.float32))
+
+
+@pytest.mark.parametrize('version', (PSST_VERSION_1, PSST_VERSION_2))
+def test_telemetry_view(version):
+    data = convert_psst(session_data, version)
+    telemetry = telemetry_from_psst(data)
+    view = TelemetryView(data)
+    assert view.Name == telemetry.Name
+    assert view.SampleRate == telemetry.SampleRate
+    assert np.array_equal(view.Rear.Travel, telemetry.Rear.Travel)
+    strokes = view.Front.Strokes.Compressions
+    for column in STROKE_TABLE_COLUMNS:
+        assert np.array_equal(getattr(strokes, column),
+                              getattr(telemetry.Front.Strokes.Compressions,
+                                      column))
+    # Only the sections that were accessed are decoded.
+    assert set(view.decoded()) == {'Name', 'SampleRate', 'Front', 'Rear'}
+    assert set(view.Front.decoded()) == {'Strokes'}
+    assert view.Airtimes == telemetry.Airtimes
+    assert np.array_equal(view.Linkage.LeverageRatio,
+                          telemetry.Linkage.LeverageRatio)
+
+
+@pytest.mark.parametrize(
+    ('data', 'front', 'rear'),
+    (
+        ('Fork;Shock\n0.5;0.25\n1;0\n', [0.5, 1], [0.25, 0]),
+        ('Time;Shock\n0;50\n1;25\n', None, [0.5, 0.25]),
+    )
+)
+def test_raw_from_normalized(data, front, rear):
+    f, r = raw_from_normalized(data)
+    assert (f if f is None else f.tolist()) == front
+    assert (r if r is None else r.tolist()) == rear
+
+
+@pytest.mark.parametrize('data', (b'', b'XST' + bytes(13), b'SST' + bytes(13)))
+def test_raw_from_sst_invalid(data):
+    with pytest.raises(ValueError):
+        raw_from_sst(data)
@@ -0,0 +1,26 @@
+import msgpack
+import pytest
+
+from app.telemetry.psst import telemetry_from_psst
+from conftest import session_data
+
+
+def _with_method_id(method_id) -> bytes:
+    d = msgpack.unpackb(session_data, strict_map_key=False)
+    d['Front']['Calibration']['MethodId'] = method_id
+    return msgpack.packb(d)
+
+
+def test_psst_missing_method_id():
+    telemetry = telemetry_from_psst(_with_method_id(None))
+    assert telemetry.Front.Calibration.MethodId is None
+
+
+@pytest.mark.parametrize('method_id', (
+    msgpack.ExtType(1, b'xxxx'),
+    msgpack.ExtType(1, b''),
+    42,
+))
+def test_psst_invalid_method_id(method_id):
+    with pytest.raises(ValueError):
+        telemetry_from_psst(_with_method_id(method_id))